@@ -0,0 +1,133 @@
+"""
+In-memory directory of user and partner accounts.
+
+Hash indexes (id -> record, email -> ids, username -> ids) span both account
+files, so login and the uniqueness checks of register / profile updates are
+dictionary lookups instead of scans over every account. Each account file is
+indexed against its own version: writes made through app.py update the
+directory in place, and a file changed elsewhere (another worker, an edit by
+hand) is re-indexed on the next lookup.
+"""
+
+import threading
+
+ACCOUNT_TYPES = ('user', 'partner')
+INDEXED_FIELDS = ('email', 'username')
+
+
+class AccountDirectory:
+    """Account lookups by id, email or username across both account files"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.versions = {account_type: None for account_type in ACCOUNT_TYPES}
+
+        self._records = {}  # id -> record (shared, read-only)
+        self._types = {}  # id -> 'user' | 'partner' (the file holding it)
+        self._seq = {}  # id -> position, so ties resolve in file order like a scan would
+        self._keys = {}  # id -> {field: value} as indexed (records may be edited later)
+        self._fields = {field: {} for field in INDEXED_FIELDS}  # field -> value -> ids
+        self._next_seq = 0
+
+        self.rebuilds = 0
+        self.updates = 0
+        self.lookups = 0
+
+    # ============================================
+    # MAINTENANCE
+    # ============================================
+
+    def sync(self, account_type, accounts, version):
+        """Re-index every account of one type from its file ({id: record}) at version"""
+        with self._lock:
+            if version is not None and version == self.versions[account_type]:
+                return
+            for user_id in [uid for uid, kind in self._types.items() if kind == account_type]:
+                self._remove(user_id)
+            for user_id, record in accounts.items():
+                self._add(user_id, record, account_type)
+            self.versions[account_type] = version
+            self.rebuilds += 1
+
+    def is_current(self, account_type, version):
+        with self._lock:
+            return self.versions[account_type] == version
+
+    def put(self, user_id, record, account_type, version=None):
+        """Index a created or updated account; version marks its file as synced"""
+        with self._lock:
+            seq = self._seq.get(user_id)
+            self._remove(user_id)
+            self._add(user_id, record, account_type, seq)
+            if version is not None:
+                self.versions[account_type] = version
+            self.updates += 1
+
+    def _add(self, user_id, record, account_type, seq=None):
+        self._records[user_id] = record
+        self._types[user_id] = account_type
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        self._seq[user_id] = seq
+        keys = self._keys[user_id] = {}
+        for field, index in self._fields.items():
+            value = record.get(field)
+            if value is not None:
+                keys[field] = value
+                index.setdefault(value, set()).add(user_id)
+
+    def _remove(self, user_id):
+        self._records.pop(user_id, None)
+        self._types.pop(user_id, None)
+        self._seq.pop(user_id, None)
+        for field, value in self._keys.pop(user_id, {}).items():
+            ids = self._fields[field].get(value)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._fields[field][value]
+
+    # ============================================
+    # LOOKUPS
+    # ============================================
+
+    def get(self, user_id):
+        with self._lock:
+            self.lookups += 1
+            return self._records.get(user_id)
+
+    def find(self, identifier, account_type=None):
+        """(user_id, record) matching identifier as email, username or id; users win over partners"""
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            if identifier in self._records:
+                candidates.add(identifier)
+            for index in self._fields.values():
+                candidates |= index.get(identifier, set())
+
+            for kind in ACCOUNT_TYPES:
+                if account_type not in (None, kind):
+                    continue
+                matches = [uid for uid in candidates if self._types[uid] == kind]
+                if matches:
+                    user_id = min(matches, key=self._seq.get)
+                    return user_id, self._records[user_id]
+            return None, None
+
+    def field_taken(self, field, value, exclude_id=None, account_type=None):
+        """Whether another account (of account_type, if given) already uses value"""
+        with self._lock:
+            self.lookups += 1
+            return any(uid != exclude_id and account_type in (None, self._types[uid])
+                       for uid in self._fields[field].get(value, ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'accounts': len(self._records),
+                'rebuilds': self.rebuilds,
+                'updates': self.updates,
+                'lookups': self.lookups
+            }
@@ -1,19 +1,39 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+import hmac
 import json
+import math
 import os
 import re
+import threading
+import time
+from functools import wraps
 from datetime import datetime, timedelta
 import jwt
-import google.generativeai as genai
 from dotenv import load_dotenv
+from json_store import DocumentStore
+from sqlite_store import SQLiteStore
+from buffered_counter import BufferedCounter
+from response_cache import ResponseCache
+from pagination import parse_page_args, NEWEST_FIRST_CURSOR, ID_CURSOR, newest_first_key, page_newest_first, page_in_order, project
+from price_parser import parse_price, format_price_range, needs_backfill, backfill_prices
+from property_search import PropertyIndex
+from account_directory import AccountDirectory
+from password_hasher import PasswordHasher, HasherBusy
+from token_cache import TokenCache
+from chat_cache import ChatCache
+from llm_clients import GeminiClient, OpenAIClient, FakeClient, LLMBusy, NeedsFallback
+from listing_retrieval import ListingRetriever, plain_text
+from prompt_budget import PromptBudget
+from booking_index import BookingIndex
+from visit_slots import VisitSlotIndex, parse_visit_time, format_visit_time, parse_visit_hours
+from visitor_tracker import VisitorTracker, SQLitePresence, HyperLogLog, StatsBroadcast
 
 # Load environment variables for API keys
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['X-Next-Cursor'])  # Enable CORS for all routes
 
 # Configuration
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
@@ -24,17 +44,56 @@ USE_OPENAI = os.getenv('USE_OPENAI', 'false').lower() == 'true'
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# The chat provider is created once and reused by every chat request (connection reuse).
+# LLM_PROVIDER picks it: gemini (default), openai (also USE_OPENAI=true) or fake, a local
+# provider with FAKE_LLM_* latency / failure settings to benchmark chat without API keys.
+# LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT bound each call; at most <PROVIDER>_MAX_IN_FLIGHT
+# (default LLM_MAX_IN_FLIGHT) calls run at once, extra chats fall back to the FAQ bot
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai' if USE_OPENAI else 'gemini').lower()
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '30'))
+LLM_MAX_IN_FLIGHT = os.getenv('LLM_MAX_IN_FLIGHT', '8')
+CHAT_PROVIDER = None
+
 # Configure AI based on settings
-if USE_OPENAI and OPENAI_API_KEY:
+if LLM_PROVIDER == 'fake':
+    CHAT_PROVIDER = FakeClient(
+        latency=float(os.getenv('FAKE_LLM_LATENCY', '0.8')),
+        jitter=float(os.getenv('FAKE_LLM_JITTER', '0.3')),
+        failure_rate=float(os.getenv('FAKE_LLM_FAILURE_RATE', '0')),
+        fallback_rate=float(os.getenv('FAKE_LLM_FALLBACK_RATE', '0')),
+        seed=int(os.getenv('FAKE_LLM_SEED', '0')),
+        max_in_flight=int(os.getenv('FAKE_MAX_IN_FLIGHT', '64'))
+    )
+    print('✅ Fake LLM provider configured (offline benchmarking)')
+elif LLM_PROVIDER == 'openai' and OPENAI_API_KEY:
     try:
-        import openai
-        openai.api_key = OPENAI_API_KEY
+        CHAT_PROVIDER = OpenAIClient(
+            OPENAI_API_KEY,
+            model='gpt-3.5-turbo',  # or "gpt-4" for better quality
+            temperature=0.7,
+            max_tokens=500,
+            connect_timeout=LLM_CONNECT_TIMEOUT,
+            timeout=LLM_READ_TIMEOUT,
+            max_in_flight=int(os.getenv('OPENAI_MAX_IN_FLIGHT', LLM_MAX_IN_FLIGHT))
+        )
         print('✅ OpenAI GPT configured')
     except ImportError:
         print('⚠️ WARNING: openai package not installed. Run: pip install openai')
         USE_OPENAI = False
 elif GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    CHAT_PROVIDER = GeminiClient(
+        GEMINI_API_KEY,
+        model='gemini-2.5-flash',
+        generation_config={
+            'temperature': 0.7,
+            'top_k': 40,
+            'top_p': 0.95,
+            'max_output_tokens': 500,
+        },
+        timeout=LLM_CONNECT_TIMEOUT + LLM_READ_TIMEOUT,
+        max_in_flight=int(os.getenv('GEMINI_MAX_IN_FLIGHT', LLM_MAX_IN_FLIGHT))
+    )
     print('✅ Gemini API configured')
 else:
     print('⚠️ WARNING: No AI API key found in .env file!')
@@ -114,6 +173,8 @@ FAVORITES_FILE = 'favorites.json'
 SEARCH_HISTORY_FILE = 'search_history.json'
 PENDING_POSTS_FILE = 'pending_posts.json'
 BOOKINGS_FILE = 'bookings.json'
+PROPERTY_STATS_FILE = 'property_stats.json'
+PARTNER_STATS_FILE = 'partner_stats.json'
 
 # Initialize data files if they don't exist
 def init_data_file(filename, default_data=None, subfolder='backend'):
@@ -139,28 +200,108 @@ init_data_file(SEARCH_HISTORY_FILE, {})
 init_data_file(PENDING_POSTS_FILE, {'posts': [], 'next_post_id': 1}, subfolder='backend')
 init_data_file(BOOKINGS_FILE, {'bookings': [], 'next_booking_id': 1}, subfolder='backend')
 
+# Parsed JSON files are cached in memory and only re-read when they change on disk.
+# Documents returned by load_json() are shared and read-only: change them through
+# update_json() or json_transaction(), which hold the file's lock (safe across workers).
+# With JSON_JOURNAL=true, update_json() appends small records to "<file>.wal" instead of
+# rewriting the file; a background thread compacts them into the JSON file periodically.
+DOCUMENT_STORE = DocumentStore(
+    journal=os.getenv('JSON_JOURNAL', 'false').lower() == 'true',
+    compact_interval=float(os.getenv('JSON_COMPACT_INTERVAL', '30')),
+    compact_records=int(os.getenv('JSON_COMPACT_RECORDS', '1000'))
+)
+
 # Helper functions
-def load_json(filename, subfolder='backend'):
+def data_file_path(filename, subfolder='backend'):
     if subfolder:
-        filepath = os.path.join(app.config['DATA_DIR'], subfolder, filename)
-    else:
-        filepath = os.path.join(app.config['DATA_DIR'], filename)
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {}
+        return os.path.join(app.config['DATA_DIR'], subfolder, filename)
+    return os.path.join(app.config['DATA_DIR'], filename)
+
+def load_json(filename, subfolder='backend'):
+    return DOCUMENT_STORE.load(data_file_path(filename, subfolder))
 
 def save_json(filename, data, subfolder='backend'):
-    if subfolder:
-        filepath = os.path.join(app.config['DATA_DIR'], subfolder, filename)
-    else:
-        filepath = os.path.join(app.config['DATA_DIR'], filename)
+    filepath = data_file_path(filename, subfolder)
     
     print(f"💾 Saving to: {filepath}")  # Debug log
     
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    DOCUMENT_STORE.save(filepath, data)
+
+def update_json(filename, ops, subfolder='backend'):
+    """Apply a small mutation (see json_store.apply_ops) and persist only that change.
+    
+    ops may be a function of the current document returning the operations; it runs
+    under the file lock, so ids and existence checks stay valid until written.
+    """
+    return DOCUMENT_STORE.update(data_file_path(filename, subfolder), ops)
+
+def json_transaction(filename, subfolder='backend'):
+    """Lock a file, yield its document for in-place edits and write it back atomically"""
+    return DOCUMENT_STORE.transaction(data_file_path(filename, subfolder))
+
+def json_lock(filename, subfolder='backend'):
+    """Hold a file's write lock across several operations (re-entrant for update_json)"""
+    return DOCUMENT_STORE.write_lock(data_file_path(filename, subfolder))
+
+# Optional SQLite storage for accounts, ratings, comments, favorites, bookings and posts.
+# Import the existing JSON files first with: python sqlite_store.py migrate
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
+SQL_STORE = None
+if STORAGE_BACKEND == 'sqlite':
+    SQL_STORE = SQLiteStore(os.getenv('SQLITE_PATH') or data_file_path('holahome.db'))
+    print(f'✅ SQLite storage enabled: {SQL_STORE.db_path}')
+
+# The static pages (index.html, chatbot.js, partner_script.js) fetch these files directly,
+# so with SQLite they are re-exported after every write instead of freezing at migration.
+SQL_SNAPSHOTS = {
+    RATINGS_FILE: 'ratings',
+    COMMENTS_FILE: 'comments',
+    FAVORITES_FILE: 'favorites',
+    BOOKINGS_FILE: 'bookings'
+}
+
+def export_sql_snapshot(filename):
+    """Rewrite a JSON file from SQLite; under the file lock so the last export wins"""
+    with json_lock(filename):
+        DOCUMENT_STORE.save(data_file_path(filename), SQL_STORE.export_json(SQL_SNAPSHOTS[filename]))
+
+def flush_property_views(deltas):
+    """Add buffered view increments to data.json in a single atomic write"""
+    flushed = {}
+    
+    def build_ops(properties):
+        known_ids = {p.get('id') for p in properties}
+        flushed.update((property_id, delta) for property_id, delta in deltas.items() if property_id in known_ids)
+        return [('incr', [{'id': property_id}, 'views'], delta) for property_id, delta in flushed.items()]
+    
+    # Partners' view totals move with the same batch
+    with json_lock(PARTNER_STATS_FILE):
+        update_json('data.json', build_ops, subfolder=None)
+        bump_partner_stats({property_id: {'total_views': delta} for property_id, delta in flushed.items()})
+
+# Property views are counted in memory and flushed to data.json every VIEW_FLUSH_INTERVAL
+# seconds, after VIEW_FLUSH_EVERY views, and on shutdown. Reads add the pending deltas.
+VIEW_COUNTER = BufferedCounter(
+    flush_property_views,
+    interval=float(os.getenv('VIEW_FLUSH_INTERVAL', '5')),
+    max_pending=int(os.getenv('VIEW_FLUSH_EVERY', '100')),
+    name='view counter'
+)
+
+# pbkdf2 hashing runs in a process pool so logins don't stall other requests; when
+# PASSWORD_HASH_QUEUE hashes are already waiting, requests get 503 + Retry-After
+PASSWORD_HASHER = PasswordHasher(
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1)))),
+    max_pending=int(os.getenv('PASSWORD_HASH_QUEUE', '16')),
+    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', '10')),
+    retry_after=int(os.getenv('PASSWORD_HASH_RETRY_AFTER', '1'))
+)
+
+@app.errorhandler(HasherBusy)
+def password_hasher_busy(e):
+    response = jsonify({'error': 'Máy chủ đang bận, vui lòng thử lại sau giây lát'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
 
 def generate_token(user_id):
     payload = {
@@ -169,12 +310,23 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
+# Verified tokens are remembered (by digest, until their exp) so repeat requests skip
+# the HS256 decode; TOKEN_CACHE_SIZE bounds the number of tokens kept
+TOKEN_CACHE = TokenCache(max_entries=int(os.getenv('TOKEN_CACHE_SIZE', '4096')))
+
 def verify_token(token):
+    if not token:
+        return None
+    user_id = TOKEN_CACHE.get(token)
+    if user_id is not None:
+        return user_id
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
+        user_id = payload['user_id']
     except:
         return None
+    TOKEN_CACHE.put(token, user_id, payload.get('exp'))
+    return user_id
 
 def get_user_id_from_token():
     """Extract user ID from Authorization header"""
@@ -185,31 +337,697 @@ def get_user_id_from_token():
     token = auth_header.split(' ')[1]
     return verify_token(token)
 
-def load_all_accounts():
-    """Load both user and partner accounts into a single dict"""
-    user_accounts = load_json(USER_ACCOUNTS_FILE, subfolder=None)
-    partner_accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
+def current_user_id():
+    """User id of the request's Bearer token, resolved once per request"""
+    if 'user_id' not in g:
+        g.user_id = get_user_id_from_token()
+    return g.user_id
+
+def require_auth(owner_arg=None):
+    """Route decorator: 401 without a valid token, otherwise sets g.user_id and g.user.
     
-    all_users = {}
-    all_users.update(user_accounts.get('users', {}))
-    all_users.update(partner_accounts.get('partners', {}))
+    With owner_arg, the token must also belong to the account named by that URL
+    argument (e.g. owner_arg='user_id' for /api/user/<user_id>/...).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = current_user_id()
+            if not user_id or (owner_arg and kwargs.get(owner_arg) != user_id):
+                return jsonify({'error': 'Unauthorized'}), 401
+            g.user = get_account(user_id)  # shared record, copy before editing
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ============================================
+# DATA ACCESS (JSON files or SQLite)
+# ============================================
+
+# Accounts
+
+# Hash indexes over both account files (id, email, username). Writes below update them in
+# place; an account file changed by another worker is re-indexed on the next lookup.
+ACCOUNT_FILES = {
+    'user': (USER_ACCOUNTS_FILE, 'users'),
+    'partner': (PARTNER_ACCOUNTS_FILE, 'partners')
+}
+ACCOUNT_DIRECTORY = AccountDirectory()
+
+def account_file_version(account_type):
+    return DOCUMENT_STORE.version(data_file_path(ACCOUNT_FILES[account_type][0], None))
+
+def account_directory():
+    """The account directory, synced with both account files"""
+    for account_type, (filename, key) in ACCOUNT_FILES.items():
+        version = account_file_version(account_type)
+        if not ACCOUNT_DIRECTORY.is_current(account_type, version):
+            ACCOUNT_DIRECTORY.sync(account_type, load_json(filename, subfolder=None).get(key, {}), version)
+    return ACCOUNT_DIRECTORY
+
+def get_account(user_id):
+    """Account record by id (user or partner), or None"""
+    if SQL_STORE:
+        return SQL_STORE.get_account(user_id)
+    return account_directory().get(user_id)
+
+def find_account(identifier, account_type=None):
+    """Find an account by email, username or id; returns (user_id, record) or (None, None)"""
+    if SQL_STORE:
+        return SQL_STORE.find_account(identifier, account_type)
+    return account_directory().find(identifier, account_type)
+
+def account_field_taken(field, value, exclude_id=None, account_type=None):
+    """Check whether another account already uses this email/username"""
+    if SQL_STORE:
+        return SQL_STORE.account_field_taken(field, value, exclude_id, account_type)
+    return account_directory().field_taken(field, value, exclude_id, account_type)
+
+def write_account(account_type, write):
+    """Run write() -> (user_id, record) on an account file and index the result"""
+    filename = ACCOUNT_FILES[account_type][0]
+    with json_lock(filename, subfolder=None):
+        was_current = ACCOUNT_DIRECTORY.is_current(account_type, account_file_version(account_type))
+        user_id, record = write()
+        # Only mark the file synced if nothing else changed it since the last sync
+        ACCOUNT_DIRECTORY.put(user_id, record, account_type,
+                              version=account_file_version(account_type) if was_current else None)
+    return user_id, record
+
+def create_account(account_type, fields):
+    """Create an account with the next id for its type; returns (user_id, record)"""
+    if SQL_STORE:
+        return SQL_STORE.create_account(account_type, fields)
     
-    return all_users
+    if account_type == 'partner':
+        filename, key, counter, prefix = PARTNER_ACCOUNTS_FILE, 'partners', 'next_partner_id', 'partner#'
+    else:
+        filename, key, counter, prefix = USER_ACCOUNTS_FILE, 'users', 'next_user_id', 'user#'
+    
+    created = {}
+    
+    def build_ops(accounts):
+        next_id = accounts.get(counter, 1)
+        user_id = f"{prefix}{str(next_id).zfill(5)}"
+        created['record'] = {'id': user_id, **fields}
+        return [
+            ('set', [key, user_id], created['record']),
+            ('set', [counter], next_id + 1)
+        ]
+    
+    def write():
+        update_json(filename, build_ops, subfolder=None)
+        return created['record']['id'], created['record']
+    
+    return write_account('partner' if account_type == 'partner' else 'user', write)
 
 def save_account(user_id, user_data):
     """Save account to appropriate file based on account_type"""
-    account_type = user_data.get('account_type', 'user')
+    if SQL_STORE:
+        SQL_STORE.save_account(user_id, user_data)
+        return
     
-    if account_type == 'partner':
-        accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
-        accounts['partners'] = accounts.get('partners', {})
-        accounts['partners'][user_id] = user_data
-        save_json(PARTNER_ACCOUNTS_FILE, accounts, subfolder=None)
-    else:
-        accounts = load_json(USER_ACCOUNTS_FILE, subfolder=None)
-        accounts['users'] = accounts.get('users', {})
-        accounts['users'][user_id] = user_data
-        save_json(USER_ACCOUNTS_FILE, accounts, subfolder=None)
+    account_type = 'partner' if user_data.get('account_type', 'user') == 'partner' else 'user'
+    filename, key = ACCOUNT_FILES[account_type]
+    
+    def write():
+        update_json(filename, [('set', [key, user_id], user_data)], subfolder=None)
+        return user_id, user_data
+    
+    write_account(account_type, write)
+
+# Ratings
+
+def get_property_ratings(property_id):
+    if SQL_STORE:
+        return SQL_STORE.get_ratings(property_id)
+    return load_json(RATINGS_FILE).get(property_id, [])
+
+def save_rating(property_id, user_id, rating):
+    """Add or update a user's rating; returns the previous rating value or None"""
+    now = datetime.utcnow().isoformat()
+    if SQL_STORE:
+        previous = SQL_STORE.upsert_rating(property_id, user_id, rating, now)
+        export_sql_snapshot(RATINGS_FILE)
+        return previous
+    
+    previous = {}
+    
+    def build_ops(ratings):
+        # Check if user already rated
+        user_rating = next((r for r in ratings.get(property_id, []) if r['user_id'] == user_id), None)
+        
+        if user_rating:
+            previous['rating'] = user_rating['rating']
+            rating_path = [property_id, {'user_id': user_id}]
+            return [
+                ('set', rating_path + ['rating'], rating),
+                ('set', rating_path + ['updated_at'], now)
+            ]
+        
+        return [('append', [property_id], {
+            'user_id': user_id,
+            'rating': rating,
+            'created_at': now
+        })]
+    
+    # The stats lock keeps the rating and its aggregate in step with rebuild_property_stats()
+    with json_lock(PROPERTY_STATS_FILE):
+        update_json(RATINGS_FILE, build_ops)
+        if 'rating' in previous:
+            bump_property_stats(property_id, rating_sum=rating - previous['rating'])
+        else:
+            bump_property_stats(property_id, rating_sum=rating, rating_count=1)
+    return previous.get('rating')
+
+# Comments
+
+def get_property_comments(property_id):
+    if SQL_STORE:
+        return SQL_STORE.get_comments(property_id)
+    return load_json(COMMENTS_FILE).get(property_id, [])
+
+def insert_comment(property_id, comment):
+    if SQL_STORE:
+        SQL_STORE.add_comment(property_id, comment)
+        export_sql_snapshot(COMMENTS_FILE)
+        return
+    update_json(COMMENTS_FILE, [('append', [property_id], comment)])
+
+# Favorites
+
+def get_user_favorites(user_id):
+    if SQL_STORE:
+        return SQL_STORE.get_favorites(user_id)
+    return load_json(FAVORITES_FILE).get(user_id, [])
+
+def add_user_favorite(user_id, property_id):
+    """Returns False if the property was already a favorite"""
+    if SQL_STORE:
+        added = SQL_STORE.add_favorite(user_id, property_id)
+        if added:
+            export_sql_snapshot(FAVORITES_FILE)
+        return added
+    
+    added = []
+    
+    def build_ops(favorites):
+        if property_id in favorites.get(user_id, []):
+            return []
+        added.append(property_id)
+        return [('append', [user_id], property_id)]
+    
+    with json_lock(PROPERTY_STATS_FILE):
+        update_json(FAVORITES_FILE, build_ops)
+        if added:
+            bump_property_stats(property_id, favorite_count=1)
+    return bool(added)
+
+def remove_user_favorite(user_id, property_id):
+    """Returns False if the property was not a favorite"""
+    if SQL_STORE:
+        removed = SQL_STORE.remove_favorite(user_id, property_id)
+        if removed:
+            export_sql_snapshot(FAVORITES_FILE)
+        return removed
+    
+    removed = []
+    
+    def build_ops(favorites):
+        if property_id not in favorites.get(user_id, []):
+            return []
+        removed.append(property_id)
+        return [('remove', [user_id], property_id)]
+    
+    with json_lock(PROPERTY_STATS_FILE):
+        update_json(FAVORITES_FILE, build_ops)
+        if removed:
+            bump_property_stats(property_id, favorite_count=-1)
+    return bool(removed)
+
+# Property stats: running rating sum/count and favorite count per property, updated
+# together with every rating and favorite change and rebuilt from scratch on startup
+
+EMPTY_PROPERTY_STATS = {'rating_sum': 0, 'rating_count': 0, 'favorite_count': 0}
+
+def bump_property_stats(property_id, **deltas):
+    """Add deltas to one property's aggregates in property_stats.json"""
+    def build_ops(stats):
+        if property_id not in stats:
+            record = dict(EMPTY_PROPERTY_STATS)
+            for field, delta in deltas.items():
+                record[field] += delta
+            return [('set', [property_id], record)]
+        return [('incr', [property_id, field], delta) for field, delta in deltas.items() if delta]
+    
+    update_json(PROPERTY_STATS_FILE, build_ops)
+
+def load_property_stats():
+    """{property_id: {'rating_sum', 'rating_count', 'favorite_count'}}"""
+    if SQL_STORE:
+        return SQL_STORE.property_stats()
+    return load_json(PROPERTY_STATS_FILE)
+
+def property_stats_version():
+    """Changes whenever a rating or favorite changes any property's aggregates"""
+    if SQL_STORE:
+        return SQL_STORE.property_stats_version()
+    return DOCUMENT_STORE.version(data_file_path(PROPERTY_STATS_FILE))
+
+def rebuild_property_stats():
+    """Recompute every property's aggregates from the ratings and favorites"""
+    if SQL_STORE:
+        SQL_STORE.rebuild_property_stats()
+        return
+    
+    with json_lock(PROPERTY_STATS_FILE):
+        stats = {}
+        for property_id, items in load_json(RATINGS_FILE).items():
+            if items:
+                stats[property_id] = dict(EMPTY_PROPERTY_STATS,
+                                          rating_sum=sum(r['rating'] for r in items),
+                                          rating_count=len(items))
+        for user_favs in load_json(FAVORITES_FILE).values():
+            for property_id in set(user_favs):
+                stats.setdefault(property_id, dict(EMPTY_PROPERTY_STATS))['favorite_count'] += 1
+        save_json(PROPERTY_STATS_FILE, stats)
+
+rebuild_property_stats()
+
+# Posts
+
+def insert_post(fields):
+    """Store a new post with the next post id; returns the post"""
+    if SQL_STORE:
+        return SQL_STORE.create_post(fields)
+    
+    created = {}
+    
+    def build_ops(posts_data):
+        post_id = posts_data.get('next_post_id', 1)
+        created['post'] = {'id': post_id, **fields}
+        ops = [] if 'posts' in posts_data else [('set', ['posts'], [])]
+        return ops + [
+            ('append', ['posts'], created['post']),
+            ('set', ['next_post_id'], post_id + 1)
+        ]
+    
+    update_json(PENDING_POSTS_FILE, build_ops, subfolder='backend')
+    return created['post']
+
+def find_post(post_id):
+    if SQL_STORE:
+        return SQL_STORE.get_post(post_id)
+    posts = load_json(PENDING_POSTS_FILE, subfolder='backend').get('posts', [])
+    return next((p for p in posts if p.get('id') == post_id), None)
+
+def update_post_record(post_id, changes):
+    """Merge changes into a post; returns the updated post or None"""
+    if SQL_STORE:
+        return SQL_STORE.update_post(post_id, changes)
+    
+    def build_ops(posts_data):
+        if not any(p.get('id') == post_id for p in posts_data.get('posts', [])):
+            return []
+        post_path = ['posts', {'id': post_id}]
+        return [('set', post_path + [field], value) for field, value in changes.items()]
+    
+    update_json(PENDING_POSTS_FILE, build_ops, subfolder='backend')
+    return find_post(post_id)
+
+def remove_post(post_id):
+    if SQL_STORE:
+        SQL_STORE.delete_post(post_id)
+        return
+    def build_ops(posts_data):
+        if not any(p.get('id') == post_id for p in posts_data.get('posts', [])):
+            return []
+        return [('delete', ['posts', {'id': post_id}], None)]
+    
+    update_json(PENDING_POSTS_FILE, build_ops, subfolder='backend')
+
+def query_posts(status=None, partner_id=None, after=None, limit=None):
+    """Posts filtered by status/partner, newest first; after/limit select a page (see pagination.py)"""
+    if SQL_STORE:
+        return SQL_STORE.list_posts(status, partner_id, after, limit)
+    
+    posts = load_json(PENDING_POSTS_FILE, subfolder='backend').get('posts', [])
+    
+    if status:
+        posts = [p for p in posts if p.get('status') == status]
+    
+    if partner_id:
+        posts = [p for p in posts if p.get('partner_id') == partner_id]
+    
+    if after is not None:
+        posts = [p for p in posts if newest_first_key(p) < after]
+    
+    posts = sorted(posts, key=newest_first_key, reverse=True)
+    return posts[:limit] if limit else posts
+
+# Bookings
+
+# Indexes over bookings.json (id and file position, property, status, creation order) and
+# the listings of each partner's approved posts. Writes below update them in place; a file
+# changed by another worker is re-indexed on the next lookup.
+# A viewing takes VISIT_DURATION_MINUTES; pending and confirmed bookings of the same property
+# may not overlap. Free slots are offered within VISIT_HOURS every VISIT_SLOT_STEP_MINUTES.
+VISIT_DURATION = int(os.getenv('VISIT_DURATION_MINUTES', '30'))
+VISIT_HOURS = parse_visit_hours(os.getenv('VISIT_HOURS', '08:00-20:00'))
+VISIT_SLOT_STEP = int(os.getenv('VISIT_SLOT_STEP_MINUTES', str(VISIT_DURATION)))
+BOOKING_INDEX = BookingIndex(VisitSlotIndex(VISIT_DURATION))
+# SQLite mode: property_id -> (bookings version, VisitSlotIndex of its active visits)
+SQL_VISIT_SLOTS = {}
+SQL_VISIT_SLOTS_LOCK = threading.Lock()
+
+def bookings_file_version():
+    return DOCUMENT_STORE.version(data_file_path(BOOKINGS_FILE))
+
+def booking_index():
+    """The booking index, synced with bookings.json"""
+    version = bookings_file_version()
+    if not BOOKING_INDEX.is_current(version):
+        BOOKING_INDEX.sync(load_json(BOOKINGS_FILE, subfolder='backend').get('bookings', []), version)
+    return BOOKING_INDEX
+
+def write_booking(write):
+    """Run write() -> position of the booking it wrote (or None) and index that booking"""
+    with json_lock(BOOKINGS_FILE):
+        was_current = BOOKING_INDEX.is_current(bookings_file_version())
+        position = write()
+        if position is None:
+            return None
+        booking = load_json(BOOKINGS_FILE, subfolder='backend')['bookings'][position]
+        # Only mark the file synced if nothing else changed it since the last sync
+        BOOKING_INDEX.put(booking, position, version=bookings_file_version() if was_current else None)
+    return booking
+
+def insert_booking(fields):
+    """Store a new booking with the next booking id; returns the booking"""
+    if SQL_STORE:
+        booking = SQL_STORE.create_booking(fields)
+        export_sql_snapshot(BOOKINGS_FILE)
+        return booking
+    
+    created = {}
+    
+    # The id is read and bumped under the file lock, so concurrent workers never share one
+    def build_ops(bookings_data):
+        booking_id = bookings_data.get('next_booking_id', 1)
+        created['position'] = len(bookings_data.get('bookings', []))
+        ops = [] if 'bookings' in bookings_data else [('set', ['bookings'], [])]
+        return ops + [
+            ('append', ['bookings'], {'id': booking_id, **fields}),
+            ('set', ['next_booking_id'], booking_id + 1)
+        ]
+    
+    def write():
+        update_json(BOOKINGS_FILE, build_ops, subfolder='backend')
+        return created['position']
+    
+    return write_booking(write)
+
+def find_booking(booking_id):
+    if SQL_STORE:
+        return SQL_STORE.get_booking(booking_id)
+    return booking_index().get(booking_id)
+
+def update_booking_record(booking_id, changes):
+    """Merge changes into a booking; returns the updated booking or None"""
+    if SQL_STORE:
+        booking = SQL_STORE.update_booking(booking_id, changes)
+        if booking:
+            export_sql_snapshot(BOOKINGS_FILE)
+        return booking
+    
+    found = {}
+    
+    def build_ops(bookings_data):
+        bookings = bookings_data.get('bookings', [])
+        position = booking_index().position(booking_id)
+        if position is None or position >= len(bookings) or bookings[position].get('id') != booking_id:
+            position = next((i for i, b in enumerate(bookings) if b.get('id') == booking_id), None)
+            if position is None:
+                return []
+        found['position'] = position
+        return [('set', ['bookings', position, field], value) for field, value in changes.items()]
+    
+    def write():
+        update_json(BOOKINGS_FILE, build_ops, subfolder='backend')
+        return found.get('position')
+    
+    return write_booking(write)
+
+def query_bookings(status=None, property_id=None, property_ids=None, after=None, limit=None):
+    """Bookings filtered by status/property, newest first; after/limit select a page (see pagination.py)"""
+    if SQL_STORE:
+        return SQL_STORE.list_bookings(status, property_id, property_ids, after, limit)
+    return booking_index().query(status, property_id, property_ids, after, limit)
+
+def visit_slots(property_id):
+    """Slot index holding the property's active visits"""
+    if not SQL_STORE:
+        return booking_index().slots
+    
+    # Built once per property and reused until any booking changes
+    version = SQL_STORE.bookings_version()
+    with SQL_VISIT_SLOTS_LOCK:
+        cached = SQL_VISIT_SLOTS.get(property_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    slots = VisitSlotIndex(VISIT_DURATION)
+    for booking in SQL_STORE.list_bookings(property_id=property_id):
+        slots.put(booking)
+    with SQL_VISIT_SLOTS_LOCK:
+        SQL_VISIT_SLOTS[property_id] = (version, slots)
+    return slots
+
+def parse_visit_date(value):
+    """'YYYY-MM-DD' of a visit date, or None if invalid"""
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def visit_conflicts(booking, statuses=('pending', 'confirmed')):
+    """Other bookings with the given statuses whose visit overlaps this booking's"""
+    start = parse_visit_time(booking.get('visit_time'))
+    if start is None:
+        return []
+    conflicts = []
+    for other_id in visit_slots(booking.get('property_id')).conflicts(
+            booking.get('property_id'), booking.get('visit_date'), start, exclude=booking.get('id')):
+        other = find_booking(other_id)
+        if other and other.get('status') in statuses:
+            conflicts.append(other)
+    return conflicts
+
+def available_visit_times(property_id, visit_date):
+    return [format_visit_time(start) for start in visit_slots(property_id).available(
+        property_id, visit_date, VISIT_HOURS[0], VISIT_HOURS[1], VISIT_SLOT_STEP)]
+
+def partner_property_ids(partner_id):
+    """Ids of the listings published from a partner's approved posts"""
+    if SQL_STORE:
+        return [post_property_id(p['id']) for p in query_posts(status='approved', partner_id=partner_id)]
+    
+    version = DOCUMENT_STORE.version(data_file_path(PENDING_POSTS_FILE))
+    if not BOOKING_INDEX.owners_current(version):
+        owners = {}
+        for post in load_json(PENDING_POSTS_FILE, subfolder='backend').get('posts', []):
+            if post.get('status') == 'approved' and post.get('partner_id'):
+                owners.setdefault(post['partner_id'], set()).add(post_property_id(post['id']))
+        BOOKING_INDEX.sync_owners(owners, version)
+    return BOOKING_INDEX.partner_properties(partner_id)
+
+# Partner stats: the partner dashboard aggregates (published and pending listings, views,
+# bookings by status, revenue of confirmed bookings), kept per property ("new_<post id>")
+# and summed per partner in partner_stats.json. Updated together with every post, booking
+# and flushed view change and rebuilt from scratch on startup. Stored as JSON with either
+# storage backend, like the views in data.json they partly come from.
+
+EMPTY_PARTNER_STATS = {
+    'total_properties': 0,  # published to data.json
+    'pending_properties': 0,  # waiting for approval
+    'total_views': 0,
+    'bookings_pending': 0,
+    'bookings_confirmed': 0,
+    'bookings_cancelled': 0,
+    'bookings_completed': 0,
+    'total_revenue': 0  # price_min of confirmed bookings (VND/month)
+}
+
+def post_property_id(post_id):
+    """Id of the data.json listing a post is published as"""
+    return f"new_{post_id}"
+
+def bump_partner_stats(changes, owners=None):
+    """Add {property_id: {field: delta}} to the properties' and their partners' aggregates.
+    
+    owners ({property_id: partner_id}) creates the records of new properties; changes to
+    properties without a record (not a partner's listing) are ignored.
+    """
+    owners = owners or {}
+    
+    def build_ops(stats):
+        properties = stats.get('properties', {})
+        partners = stats.get('partners', {})
+        ops = [('set', [key], {}) for key in ('properties', 'partners') if key not in stats]
+        new_partners = set()
+        for property_id, deltas in changes.items():
+            record = properties.get(property_id)
+            partner_id = record['partner_id'] if record else owners.get(property_id)
+            if not partner_id:
+                continue
+            if record is None:
+                ops.append(('set', ['properties', property_id], dict(EMPTY_PARTNER_STATS, partner_id=partner_id)))
+            if partner_id not in partners and partner_id not in new_partners:
+                ops.append(('set', ['partners', partner_id], dict(EMPTY_PARTNER_STATS)))
+                new_partners.add(partner_id)
+            for field, delta in deltas.items():
+                if delta:
+                    ops.append(('incr', ['properties', property_id, field], delta))
+                    ops.append(('incr', ['partners', partner_id, field], delta))
+        return ops
+    
+    update_json(PARTNER_STATS_FILE, build_ops)
+
+def drop_partner_property(property_id):
+    """Remove a deleted post's property and everything it added to its partner's aggregates"""
+    def build_ops(stats):
+        record = stats.get('properties', {}).get(property_id)
+        if not record:
+            return []
+        partner_path = ['partners', record['partner_id']]
+        return [('incr', partner_path + [field], -value) for field, value in record.items()
+                if field != 'partner_id' and value] + [('delete', ['properties', property_id], None)]
+    
+    update_json(PARTNER_STATS_FILE, build_ops)
+
+def partner_property_stats(property_id):
+    return load_json(PARTNER_STATS_FILE).get('properties', {}).get(property_id)
+
+def booking_stats_change(previous, booking):
+    """Aggregate deltas for a booking going from `previous` (None when new) to `booking`"""
+    deltas = {}
+    price = booking.get('price_min') or 0
+    if previous:
+        deltas[f"bookings_{previous.get('status')}"] = -1
+        if previous.get('status') == 'confirmed':
+            deltas['total_revenue'] = -(previous.get('price_min') or 0)
+    status_field = f"bookings_{booking.get('status')}"
+    deltas[status_field] = deltas.get(status_field, 0) + 1
+    if booking.get('status') == 'confirmed':
+        deltas['total_revenue'] = deltas.get('total_revenue', 0) + price
+    return {booking.get('property_id'): deltas}
+
+def rebuild_partner_stats():
+    """Recompute every partner's aggregates from the posts, bookings and data.json"""
+    with json_lock(PARTNER_STATS_FILE):
+        views = {p.get('id'): p.get('views', 0) for p in load_json('data.json', subfolder=None)}
+        properties = {}
+        for post in query_posts():
+            if not post.get('partner_id'):
+                continue
+            property_id = post_property_id(post['id'])
+            record = properties[property_id] = dict(EMPTY_PARTNER_STATS, partner_id=post['partner_id'])
+            record['pending_properties'] = int(post.get('status') == 'pending')
+            if property_id in views:
+                record['total_properties'] = 1
+                record['total_views'] = views[property_id]
+        for booking in query_bookings():
+            record = properties.get(booking.get('property_id'))
+            if record:
+                for field, delta in booking_stats_change(None, booking)[booking.get('property_id')].items():
+                    record[field] = record.get(field, 0) + delta
+        
+        partners = {}
+        for record in properties.values():
+            totals = partners.setdefault(record['partner_id'], dict(EMPTY_PARTNER_STATS))
+            for field, value in record.items():
+                if field != 'partner_id':
+                    totals[field] = totals.get(field, 0) + value
+        save_json(PARTNER_STATS_FILE, {'partners': partners, 'properties': properties})
+
+rebuild_partner_stats()
+
+# Rendered and precompressed responses of the busiest read endpoints
+RESPONSE_CACHE = ResponseCache()
+
+def enrich_properties(properties, pending_views=None):
+    """Copies of the properties with rating, favorite and view stats"""
+    pending_views = pending_views or {}
+    # Running rating totals and favorite counts per property
+    property_stats = load_property_stats()
+    
+    # Enrich copies of the properties with stats (the loaded list is shared)
+    enriched = []
+    for prop in properties:
+        prop = dict(prop)
+        property_id = prop.get('id')
+        
+        stats = property_stats.get(property_id, EMPTY_PROPERTY_STATS)
+        
+        # Calculate average rating
+        rating_count = stats['rating_count']
+        if rating_count:
+            prop['average_rating'] = round(stats['rating_sum'] / rating_count, 1)
+            prop['rating_count'] = rating_count
+        else:
+            prop['average_rating'] = 0
+            prop['rating_count'] = 0
+        
+        # Count favorites
+        prop['favorite_count'] = stats['favorite_count']
+        
+        # View count from data.json plus views not flushed yet
+        prop['views'] = prop.get('views', 0) + pending_views.get(property_id, 0)
+        prop['view_count'] = prop['views']
+        enriched.append(prop)
+    
+    return enriched
+
+def find_property(property_id):
+    properties = load_json('data.json', subfolder=None)
+    return next((p for p in properties if p.get('id') == property_id), None)
+
+def catalog_version():
+    return DOCUMENT_STORE.version(data_file_path('data.json', None))
+
+# Facet indexes for /api/properties/search. Catalog edits made here update them in place;
+# changes from other workers or by hand are picked up by a diff when data.json changes.
+PROPERTY_INDEX = PropertyIndex()
+
+def property_index():
+    """The search index, synced with the current data.json"""
+    version = catalog_version()
+    if version != PROPERTY_INDEX.version:
+        PROPERTY_INDEX.sync(load_json('data.json', subfolder=None), version)
+    return PROPERTY_INDEX
+
+def change_catalog(edit, added=None, removed_id=None):
+    """Run edit() (a data.json transaction) and apply the same change to the search index"""
+    with json_lock('data.json', subfolder=None):
+        index_was_current = PROPERTY_INDEX.version == catalog_version()
+        edit()
+        if added:
+            PROPERTY_INDEX.add(added)
+        if removed_id:
+            PROPERTY_INDEX.remove(removed_id)
+        if index_was_current:
+            PROPERTY_INDEX.mark_synced(catalog_version())
+
+def backfill_property_prices():
+    """Give listings published before price parsing their numeric price_min/price_max"""
+    if not needs_backfill(load_json('data.json', subfolder=None)):
+        return
+    with json_transaction('data.json', subfolder=None) as main_data:
+        listings = main_data if isinstance(main_data, list) else main_data.setdefault('properties', [])
+        filled = backfill_prices(listings)
+    print(f'✅ Added price ranges to {filled} listings')
+
+backfill_property_prices()
 
 # Routes
 
@@ -217,58 +1035,101 @@ def save_account(user_id, user_data):
 @app.route('/api/properties', methods=['GET'])
 def get_properties():
     try:
-        filepath = os.path.join(app.config['DATA_DIR'], 'data.json')
-        with open(filepath, 'r', encoding='utf-8') as f:
-            properties = json.load(f)
-        
-        # Load ratings and favorites to calculate stats
-        ratings = load_json(RATINGS_FILE)
-        favorites = load_json(FAVORITES_FILE)
-        
-        # Enrich properties with stats
-        for prop in properties:
-            property_id = prop.get('id')
-            
-            # Calculate average rating
-            prop_ratings = ratings.get(property_id, [])
-            if prop_ratings:
-                avg_rating = sum(r['rating'] for r in prop_ratings) / len(prop_ratings)
-                prop['average_rating'] = round(avg_rating, 1)
-                prop['rating_count'] = len(prop_ratings)
-            else:
-                prop['average_rating'] = 0
-                prop['rating_count'] = 0
-            
-            # Count favorites
-            favorite_count = sum(1 for user_favs in favorites.values() if property_id in user_favs)
-            prop['favorite_count'] = favorite_count
-            
-            # View count from data.json
-            prop['view_count'] = prop.get('views', 0)
+        limit, after, fields = parse_page_args(request.args, ID_CURSOR)
+    except ValueError:
+        return jsonify({'error': 'Tham số phân trang không hợp lệ'}), 400
+    
+    try:
+        # The rendered list is reused until data.json or a rating/favorite changes. Its view
+        # counts are the ones in data.json (last flushed batch); /api/properties/views has
+        # the exact counts including the views not written yet.
+        version = (catalog_version(), property_stats_version())
+        properties = load_json('data.json', subfolder=None)
         
-        return jsonify(properties), 200
+        def render():
+            # Only the requested page is enriched and serialized
+            page, next_cursor = page_in_order(properties, limit, after)
+            body = jsonify(project(enrich_properties(page), fields)).get_data()
+            return body, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        # Each page / field selection is cached separately
+        name = 'properties'
+        if limit or after or fields:
+            name += f"?limit={limit}&after={request.args.get('after')}&fields={','.join(fields or [])}"
+        
+        cached = RESPONSE_CACHE.get(name, version, render)
+        return RESPONSE_CACHE.respond(cached, request)
+    except ValueError:
+        return jsonify({'error': 'Tham số phân trang không hợp lệ'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Exact view counts, for pages showing the cached property list
+@app.route('/api/properties/views', methods=['GET'])
+def get_property_views():
+    try:
+        # data.json plus the views not written to it yet
+        properties, pending_views = VIEW_COUNTER.read_consistent(lambda: load_json('data.json', subfolder=None))
+        return jsonify({prop.get('id'): prop.get('views', 0) + pending_views.get(prop.get('id'), 0)
+                        for prop in properties})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Search properties by type, locality, price and area
+@app.route('/api/properties/search', methods=['GET'])
+def search_properties():
+    args = request.args
+    try:
+        limit, after, fields = parse_page_args(args, ID_CURSOR)
+        numbers = {}
+        for name in ('price_min', 'price_max', 'area_min', 'area_max'):
+            value = args.get(name)
+            numbers[name] = float(value) if value not in (None, '') else None
+            if numbers[name] is not None and not math.isfinite(numbers[name]):
+                raise ValueError(f'{name} must be finite')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Tham số tìm kiếm không hợp lệ'}), 400
+    
+    try:
+        # "Tất cả" in the homepage filters means no filter
+        localities = [args.get(name) for name in ('district', 'city', 'locality')
+                      if args.get(name) and args.get(name) != 'Tất cả']
+        loai = args.get('loai') or args.get('type')
+        
+        index, pending_views = VIEW_COUNTER.read_consistent(property_index)
+        matches = index.search(
+            loai=None if loai == 'Tất cả' else loai,
+            localities=localities,
+            keyword=args.get('q'),
+            sort=args.get('sort'),
+            **numbers
+        )
+        
+        page, next_cursor = page_in_order(matches, limit, after)
+        return jsonify({
+            'success': True,
+            'properties': project(enrich_properties(page, pending_views), fields),
+            'count': len(matches),
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Tham số tìm kiếm không hợp lệ'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Increment property view count
 @app.route('/api/properties/<property_id>/view', methods=['POST'])
 def increment_view(property_id):
     try:
-        filepath = os.path.join(app.config['DATA_DIR'], 'data.json')
-        with open(filepath, 'r', encoding='utf-8') as f:
-            properties = json.load(f)
-        
-        # Find and update the property
-        for prop in properties:
-            if prop.get('id') == property_id:
-                prop['views'] = prop.get('views', 0) + 1
-                break
+        # Find the property, then buffer the increment (written to data.json in batches)
+        prop = find_property(property_id)
+        if not prop:
+            return jsonify({'error': 'Property not found'}), 404
         
-        # Save updated data
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(properties, f, ensure_ascii=False, indent=2)
+        pending = VIEW_COUNTER.increment(property_id)
+        views = prop.get('views', 0) + pending
         
-        return jsonify({'success': True, 'views': prop.get('views', 0)}), 200
+        return jsonify({'success': True, 'views': views}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -284,28 +1145,9 @@ def register():
     if not email or not password:
         return jsonify({'error': 'Email và password là bắt buộc'}), 400
     
-    # Load appropriate accounts file
-    if account_type == 'partner':
-        accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
-        users = accounts.get('partners', {})
-    else:
-        accounts = load_json(USER_ACCOUNTS_FILE, subfolder=None)
-        users = accounts.get('users', {})
-    
     # Check if user exists
-    for user_id, user_data in users.items():
-        if user_data.get('email') == email:
-            return jsonify({'error': 'Email đã được đăng ký'}), 400
-    
-    # Generate new user ID
-    if account_type == 'partner':
-        next_id = accounts.get('next_partner_id', 1)
-        user_id = f"partner#{str(next_id).zfill(5)}"
-        accounts['next_partner_id'] = next_id + 1
-    else:
-        next_id = accounts.get('next_user_id', 1)
-        user_id = f"user#{str(next_id).zfill(5)}"
-        accounts['next_user_id'] = next_id + 1
+    if account_field_taken('email', email, account_type=account_type):
+        return jsonify({'error': 'Email đã được đăng ký'}), 400
     
     # Random avatar for new user
     import random
@@ -323,23 +1165,15 @@ def register():
     
     random_avatar = random.choice(available_avatars) if available_avatars else 'default'
     
-    # Create new user
-    users[user_id] = {
-        'id': user_id,
+    # Create new user (the account id is generated by the storage layer)
+    user_id, _ = create_account(account_type, {
         'email': email,
         'username': username or '',
-        'password': generate_password_hash(password),
+        'password': PASSWORD_HASHER.generate(password),
         'account_type': account_type,
         'avatar': random_avatar,
         'created_at': datetime.utcnow().isoformat()
-    }
-    
-    if account_type == 'partner':
-        accounts['partners'] = users
-        save_json(PARTNER_ACCOUNTS_FILE, accounts, subfolder=None)
-    else:
-        accounts['users'] = users
-        save_json(USER_ACCOUNTS_FILE, accounts, subfolder=None)
+    })
     
     token = generate_token(user_id)
     return jsonify({
@@ -364,63 +1198,24 @@ def login():
     if not email_or_username or not password:
         return jsonify({'error': 'Email/username và password là bắt buộc'}), 400
     
-    # Try user accounts first
-    user_accounts = load_json(USER_ACCOUNTS_FILE, subfolder=None)
-    users = user_accounts.get('users', {})
-    
-    user = None
-    user_id = None
-    
-    # Find in user accounts
-    for uid, user_data in users.items():
-        if (user_data.get('email') == email_or_username or 
-            user_data.get('username') == email_or_username or 
-            uid == email_or_username):
-            user = user_data
-            user_id = uid
-            break
-    
-    # If not found, try partner accounts
-    if not user:
-        partner_accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
-        partners = partner_accounts.get('partners', {})
-        
-        for uid, user_data in partners.items():
-            if (user_data.get('email') == email_or_username or 
-                user_data.get('username') == email_or_username or 
-                uid == email_or_username):
-                user = user_data
-                user_id = uid
-                break
+    # Find in user accounts first, then partner accounts
+    user_id, user = find_account(email_or_username)
     
     if not user:
         return jsonify({'error': 'Thông tin đăng nhập không đúng'}), 401
     
-    # Verify password
+    # Verify password (hashed check first)
     stored_pw = user.get('password', '')
-    is_valid = False
-    try:
-        # Try hashed check first
-        is_valid = check_password_hash(stored_pw, password)
-    except Exception:
-        is_valid = False
+    is_valid = PASSWORD_HASHER.check(stored_pw, password)
 
     # Fallback: if stored password is plaintext, compare directly
     if not is_valid:
         if not isinstance(stored_pw, str) or not stored_pw.startswith('pbkdf2:'):
             if stored_pw == password:
                 is_valid = True
-                # Auto-upgrade to hashed password
-                if user.get('account_type') == 'partner':
-                    partner_accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
-                    if 'partners' in partner_accounts and user_id in partner_accounts['partners']:
-                        partner_accounts['partners'][user_id]['password'] = generate_password_hash(password)
-                        save_json(PARTNER_ACCOUNTS_FILE, partner_accounts, subfolder=None)
-                else:
-                    user_accounts = load_json(USER_ACCOUNTS_FILE, subfolder=None)
-                    if 'users' in user_accounts and user_id in user_accounts['users']:
-                        user_accounts['users'][user_id]['password'] = generate_password_hash(password)
-                        save_json(USER_ACCOUNTS_FILE, user_accounts, subfolder=None)
+                # Auto-upgrade to hashed password (on a copy, the loaded record is shared)
+                user = dict(user, password=PASSWORD_HASHER.generate(password))
+                save_account(user_id, user)
 
     if not is_valid:
         return jsonify({'error': 'Thông tin đăng nhập không đúng'}), 401
@@ -441,8 +1236,7 @@ def login():
 # Get ratings for a property
 @app.route('/api/ratings/<property_id>', methods=['GET'])
 def get_ratings(property_id):
-    ratings = load_json(RATINGS_FILE)
-    property_ratings = ratings.get(property_id, [])
+    property_ratings = get_property_ratings(property_id)
     
     if not property_ratings:
         return jsonify({'average': 0, 'count': 0, 'ratings': []}), 200
@@ -458,12 +1252,9 @@ def get_ratings(property_id):
 
 # Add or update rating
 @app.route('/api/ratings/<property_id>', methods=['POST'])
+@require_auth()
 def add_rating(property_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
     data = request.get_json()
     rating = data.get('rating')
@@ -471,50 +1262,28 @@ def add_rating(property_id):
     if not rating or not isinstance(rating, int) or rating < 1 or rating > 5:
         return jsonify({'error': 'Rating phải từ 1 đến 5'}), 400
     
-    ratings = load_json(RATINGS_FILE)
-    
-    if property_id not in ratings:
-        ratings[property_id] = []
-    
-    # Check if user already rated
-    user_rating = next((r for r in ratings[property_id] if r['user_id'] == user_id), None)
-    
-    if user_rating:
-        user_rating['rating'] = rating
-        user_rating['updated_at'] = datetime.utcnow().isoformat()
-    else:
-        ratings[property_id].append({
-            'user_id': user_id,
-            'rating': rating,
-            'created_at': datetime.utcnow().isoformat()
-        })
-    
-    save_json(RATINGS_FILE, ratings)
+    save_rating(property_id, user_id, rating)
     
     return jsonify({'message': 'Đánh giá thành công'}), 200
 
 # Get comments for a property
 @app.route('/api/comments/<property_id>', methods=['GET'])
 def get_comments(property_id):
-    comments = load_json(COMMENTS_FILE)
-    property_comments = comments.get(property_id, [])
+    property_comments = get_property_comments(property_id)
     
-    # Get user info for each comment
-    all_users = load_all_accounts()
+    # Get user info for each comment (on copies, the loaded comments are shared)
+    property_comments = [dict(comment) for comment in property_comments]
     for comment in property_comments:
-        user = all_users.get(comment['user_id'], {})
+        user = get_account(comment['user_id']) or {}
         comment['username'] = user.get('username') or comment['user_id']
     
     return jsonify(property_comments), 200
 
 # Add comment
 @app.route('/api/comments/<property_id>', methods=['POST'])
+@require_auth()
 def add_comment(property_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
     data = request.get_json()
     text = data.get('text', '').strip()
@@ -523,13 +1292,7 @@ def add_comment(property_id):
     if not text:
         return jsonify({'error': 'Comment không được để trống'}), 400
     
-    comments = load_json(COMMENTS_FILE)
-    
-    if property_id not in comments:
-        comments[property_id] = []
-    
-    all_users = load_all_accounts()
-    user = all_users.get(user_id, {})
+    user = g.user or {}
     
     new_comment = {
         'user_id': user_id,
@@ -539,72 +1302,47 @@ def add_comment(property_id):
         'created_at': datetime.utcnow().isoformat()
     }
     
-    comments[property_id].append(new_comment)
-    save_json(COMMENTS_FILE, comments)
+    insert_comment(property_id, new_comment)
     
     return jsonify(new_comment), 201
 
 # Get user favorites
 @app.route('/api/favorites', methods=['GET'])
+@require_auth()
 def get_favorites():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
-    favorites = load_json(FAVORITES_FILE)
-    user_favorites = favorites.get(user_id, [])
+    user_favorites = get_user_favorites(user_id)
     
     return jsonify(user_favorites), 200
 
 # Add to favorites
 @app.route('/api/favorites/<property_id>', methods=['POST'])
+@require_auth()
 def add_favorite(property_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    favorites = load_json(FAVORITES_FILE)
+    user_id = g.user_id
     
-    if user_id not in favorites:
-        favorites[user_id] = []
-    
-    if property_id not in favorites[user_id]:
-        favorites[user_id].append(property_id)
-        save_json(FAVORITES_FILE, favorites)
+    if add_user_favorite(user_id, property_id):
         return jsonify({'message': 'Đã thêm vào yêu thích'}), 200
     
     return jsonify({'message': 'Đã có trong danh sách yêu thích'}), 200
 
 # Remove from favorites
 @app.route('/api/favorites/<property_id>', methods=['DELETE'])
+@require_auth()
 def remove_favorite(property_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
-    favorites = load_json(FAVORITES_FILE)
-    
-    if user_id in favorites and property_id in favorites[user_id]:
-        favorites[user_id].remove(property_id)
-        save_json(FAVORITES_FILE, favorites)
+    if remove_user_favorite(user_id, property_id):
         return jsonify({'message': 'Đã xóa khỏi yêu thích'}), 200
     
     return jsonify({'message': 'Không tìm thấy trong danh sách yêu thích'}), 404
 
 # Get search history
 @app.route('/api/search-history', methods=['GET'])
+@require_auth()
 def get_search_history():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
     history = load_json(SEARCH_HISTORY_FILE)
     user_history = history.get(user_id, [])
@@ -613,12 +1351,9 @@ def get_search_history():
 
 # Add to search history
 @app.route('/api/search-history', methods=['POST'])
+@require_auth()
 def add_search_history():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    user_id = verify_token(token)
-    
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = g.user_id
     
     data = request.get_json()
     search_data = {
@@ -628,30 +1363,21 @@ def add_search_history():
         'timestamp': datetime.utcnow().isoformat()
     }
     
-    history = load_json(SEARCH_HISTORY_FILE)
-    
-    if user_id not in history:
-        history[user_id] = []
-    
-    # Add to beginning and limit to 50 items
-    history[user_id].insert(0, search_data)
-    history[user_id] = history[user_id][:50]
-    
-    save_json(SEARCH_HISTORY_FILE, history)
+    with json_transaction(SEARCH_HISTORY_FILE) as history:
+        if user_id not in history:
+            history[user_id] = []
+        
+        # Add to beginning and limit to 50 items
+        history[user_id].insert(0, search_data)
+        history[user_id] = history[user_id][:50]
     
     return jsonify({'message': 'Đã lưu lịch sử tìm kiếm'}), 200
 
 # Get favorites with details
 @app.route('/api/favorites/<user_id>', methods=['GET'])
+@require_auth(owner_arg='user_id')
 def get_favorites_with_details(user_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    favorites = load_json(FAVORITES_FILE)
-    user_favorites = favorites.get(user_id, [])
+    user_favorites = get_user_favorites(user_id)
     
     # Load properties data to get details
     try:
@@ -682,31 +1408,17 @@ def get_favorites_with_details(user_id):
 
 # Remove from favorites (with user_id)
 @app.route('/api/favorites/<user_id>/<property_id>', methods=['DELETE'])
+@require_auth(owner_arg='user_id')
 def remove_favorite_v2(user_id, property_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    favorites = load_json(FAVORITES_FILE)
-    
-    if user_id in favorites and property_id in favorites[user_id]:
-        favorites[user_id].remove(property_id)
-        save_json(FAVORITES_FILE, favorites)
+    if remove_user_favorite(user_id, property_id):
         return jsonify({'message': 'Đã xóa khỏi yêu thích'}), 200
     
     return jsonify({'message': 'Không tìm thấy trong danh sách yêu thích'}), 404
 
 # Get search history (with user_id)
 @app.route('/api/search-history/<user_id>', methods=['GET'])
+@require_auth(owner_arg='user_id')
 def get_search_history_v2(user_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     history = load_json(SEARCH_HISTORY_FILE)
     user_history = history.get(user_id, [])
     
@@ -714,31 +1426,19 @@ def get_search_history_v2(user_id):
 
 # Remove from search history
 @app.route('/api/search-history/<user_id>/<history_id>', methods=['DELETE'])
+@require_auth(owner_arg='user_id')
 def remove_search_history(user_id, history_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
+    if user_id not in load_json(SEARCH_HISTORY_FILE):
+        return jsonify({'message': 'Không tìm thấy'}), 404
     
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    history = load_json(SEARCH_HISTORY_FILE)
-    
-    if user_id in history:
-        history[user_id] = [item for item in history[user_id] if item.get('id') != history_id]
-        save_json(SEARCH_HISTORY_FILE, history)
-        return jsonify({'message': 'Đã xóa khỏi lịch sử'}), 200
-    
-    return jsonify({'message': 'Không tìm thấy'}), 404
+    with json_transaction(SEARCH_HISTORY_FILE) as history:
+        history[user_id] = [item for item in history.get(user_id, []) if item.get('id') != history_id]
+    return jsonify({'message': 'Đã xóa khỏi lịch sử'}), 200
 
 # Update user username
 @app.route('/api/user/<user_id>/update-username', methods=['PUT'])
+@require_auth(owner_arg='user_id')
 def update_username(user_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     data = request.get_json()
     new_username = data.get('username', '').strip()
     
@@ -748,15 +1448,13 @@ def update_username(user_id):
     if len(new_username) < 2:
         return jsonify({'message': 'Tên đăng nhập phải có ít nhất 2 ký tự'}), 400
     
-    all_users = load_all_accounts()
-    
     # Check if username already exists (by other users)
-    for uid, user_data in all_users.items():
-        if uid != user_id and user_data.get('username') == new_username:
-            return jsonify({'message': 'Tên đăng nhập đã tồn tại'}), 400
+    if account_field_taken('username', new_username, exclude_id=user_id):
+        return jsonify({'message': 'Tên đăng nhập đã tồn tại'}), 400
     
-    if user_id in all_users:
-        user_data = all_users[user_id]
+    user_data = g.user
+    if user_data:
+        user_data = dict(user_data)  # the loaded record is shared
         user_data['username'] = new_username
         save_account(user_id, user_data)
         return jsonify({'message': 'Cập nhật tên đăng nhập thành công'}), 200
@@ -765,13 +1463,8 @@ def update_username(user_id):
 
 # Update user email
 @app.route('/api/user/<user_id>/update-email', methods=['PUT'])
+@require_auth(owner_arg='user_id')
 def update_email(user_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     data = request.get_json()
     new_email = data.get('email', '').strip()
     
@@ -782,15 +1475,13 @@ def update_email(user_id):
     if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', new_email):
         return jsonify({'message': 'Email không hợp lệ'}), 400
     
-    all_users = load_all_accounts()
-    
     # Check if email already exists (by other users)
-    for uid, user_data in all_users.items():
-        if uid != user_id and user_data.get('email') == new_email:
-            return jsonify({'message': 'Email đã được đăng ký'}), 400
+    if account_field_taken('email', new_email, exclude_id=user_id):
+        return jsonify({'message': 'Email đã được đăng ký'}), 400
     
-    if user_id in all_users:
-        user_data = all_users[user_id]
+    user_data = g.user
+    if user_data:
+        user_data = dict(user_data)  # the loaded record is shared
         user_data['email'] = new_email
         save_account(user_id, user_data)
         return jsonify({'message': 'Cập nhật email thành công'}), 200
@@ -799,13 +1490,8 @@ def update_email(user_id):
 
 # Update user password
 @app.route('/api/user/<user_id>/update-password', methods=['PUT'])
+@require_auth(owner_arg='user_id')
 def update_password(user_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    current_user_id = verify_token(token)
-    
-    if not current_user_id or current_user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     data = request.get_json()
     current_password = data.get('current_password')
     new_password = data.get('new_password')
@@ -816,35 +1502,29 @@ def update_password(user_id):
     if len(new_password) < 6:
         return jsonify({'message': 'Mật khẩu phải có ít nhất 6 ký tự'}), 400
     
-    all_users = load_all_accounts()
+    user = g.user
     
-    if user_id not in all_users:
+    if not user:
         return jsonify({'message': 'Người dùng không tồn tại'}), 404
     
-    user = all_users[user_id]
-    
     # Verify current password
-    try:
-        is_valid = check_password_hash(user.get('password', ''), current_password)
-    except:
-        is_valid = False
+    is_valid = PASSWORD_HASHER.check(user.get('password', ''), current_password)
     
     if not is_valid:
         return jsonify({'message': 'Mật khẩu hiện tại không đúng'}), 401
     
-    # Update password
-    user['password'] = generate_password_hash(new_password)
+    # Update password (on a copy, the loaded record is shared)
+    user = dict(user)
+    user['password'] = PASSWORD_HASHER.generate(new_password)
     save_account(user_id, user)
     
     return jsonify({'message': 'Cập nhật mật khẩu thành công'}), 200
 
 # Update user avatar
 @app.route('/api/user/avatar', methods=['PUT'])
+@require_auth()
 def update_avatar():
-    user_id = get_user_id_from_token()
-    
-    if not user_id:
-        return jsonify({'message': 'Unauthorized'}), 401
+    user_id = g.user_id
     
     data = request.get_json()
     avatar = data.get('avatar')
@@ -852,14 +1532,13 @@ def update_avatar():
     if not avatar:
         return jsonify({'message': 'Avatar is required'}), 400
     
-    all_users = load_all_accounts()
+    user = g.user
     
-    if user_id not in all_users:
+    if not user:
         return jsonify({'message': 'Người dùng không tồn tại'}), 404
     
-    user = all_users[user_id]
-    
-    # Update avatar
+    # Update avatar (on a copy, the loaded record is shared)
+    user = dict(user)
     user['avatar'] = avatar
     save_account(user_id, user)
     
@@ -872,6 +1551,120 @@ def update_avatar():
 # CHATBOT WITH GOOGLE GEMINI AI
 # ============================================
 
+# Answers from Gemini/OpenAI are cached for CHAT_CACHE_TTL seconds (up to CHAT_CACHE_SIZE
+# entries), keyed by the normalized question, the property context and the last
+# CHAT_CACHE_HISTORY turns of the conversation
+CHAT_CACHE = ChatCache(
+    max_entries=int(os.getenv('CHAT_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('CHAT_CACHE_TTL', '3600')),
+    history_turns=int(os.getenv('CHAT_CACHE_HISTORY', '2'))
+)
+
+# The prompt gets the CHAT_CONTEXT_LISTINGS listings most similar to the question, found by
+# cosine similarity over precomputed listing vectors (PhoBERT from ai_model/AutoFeatureTags
+# when torch/transformers are installed, hashed word vectors otherwise)
+CHAT_CONTEXT_LISTINGS = int(os.getenv('CHAT_CONTEXT_LISTINGS', '3'))
+CHAT_CONTEXT_MIN_SCORE = float(os.getenv('CHAT_CONTEXT_MIN_SCORE', '0.05'))
+LISTING_RETRIEVER = ListingRetriever(
+    app.config['DATA_DIR'],
+    encoder=os.getenv('CHAT_RETRIEVAL_ENCODER', 'auto'),
+    checkpoint=os.getenv('PHOBERT_CHECKPOINT') or None
+)
+
+CHAT_SUGGESTION_KEYWORDS = ['gợi ý', 'gợi ý phòng', 'tư vấn phòng', 'đề xuất', 'đề xuất phòng', 'phòng nào tốt', 'phòng nào phù hợp', 'suggest', 'recommend']
+
+def parse_chat_request():
+    """(message, conversation_history, None) or (None, None, error response) for a chat request"""
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict) or 'message' not in data:
+        return None, None, (jsonify({
+            'error': 'Message is required',
+            'response': 'Bạn chưa nhập câu hỏi. Hãy hỏi tôi về phòng trọ nhé! 😊'
+        }), 400)
+    
+    message = str(data.get('message') or '').strip()
+    
+    # Keep only well-formed turns: {"role": ..., "content": ...}
+    history = data.get('conversationHistory')
+    conversation_history = [
+        {'role': str(turn.get('role', '')), 'content': str(turn.get('content', ''))}
+        for turn in (history if isinstance(history, list) else [])
+        if isinstance(turn, dict)
+    ]
+    
+    if not message:
+        return None, None, (jsonify({
+            'error': 'Message cannot be empty',
+            'response': 'Bạn chưa nhập câu hỏi. Hãy hỏi tôi về phòng trọ nhé! 😊'
+        }), 400)
+    
+    return message, conversation_history, None
+
+def chat_suggestion_reply(message):
+    """Room suggestion requests are handled by the frontend (old chatbot logic), not the AI"""
+    if not any(keyword in message.lower() for keyword in CHAT_SUGGESTION_KEYWORDS):
+        return None
+    # Return a message asking user to use the suggestion feature on frontend
+    return {
+        'success': True,
+        'response': 'Mình có thể giúp bạn tìm phòng phù hợp! Bạn muốn tìm phòng ở khu vực nào? Giá khoảng bao nhiêu? Hoặc bạn có thể dùng tính năng Tìm kiếm và Bộ lọc ở trang chủ để xem các phòng phù hợp nhất nhé! 🏠✨',
+        'model': 'fallback',
+        'needsSuggestion': True
+    }
+
+def listing_retriever():
+    """The chat retrieval index, synced with the current data.json"""
+    version = catalog_version()
+    if version != LISTING_RETRIEVER.version:
+        LISTING_RETRIEVER.sync(load_json('data.json', subfolder=None), version)
+    return LISTING_RETRIEVER
+
+def chat_property_context(message):
+    """The listings closest to the question (top CHAT_CONTEXT_LISTINGS), for the prompt"""
+    property_data_context = ""
+    if not CHAT_PROVIDER:
+        return property_data_context
+    try:
+        matches = listing_retriever().search(message, k=CHAT_CONTEXT_LISTINGS, min_score=CHAT_CONTEXT_MIN_SCORE)
+        if matches:
+            property_data_context = "\n\n🏠 THÔNG TIN MỘT SỐ PHÒNG:\n"
+            for prop, _ in matches:
+                title = prop.get('title', 'N/A')
+                loai = prop.get('loai', 'N/A')
+                price = prop.get('price', '').replace('<strong>Giá:</strong> ', '')
+                address = plain_text(prop.get('address', ''))
+                area = f" - {prop.get('area')}m²" if prop.get('area') else ''
+                
+                property_data_context += f"\n• {title} ({loai}) - {price}{area} - {address}"
+    except Exception as e:
+        print(f'⚠️ Could not load property data: {e}')
+    return property_data_context
+
+if CHAT_PROVIDER:
+    # Load the encoder and encode the catalog in the background so the first chat doesn't wait
+    threading.Thread(target=listing_retriever, name='listing retriever warm-up', daemon=True).start()
+
+# Prompts are fitted into CHAT_PROMPT_TOKENS (estimated) tokens: the question and property
+# context are clipped, then as many recent turns as fit are kept and older ones summarized
+CHAT_PROMPT_BUDGET = PromptBudget(
+    CHATBOT_SYSTEM_PROMPT,
+    max_tokens=int(os.getenv('CHAT_PROMPT_TOKENS', '2500')),
+    context_tokens=int(os.getenv('CHAT_CONTEXT_TOKENS', '400')),
+    history_turns=int(os.getenv('CHAT_HISTORY_TURNS', '5'))
+)
+
+def chat_fallback_reply(message, error=None):
+    """Tell the frontend to answer with the old (FAQ) chatbot instead"""
+    reply = {
+        'success': False,
+        'needsFallback': True,
+        'originalMessage': message
+    }
+    if error is not None:
+        reply['error'] = error
+    return reply
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """
@@ -890,219 +1683,171 @@ def chat():
     {
         "success": true,
         "response": "Giá phòng từ 1.5 - 3 triệu/tháng nhé! 😊",
-        "model": "gemini-1.5-flash"
+        "model": "gemini-1.5-flash",
+        "cached": false
     }
     """
+    message = None
     try:
-        # Get request data
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
-            return jsonify({
-                'error': 'Message is required',
-                'response': 'Bạn chưa nhập câu hỏi. Hãy hỏi tôi về phòng trọ nhé! 😊'
-            }), 400
-        
-        message = data.get('message', '').strip()
-        conversation_history = data.get('conversationHistory', [])
-        
-        if not message:
-            return jsonify({
-                'error': 'Message cannot be empty',
-                'response': 'Bạn chưa nhập câu hỏi. Hãy hỏi tôi về phòng trọ nhé! 😊'
-            }), 400
+        message, conversation_history, error_response = parse_chat_request()
+        if error_response:
+            return error_response
         
         # Check if user is asking for room suggestions - FALLBACK to old chatbot logic
-        suggestion_keywords = ['gợi ý', 'gợi ý phòng', 'tư vấn phòng', 'đề xuất', 'đề xuất phòng', 'phòng nào tốt', 'phòng nào phù hợp', 'suggest', 'recommend']
-        is_asking_suggestions = any(keyword in message.lower() for keyword in suggestion_keywords)
-        
-        if is_asking_suggestions:
-            # Return a message asking user to use the suggestion feature on frontend
-            return jsonify({
-                'success': True,
-                'response': 'Mình có thể giúp bạn tìm phòng phù hợp! Bạn muốn tìm phòng ở khu vực nào? Giá khoảng bao nhiêu? Hoặc bạn có thể dùng tính năng Tìm kiếm và Bộ lọc ở trang chủ để xem các phòng phù hợp nhất nhé! 🏠✨',
-                'model': 'fallback',
-                'needsSuggestion': True
-            })
+        suggestion_reply = chat_suggestion_reply(message)
+        if suggestion_reply:
+            return jsonify(suggestion_reply)
         
         # Load property data for context (but not for suggestions)
-        property_data_context = ""
-        try:
-            data_file = os.path.join(app.config['DATA_DIR'], 'data.json')
-            if os.path.exists(data_file):
-                with open(data_file, 'r', encoding='utf-8') as f:
-                    properties = json.load(f)
-                    
-                # Build property list for context (only if user asks about specific rooms by name)
-                specific_room_keywords = ['suha', 'ktxbc', 'minh anh', 'hkl', 'nha tro', 'duy phat']
-                if any(keyword in message.lower() for keyword in specific_room_keywords):
-                    property_data_context = "\n\n🏠 THÔNG TIN MỘT SỐ PHÒNG:\n"
-                    for prop in properties[:5]:  # Limit to 5 properties
-                        title = prop.get('title', 'N/A')
-                        loai = prop.get('loai', 'N/A')
-                        price = prop.get('price', '').replace('<strong>Giá:</strong> ', '')
-                        
-                        property_data_context += f"\n• {title} ({loai}) - {price}"
-        except Exception as e:
-            print(f'⚠️ Could not load property data: {e}')
-        
-        # Choose AI model based on configuration
-        if USE_OPENAI and OPENAI_API_KEY:
-            # Use OpenAI GPT
-            try:
-                import openai
-                
-                # Build conversation messages
-                messages = [
-                    {"role": "system", "content": CHATBOT_SYSTEM_PROMPT}
-                ]
-                
-                # Add conversation history (last 5 messages)
-                if conversation_history:
-                    recent_history = conversation_history[-5:]
-                    for msg in recent_history:
-                        role = 'user' if msg.get('role') == 'user' else 'assistant'
-                        content = msg.get('content', '')
-                        messages.append({"role": role, "content": content})
-                
-                # Add current message
-                messages.append({"role": "user", "content": message})
-                
-                # Call OpenAI API
-                response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",  # or "gpt-4" for better quality
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                
-                bot_reply = response.choices[0].message.content
-                print(f'✅ OpenAI GPT called successfully. Message: "{message[:50]}..."')
-                
-                return jsonify({
-                    'success': True,
-                    'response': bot_reply,
-                    'model': 'gpt-3.5-turbo'
-                })
-                
-            except Exception as e:
-                print(f'❌ OpenAI API error: {str(e)}')
-                return jsonify({
-                    'error': 'OpenAI API error',
-                    'response': f'Lỗi kết nối OpenAI: {str(e)}'
-                }), 500
-        
-        elif GEMINI_API_KEY:
-            # Use Google Gemini (existing code)
-            # Initialize Gemini model
-            model = genai.GenerativeModel(
-                'gemini-2.5-flash',
-                generation_config={
-                    'temperature': 0.7,
-                    'top_k': 40,
-                    'top_p': 0.95,
-                    'max_output_tokens': 500,
-                }
-            )
-            
-            # Build conversation context
-            full_prompt = CHATBOT_SYSTEM_PROMPT + property_data_context + '\n\n'
-            
-            # Add conversation history (last 5 messages)
-            if conversation_history:
-                recent_history = conversation_history[-5:]
-                full_prompt += 'LỊCH SỬ HỘI THOẠI:\n'
-                for msg in recent_history:
-                    role = 'Khách' if msg.get('role') == 'user' else 'Bạn'
-                    content = msg.get('content', '')
-                    full_prompt += f'{role}: {content}\n'
-                full_prompt += '\n'
-            
-            full_prompt += f'KHÁCH HỎI: {message}\n\nTRẢ LỜI:'
-            
-            # Call Gemini API
-            response = model.generate_content(
-                full_prompt,
-                safety_settings=[
-                    {
-                        "category": "HARM_CATEGORY_HARASSMENT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_HATE_SPEECH",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                ]
-            )
-            
-            # Check if response has valid content
-            if not response.candidates:
-                print('⚠️ Gemini returned no candidates - Fallback to old chatbot')
-                return jsonify({
-                    'success': False,
-                    'needsFallback': True,
-                    'originalMessage': message
-                })
-            
-            candidate = response.candidates[0]
-            
-            # Check finish reason
-            if candidate.finish_reason != 1:  # 1 = STOP (normal completion)
-                print(f'⚠️ Gemini finish_reason: {candidate.finish_reason} - Fallback to old chatbot')
-                return jsonify({
-                    'success': False,
-                    'needsFallback': True,
-                    'originalMessage': message
-                })
-            
-            # Extract text from response
-            try:
-                if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                    bot_reply = candidate.content.parts[0].text
-                else:
-                    bot_reply = response.text
-            except Exception as extract_error:
-                print(f'⚠️ Error extracting text: {extract_error} - Fallback to old chatbot')
-                return jsonify({
-                    'success': False,
-                    'needsFallback': True,
-                    'originalMessage': message
-                })
-            
-            print(f'✅ Gemini API called successfully. Message: "{message[:50]}..."')
-            
+        property_data_context = chat_property_context(message)
+        
+        # Repeated questions (same wording, context and recent turns) are answered from cache
+        cache_key = CHAT_CACHE.key(message, property_data_context, conversation_history)
+        cached = CHAT_CACHE.get(cache_key)
+        if cached:
+            bot_reply, model_name = cached
+            print(f'✅ Chat answer served from cache. Message: "{message[:50]}..."')
             return jsonify({
                 'success': True,
                 'response': bot_reply,
-                'model': 'gemini-2.5-flash'
+                'model': model_name,
+                'cached': True
             })
-        else:
+        
+        if not CHAT_PROVIDER:
             # No API key configured - fallback to old chatbot
             print('❌ No AI API key found - Fallback to old chatbot')
-            return jsonify({
-                'success': False,
-                'needsFallback': True,
-                'originalMessage': message
-            })
+            return jsonify(chat_fallback_reply(message))
+        
+        prompt = CHAT_PROMPT_BUDGET.fit(message, conversation_history, property_data_context)
+        try:
+            bot_reply = CHAT_PROVIDER.reply(prompt)
+        except (NeedsFallback, LLMBusy) as e:
+            print(f'⚠️ {e} - Fallback to old chatbot')
+            return jsonify(chat_fallback_reply(message))
+        
+        print(f'✅ {CHAT_PROVIDER.name} called successfully. Message: "{message[:50]}..."')
+        CHAT_CACHE.put(cache_key, bot_reply, CHAT_PROVIDER.model)
+        
+        return jsonify({
+            'success': True,
+            'response': bot_reply,
+            'model': CHAT_PROVIDER.model,
+            'cached': False
+        })
     
     except Exception as e:
-        print(f'❌ Error calling Gemini API: {str(e)} - Fallback to old chatbot')
+        provider_name = CHAT_PROVIDER.name if CHAT_PROVIDER else 'AI'
+        print(f'❌ Error calling {provider_name} API: {str(e)} - Fallback to old chatbot')
         
         # Return fallback signal instead of error
-        return jsonify({
-            'success': False,
-            'needsFallback': True,
-            'originalMessage': message,
-            'error': str(e)
-        })
+        return jsonify(chat_fallback_reply(message, str(e)))
+
+def sse_event(event, payload):
+    """One Server-Sent Events frame with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat (Server-Sent Events), same request JSON.
+    
+    Sends `token` events with each piece of the answer as the model generates it:
+        event: token
+        data: {"text": "Giá phòng "}
+    and always ends with one `done` event whose data is what /api/chat would return
+    ({"success": true, "response": <full answer>, ...} or {"needsFallback": true, ...}).
+    Text already streamed is superseded by a `done` event carrying needsFallback.
+    """
+    message, conversation_history, error_response = parse_chat_request()
+    if error_response:
+        return error_response
+    
+    def generate():
+        try:
+            suggestion_reply = chat_suggestion_reply(message)
+            property_data_context = '' if suggestion_reply else chat_property_context(message)
+            cache_key = CHAT_CACHE.key(message, property_data_context, conversation_history)
+        except Exception as e:
+            print(f'❌ Error preparing chat answer: {str(e)} - Fallback to old chatbot')
+            yield sse_event('done', chat_fallback_reply(message, str(e)))
+            return
+        
+        if suggestion_reply:
+            yield sse_event('done', suggestion_reply)
+            return
+        
+        cached = CHAT_CACHE.get(cache_key)
+        if cached:
+            bot_reply, model_name = cached
+            yield sse_event('token', {'text': bot_reply})
+            yield sse_event('done', {'success': True, 'response': bot_reply, 'model': model_name, 'cached': True})
+            return
+        
+        if not CHAT_PROVIDER:
+            print('❌ No AI API key found - Fallback to old chatbot')
+            yield sse_event('done', chat_fallback_reply(message))
+            return
+        
+        prompt = CHAT_PROMPT_BUDGET.fit(message, conversation_history, property_data_context)
+        parts = []
+        try:
+            for text in CHAT_PROVIDER.stream_reply(prompt):
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+        except (NeedsFallback, LLMBusy) as e:
+            print(f'⚠️ {e} - Fallback to old chatbot')
+            yield sse_event('done', chat_fallback_reply(message))
+            return
+        except Exception as e:
+            print(f'❌ Error streaming chat answer: {str(e)} - Fallback to old chatbot')
+            yield sse_event('done', chat_fallback_reply(message, str(e)))
+            return
+        
+        bot_reply = ''.join(parts)
+        if not bot_reply:
+            yield sse_event('done', chat_fallback_reply(message))
+            return
+        
+        print(f'✅ Chat answer streamed ({CHAT_PROVIDER.name}). Message: "{message[:50]}..."')
+        CHAT_CACHE.put(cache_key, bot_reply, CHAT_PROVIDER.model)
+        yield sse_event('done', {'success': True, 'response': bot_reply, 'model': CHAT_PROVIDER.model, 'cached': False})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # don't let a reverse proxy buffer the stream
+    })
+
+# /api/metrics exposes internals (file paths, queues, presence), so it is off unless
+# METRICS_TOKEN is set and then requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime counters for performance monitoring"""
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    auth = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth.encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({
+        'document_store': DOCUMENT_STORE.stats(),
+        'view_counter': VIEW_COUNTER.stats(),
+        'visitors': dict(VISITOR_TRACKER.stats(), unique=UNIQUE_VISITORS.count(), counter=VISIT_COUNTER.stats(),
+                         stream=VISITOR_BROADCAST.stats()),
+        'response_cache': RESPONSE_CACHE.stats(),
+        'property_index': PROPERTY_INDEX.stats(),
+        'account_directory': ACCOUNT_DIRECTORY.stats(),
+        'booking_index': BOOKING_INDEX.stats(),
+        'visit_slots': BOOKING_INDEX.slots.stats(),
+        'password_hasher': PASSWORD_HASHER.stats(),
+        'token_cache': TOKEN_CACHE.stats(),
+        'chat_cache': CHAT_CACHE.stats(),
+        'llm': {CHAT_PROVIDER.name: CHAT_PROVIDER.stats()} if CHAT_PROVIDER else {},
+        'listing_retriever': LISTING_RETRIEVER.stats(),
+        'prompt_budget': CHAT_PROMPT_BUDGET.stats()
+    }), 200
 
 @app.route('/api/health', methods=['GET'])
 def health():
@@ -1118,13 +1863,83 @@ def health():
 # VISITOR TRACKING (Realtime)
 # ============================================
 
-# In-memory storage for online visitors (production should use Redis)
-online_visitors = {}
+# Online visitors: in memory by default (an expiry heap, so a ping costs amortized
+# O(log online) instead of a sweep of every online session). With several worker
+# processes set VISITOR_PRESENCE=sqlite so every worker counts the same sessions: a
+# shared SQLite table with TTL rows, heartbeats written every VISITOR_PRESENCE_FLUSH seconds
 VISITOR_TIMEOUT = 30  # seconds
+if os.getenv('VISITOR_PRESENCE', 'memory').lower() == 'sqlite':
+    VISITOR_TRACKER = SQLitePresence(
+        os.getenv('VISITOR_PRESENCE_PATH') or data_file_path('visitor_presence.db'),
+        timeout=VISITOR_TIMEOUT,
+        flush_interval=float(os.getenv('VISITOR_PRESENCE_FLUSH', '2'))
+    )
+    print(f'✅ Shared visitor presence: {VISITOR_TRACKER.db_path}')
+else:
+    VISITOR_TRACKER = VisitorTracker(timeout=VISITOR_TIMEOUT)
 
-# File to store total visits
+# File to store total visits and the unique visitor sketch
 VISITOR_FILE = 'visitor_stats.json'
-init_data_file(VISITOR_FILE, {'total_visits': 0, 'unique_visitors': []}, subfolder='backend')
+init_data_file(VISITOR_FILE, {'total_visits': 0}, subfolder='backend')
+
+# Unique visitors are estimated with a HyperLogLog sketch (fixed 4 KB) instead of a list of
+# every session id; ids from the old unique_visitors list are folded in once at startup
+_visitor_stats = load_json(VISITOR_FILE)
+UNIQUE_VISITORS = HyperLogLog.from_string(_visitor_stats.get('unique_sketch'))
+for _session_id in _visitor_stats.get('unique_visitors', []):
+    UNIQUE_VISITORS.add(_session_id)
+
+def flush_visits(deltas):
+    """Add buffered visits to visitor_stats.json and merge the unique sketch, in one write"""
+    def build_ops(stats):
+        # Other workers merge their sketches into the file too
+        UNIQUE_VISITORS.merge(HyperLogLog.from_string(stats.get('unique_sketch'), UNIQUE_VISITORS.precision))
+        ops = [('incr', ['total_visits'], deltas.get('total_visits', 0)),
+               ('set', ['unique_sketch'], UNIQUE_VISITORS.to_string())]
+        if 'unique_visitors' in stats:
+            ops.append(('delete', ['unique_visitors'], None))
+        return ops
+    update_json(VISITOR_FILE, build_ops)
+
+# New sessions are counted in memory and written every VISITOR_FLUSH_INTERVAL seconds,
+# after VISITOR_FLUSH_EVERY visits, and on shutdown
+VISIT_COUNTER = BufferedCounter(
+    flush_visits,
+    interval=float(os.getenv('VISITOR_FLUSH_INTERVAL', '10')),
+    max_pending=int(os.getenv('VISITOR_FLUSH_EVERY', '100')),
+    name='visit counter'
+)
+if 'unique_visitors' in _visitor_stats:
+    flush_visits({})  # replace the old list with the sketch
+
+def visitor_totals():
+    """(total visits, estimated unique visitors), including visits not yet written"""
+    total = load_json(VISITOR_FILE).get('total_visits', 0) + VISIT_COUNTER.pending('total_visits')
+    return total, UNIQUE_VISITORS.count()
+
+# Live counts for /api/visitor/stream: an open stream keeps its session online (the server
+# refreshes it every VISITOR_HEARTBEAT seconds, no client pings) and receives the counts
+# only when they change, at most once every VISITOR_PUSH_INTERVAL seconds. Each stream holds a
+# worker thread, so at most VISITOR_MAX_STREAMS are open per process (others get 503 and poll)
+# and a stream ends after VISITOR_STREAM_MAX_AGE seconds; the browser reconnects by itself.
+VISITOR_HEARTBEAT = float(os.getenv('VISITOR_HEARTBEAT', '15'))
+VISITOR_PUSH_INTERVAL = float(os.getenv('VISITOR_PUSH_INTERVAL', '1'))
+VISITOR_MAX_STREAMS = int(os.getenv('VISITOR_MAX_STREAMS', '32'))
+VISITOR_STREAM_MAX_AGE = float(os.getenv('VISITOR_STREAM_MAX_AGE', '300'))
+VISITOR_BROADCAST = StatsBroadcast(max_subscribers=VISITOR_MAX_STREAMS)
+
+def visitor_seen(session_id):
+    """Mark a session online; a session that wasn't online counts as a visit"""
+    if VISITOR_TRACKER.ping(session_id):
+        UNIQUE_VISITORS.add(session_id)
+        VISIT_COUNTER.increment('total_visits')
+
+def publish_visitor_stats():
+    """Current counts, pushed to live streams if they changed"""
+    total, unique = visitor_totals()
+    stats = {'online': VISITOR_TRACKER.online(), 'total': total, 'unique': unique}
+    VISITOR_BROADCAST.publish(stats)
+    return stats
 
 @app.route('/api/visitor/ping', methods=['POST'])
 def visitor_ping():
@@ -1134,42 +1949,64 @@ def visitor_ping():
     if not session_id:
         return jsonify({'error': 'Session ID required'}), 400
     
-    current_time = datetime.now()
-    
-    # Load visitor stats
-    visitor_stats = load_json(VISITOR_FILE)
-    
-    # Check if this is a new visitor
-    is_new_visitor = session_id not in online_visitors
+    # If new visitor, count the visit (expired sessions are dropped by the tracker)
+    visitor_seen(session_id)
     
-    # Update online visitors with timestamp
-    online_visitors[session_id] = current_time
-    
-    # If new visitor, increment total visits
-    if is_new_visitor:
-        visitor_stats['total_visits'] = visitor_stats.get('total_visits', 0) + 1
-        save_json(VISITOR_FILE, visitor_stats)
-    
-    # Clean up expired visitors (timeout after 30 seconds)
-    expired_sessions = [
-        sid for sid, timestamp in online_visitors.items()
-        if (current_time - timestamp).total_seconds() > VISITOR_TIMEOUT
-    ]
-    for sid in expired_sessions:
-        del online_visitors[sid]
+    return jsonify(publish_visitor_stats()), 200
+
+@app.route('/api/visitor/stream', methods=['GET'])
+def visitor_stream():
+    """
+    Live visitor counts over Server-Sent Events (replaces polling /api/visitor/ping).
+    Events: `stats` {online, total, unique} on connect and whenever the counts change;
+    a comment line every VISITOR_HEARTBEAT seconds otherwise. The stream ends after
+    VISITOR_STREAM_MAX_AGE seconds and 503 means too many streams are open.
+    """
+    session_id = request.args.get('sessionId')
+    if not session_id:
+        return jsonify({'error': 'Session ID required'}), 400
     
-    return jsonify({
-        'online': len(online_visitors),
-        'total': visitor_stats.get('total_visits', 0)
-    }), 200
+    if not VISITOR_BROADCAST.subscribe():
+        return jsonify({'error': 'Too many live streams'}), 503
+    
+    def generate():
+        deadline = time.monotonic() + VISITOR_STREAM_MAX_AGE
+        # Reconnect (EventSource does it by itself) a few seconds after the stream ends
+        yield 'retry: 3000\n\n'
+        version = None
+        while True:
+            # Wakes on every change or heartbeat: keep this session online, let expiries show
+            visitor_seen(session_id)
+            publish_visitor_stats()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            latest, stats = VISITOR_BROADCAST.wait(version, min(VISITOR_HEARTBEAT, remaining))
+            if latest == version:
+                yield ': heartbeat\n\n'
+                continue
+            version = latest
+            yield sse_event('stats', stats)
+            # Changes arriving meanwhile are sent together on the next wake
+            time.sleep(VISITOR_PUSH_INTERVAL)
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs even if the stream never started; a closed stream isn't a disconnect (it may
+    # reconnect): the session just expires
+    response.call_on_close(VISITOR_BROADCAST.unsubscribe)
+    return response
 
 @app.route('/api/visitor/disconnect', methods=['POST'])
 def visitor_disconnect():
-    data = request.get_json()
+    # navigator.sendBeacon posts the JSON as text/plain
+    data = request.get_json(force=True, silent=True) or {}
     session_id = data.get('sessionId')
     
-    if session_id and session_id in online_visitors:
-        del online_visitors[session_id]
+    if session_id and VISITOR_TRACKER.disconnect(session_id):
+        publish_visitor_stats()
     
     return jsonify({'status': 'ok'}), 200
 
@@ -1189,37 +2026,21 @@ def partner_login():
     if not email_or_username or not password:
         return jsonify({'error': 'Email/username và password là bắt buộc'}), 400
     
-    # Load partner accounts
-    partner_accounts = load_json(PARTNER_ACCOUNTS_FILE, subfolder=None)
-    partners = partner_accounts.get('partners', {})
-    
     # Find partner account
-    partner = None
-    partner_id = None
-    for pid, partner_data in partners.items():
-        if (partner_data.get('email') == email_or_username or 
-            partner_data.get('username') == email_or_username or 
-            pid == email_or_username):
-            partner = partner_data
-            partner_id = pid
-            break
+    partner_id, partner = find_account(email_or_username, account_type='partner')
     
     if not partner:
         return jsonify({'error': 'Tài khoản đối tác không tồn tại'}), 401
     
     # Verify password
     stored_pw = partner.get('password', '')
-    is_valid = False
-    try:
-        is_valid = check_password_hash(stored_pw, password)
-    except Exception:
-        is_valid = False
+    is_valid = PASSWORD_HASHER.check(stored_pw, password)
 
     # Fallback for plaintext passwords
     if not is_valid and stored_pw == password:
         is_valid = True
-        # Auto-upgrade to hashed password
-        partner['password'] = generate_password_hash(password)
+        # Auto-upgrade to hashed password (on a copy, the loaded record is shared)
+        partner = dict(partner, password=PASSWORD_HASHER.generate(password))
         save_account(partner_id, partner)
 
     if not is_valid:
@@ -1239,26 +2060,31 @@ def partner_login():
     }), 200
 
 @app.route('/api/partner/stats', methods=['GET'])
+@require_auth()
 def get_partner_stats():
     """Lấy thống kê cho partner dashboard"""
-    # Get partner_id from authorization header or query param
-    auth_header = request.headers.get('Authorization')
-    partner_id = request.args.get('partner_id')
-    
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(' ')[1]
-        partner_id = verify_token(token)
-    
-    if not partner_id:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    # Mock stats - replace with real data from database
+    # Only the partner itself may read its revenue and bookings
+    partner_id = g.user_id
+    if (g.user or {}).get('account_type') != 'partner' or request.args.get('partner_id', partner_id) != partner_id:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    # Precomputed aggregates (partner_stats.json) plus the views not flushed yet
+    partner_stats, pending_views = VIEW_COUNTER.read_consistent(lambda: load_json(PARTNER_STATS_FILE))
+    record = partner_stats.get('partners', {}).get(partner_id, EMPTY_PARTNER_STATS)
+    properties = partner_stats.get('properties', {})
+    unflushed_views = sum(delta for property_id, delta in pending_views.items()
+                          if properties.get(property_id, {}).get('partner_id') == partner_id)
+    
+    bookings_by_status = {field[len('bookings_'):]: count for field, count in record.items()
+                          if field.startswith('bookings_')}
     stats = {
-        'total_properties': 5,
-        'total_views': 1234,
-        'total_bookings': 12,
-        'total_revenue': 15000000,  # VND
-        'pending_bookings': 3
+        'total_properties': record['total_properties'],
+        'pending_properties': record['pending_properties'],
+        'total_views': record['total_views'] + unflushed_views,
+        'total_bookings': sum(bookings_by_status.values()),
+        'bookings_by_status': bookings_by_status,
+        'total_revenue': record['total_revenue'],  # VND, confirmed bookings
+        'pending_bookings': bookings_by_status.get('pending', 0)
     }
     
     return jsonify(stats), 200
@@ -1277,44 +2103,36 @@ def create_post():
         if not partner_id:
             return jsonify({'success': False, 'error': 'Partner ID required'}), 400
         
-        # Load pending posts
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        
-        # Create new post
-        post_id = posts_data.get('next_post_id', 1)
-        new_post = {
-            'id': post_id,
-            'partner_id': partner_id,
-            'title': data.get('title'),
-            'type': data.get('type'),
-            'price': data.get('price'),
-            'area': data.get('area'),
-            'max_people': data.get('max_people', 1),
-            'address': data.get('address'),
-            'district': data.get('district'),
-            'city': data.get('city'),
-            'distance': data.get('distance'),
-            'images': data.get('images', []),
-            'amenities': data.get('amenities', []),
-            'description': data.get('description'),
-            'status': 'pending',
-            'created_at': datetime.now().isoformat(),
-            'approved_at': None,
-            'approved_by': None,
-            'rejected_reason': None
-        }
-        
-        if 'posts' not in posts_data:
-            posts_data['posts'] = []
-        posts_data['posts'].append(new_post)
-        posts_data['next_post_id'] = post_id + 1
-        
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
+        # Create new post (the post id is generated by the storage layer); the stats lock keeps
+        # the post and its partner's aggregates in step with rebuild_partner_stats()
+        with json_lock(PARTNER_STATS_FILE):
+            new_post = insert_post({
+                'partner_id': partner_id,
+                'title': data.get('title'),
+                'type': data.get('type'),
+                'price': data.get('price'),
+                'area': data.get('area'),
+                'max_people': data.get('max_people', 1),
+                'address': data.get('address'),
+                'district': data.get('district'),
+                'city': data.get('city'),
+                'distance': data.get('distance'),
+                'images': data.get('images', []),
+                'amenities': data.get('amenities', []),
+                'description': data.get('description'),
+                'status': 'pending',
+                'created_at': datetime.now().isoformat(),
+                'approved_at': None,
+                'approved_by': None,
+                'rejected_reason': None
+            })
+            property_id = post_property_id(new_post['id'])
+            bump_partner_stats({property_id: {'pending_properties': 1}}, owners={property_id: partner_id})
         
         return jsonify({
             'success': True,
             'message': 'Tin đăng đã được gửi và đang chờ duyệt',
-            'post_id': post_id
+            'post_id': new_post['id']
         }), 201
         
     except Exception as e:
@@ -1327,21 +2145,21 @@ def get_posts():
         status = request.args.get('status', 'all')
         partner_id = request.args.get('partner_id')
         
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        if status != 'all':
-            posts = [p for p in posts if p.get('status') == status]
-        
-        if partner_id:
-            posts = [p for p in posts if p.get('partner_id') == partner_id]
+        try:
+            limit, after, fields = parse_page_args(request.args, NEWEST_FIRST_CURSOR)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Tham số phân trang không hợp lệ'}), 400
         
-        posts.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # One extra post tells whether another page follows
+        posts = query_posts(status=None if status == 'all' else status, partner_id=partner_id,
+                            after=after, limit=limit + 1 if limit else None)
+        posts, next_cursor = page_newest_first(posts, limit, None)
         
         return jsonify({
             'success': True,
-            'posts': posts,
-            'count': len(posts)
+            'posts': project(posts, fields),
+            'count': len(posts),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -1357,61 +2175,62 @@ def approve_post(post_id):
         if not founder_id:
             return jsonify({'success': False, 'error': 'Founder ID required'}), 400
         
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        post = next((p for p in posts if p.get('id') == post_id), None)
-        if not post:
-            return jsonify({'success': False, 'error': 'Post not found'}), 404
-        
-        post['status'] = 'approved'
-        post['approved_at'] = datetime.now().isoformat()
-        post['approved_by'] = founder_id
-        
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
-        
-        # Add to main data.json for homepage
-        try:
-            main_data = load_json('data.json', subfolder=None)
+        # The stats lock keeps the post, the listing and the partner's aggregates in step
+        # with rebuild_partner_stats()
+        with json_lock(PARTNER_STATS_FILE):
+            previous = find_post(post_id) or {}
+            post = update_post_record(post_id, {
+                'status': 'approved',
+                'approved_at': datetime.now().isoformat(),
+                'approved_by': founder_id
+            })
+            if not post:
+                return jsonify({'success': False, 'error': 'Post not found'}), 404
             
-            # Handle both array and object formats
-            if isinstance(main_data, list):
-                properties = main_data
-            elif isinstance(main_data, dict) and 'properties' in main_data:
-                properties = main_data['properties']
-            else:
-                properties = []
+            property_id = post_property_id(post_id)
+            if previous.get('status') == 'pending':
+                bump_partner_stats({property_id: {'pending_properties': -1}})
             
-            # Create property in homepage format
-            property_data = {
-                'id': f"new_{post_id}",
-                'loai': post.get('type', 'Phòng trọ'),
-                'title': post.get('title'),
-                'address': f"<strong>Địa chỉ:</strong> {post.get('address')}, {post.get('district')}, {post.get('city')}",
-                'price': f"<strong>Giá:</strong> {post.get('price'):,} VND/tháng".replace(',', '.'),
-                'img': post.get('images', []),
-                'description': post.get('description'),
-                'is_new': True,
-                'approved_at': post.get('approved_at'),
-                'area': post.get('area'),
-                'amenities': post.get('amenities', []),
-                'max_people': post.get('max_people', 1),
-                'views': 0
-            }
+            # Add to main data.json for homepage
+            try:
+                # Numeric price range, parsed once here so readers never re-parse the text
+                price_min, price_max = parse_price(post.get('price'))
             
-            # Insert at beginning
-            properties.insert(0, property_data)
+                # Create property in homepage format
+                property_data = {
+                    'id': property_id,
+                    'loai': post.get('type', 'Phòng trọ'),
+                    'title': post.get('title'),
+                    'address': f"<strong>Địa chỉ:</strong> {post.get('address')}, {post.get('district')}, {post.get('city')}",
+                    'district': post.get('district'),
+                    'city': post.get('city'),
+                    'price': f"<strong>Giá:</strong> {post.get('price'):,} VND/tháng".replace(',', '.'),
+                    'price_min': price_min,
+                    'price_max': price_max,
+                    'img': post.get('images', []),
+                    'description': post.get('description'),
+                    'is_new': True,
+                    'approved_at': post.get('approved_at'),
+                    'area': post.get('area'),
+                    'amenities': post.get('amenities', []),
+                    'max_people': post.get('max_people', 1),
+                    'views': 0
+                }
             
-            # Save based on original format
-            if isinstance(main_data, list):
-                save_json('data.json', properties, subfolder=None)
-            else:
-                main_data['properties'] = properties
-                save_json('data.json', main_data, subfolder=None)
-                
-            print(f"✅ Added to data.json: {property_data['title']}")
-        except Exception as e:
-            print(f"❌ Error adding to data.json: {e}")
+                # Insert at beginning, keeping the file's original format (array or object)
+                def publish():
+                    with json_transaction('data.json', subfolder=None) as main_data:
+                        if isinstance(main_data, list):
+                            main_data.insert(0, property_data)
+                        else:
+                            main_data.setdefault('properties', []).insert(0, property_data)
+            
+                change_catalog(publish, added=property_data)
+                if not (partner_property_stats(property_id) or {}).get('total_properties'):
+                    bump_partner_stats({property_id: {'total_properties': 1}})
+                print(f"✅ Added to data.json: {property_data['title']}")
+            except Exception as e:
+                print(f"❌ Error adding to data.json: {e}")
         
         return jsonify({
             'success': True,
@@ -1433,19 +2252,18 @@ def reject_post(post_id):
         if not founder_id:
             return jsonify({'success': False, 'error': 'Founder ID required'}), 400
         
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        post = next((p for p in posts if p.get('id') == post_id), None)
-        if not post:
-            return jsonify({'success': False, 'error': 'Post not found'}), 404
-        
-        post['status'] = 'rejected'
-        post['approved_at'] = datetime.now().isoformat()
-        post['approved_by'] = founder_id
-        post['rejected_reason'] = reason
-        
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
+        with json_lock(PARTNER_STATS_FILE):
+            previous = find_post(post_id) or {}
+            post = update_post_record(post_id, {
+                'status': 'rejected',
+                'approved_at': datetime.now().isoformat(),
+                'approved_by': founder_id,
+                'rejected_reason': reason
+            })
+            if not post:
+                return jsonify({'success': False, 'error': 'Post not found'}), 404
+            if previous.get('status') == 'pending':
+                bump_partner_stats({post_property_id(post_id): {'pending_properties': -1}})
         
         return jsonify({
             'success': True,
@@ -1464,10 +2282,7 @@ def request_delete_post(post_id):
         partner_id = data.get('partner_id')
         reason = data.get('reason', '')
         
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        post = next((p for p in posts if p.get('id') == post_id), None)
+        post = find_post(post_id)
         if not post:
             return jsonify({'success': False, 'error': 'Post not found'}), 404
         
@@ -1475,12 +2290,12 @@ def request_delete_post(post_id):
         if post.get('partner_id') != partner_id:
             return jsonify({'success': False, 'error': 'Unauthorized'}), 403
         
-        post['delete_requested'] = True
-        post['delete_request_at'] = datetime.now().isoformat()
-        post['delete_reason'] = reason
-        post['status'] = 'delete_pending'
-        
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
+        post = update_post_record(post_id, {
+            'delete_requested': True,
+            'delete_request_at': datetime.now().isoformat(),
+            'delete_reason': reason,
+            'status': 'delete_pending'
+        })
         
         return jsonify({
             'success': True,
@@ -1498,25 +2313,25 @@ def approve_delete_post(post_id):
         data = request.json
         founder_id = data.get('founder_id')
         
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        post = next((p for p in posts if p.get('id') == post_id), None)
+        post = find_post(post_id)
         if not post:
             return jsonify({'success': False, 'error': 'Post not found'}), 404
         
-        # Remove from pending_posts
-        posts_data['posts'] = [p for p in posts if p.get('id') != post_id]
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
-        
-        # Also remove from data.json if it was approved before
-        try:
-            main_data = load_json('data.json', subfolder=None)
-            if isinstance(main_data, list):
-                main_data = [p for p in main_data if p.get('id') != f"new_{post_id}"]
-                save_json('data.json', main_data, subfolder=None)
-        except:
-            pass
+        with json_lock(PARTNER_STATS_FILE):
+            # Remove from pending_posts
+            remove_post(post_id)
+            drop_partner_property(post_property_id(post_id))
+            
+            # Also remove from data.json if it was approved before
+            try:
+                def unpublish():
+                    with json_transaction('data.json', subfolder=None) as main_data:
+                        if isinstance(main_data, list):
+                            main_data[:] = [p for p in main_data if p.get('id') != post_property_id(post_id)]
+                
+                change_catalog(unpublish, removed_id=post_property_id(post_id))
+            except:
+                pass
         
         return jsonify({
             'success': True,
@@ -1530,12 +2345,9 @@ def approve_delete_post(post_id):
 def delete_post(post_id):
     """Delete a post (for founder only - direct delete)"""
     try:
-        posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-        posts = posts_data.get('posts', [])
-        
-        posts_data['posts'] = [p for p in posts if p.get('id') != post_id]
-        
-        save_json(PENDING_POSTS_FILE, posts_data, subfolder='backend')
+        with json_lock(PARTNER_STATS_FILE):
+            remove_post(post_id)
+            drop_partner_property(post_property_id(post_id))
         
         return jsonify({
             'success': True,
@@ -1561,73 +2373,56 @@ def create_booking():
             if not data.get(field):
                 return jsonify({'success': False, 'error': f'Thiếu trường bắt buộc: {field}'}), 400
         
-        # Clean property price - extract numbers and handle price ranges
-        property_price = data.get('propertyPrice', '')
-        if isinstance(property_price, str):
-            import re
-            # Check if it's a price range (contains dash/hyphen between numbers)
-            # Examples: "1.5 - 2.5 triệu", "1,500,000 - 2,500,000", "<strong>Giá:</strong> 1.5 - 2.5 triệu"
-            
-            # Remove HTML tags first
-            clean_text = re.sub(r'<[^>]+>', '', property_price)
-            
-            # Check for range pattern (numbers with dash between them)
-            range_match = re.search(r'([\d.,]+)\s*-\s*([\d.,]+)', clean_text)
-            
-            if range_match:
-                # It's a range - extract both numbers
-                min_price = re.sub(r'[^\d]', '', range_match.group(1))
-                max_price = re.sub(r'[^\d]', '', range_match.group(2))
-                
-                # Check if numbers are likely in millions (< 100 means it's in triệu format)
-                if len(min_price) <= 2 or (int(min_price) < 100):
-                    min_price = str(int(float(min_price) * 1000000))
-                if len(max_price) <= 2 or (int(max_price) < 100):
-                    max_price = str(int(float(max_price) * 1000000))
-                
-                property_price = f"{min_price} - {max_price}"
-            else:
-                # Single price - extract only numbers
-                price_numbers = re.sub(r'[^\d]', '', property_price)
-                property_price = price_numbers if price_numbers else '0'
-        
-        # Load bookings
-        bookings_data = load_json(BOOKINGS_FILE, subfolder='backend')
-        
-        # Create new booking
-        booking_id = bookings_data.get('next_booking_id', 1)
-        new_booking = {
-            'id': booking_id,
-            'property_id': data.get('propertyId'),
-            'property_title': data.get('propertyTitle'),
-            'property_price': property_price,  # Clean price (numbers only)
-            'customer_name': data.get('name'),
-            'customer_phone': data.get('phone'),
-            'customer_cccd': data.get('cccd'),
-            'customer_email': data.get('email', ''),
-            'visit_date': data.get('date'),
-            'visit_time': data.get('time'),
-            'note': data.get('note', ''),
-            'status': 'pending',  # pending, confirmed, cancelled, completed
-            'created_at': datetime.now().isoformat(),
-            'confirmed_at': None,
-            'confirmed_by': None,
-            'cancelled_at': None,
-            'cancelled_by': None,
-            'cancel_reason': None
-        }
+        visit_date, visit_start = parse_visit_date(data.get('date')), parse_visit_time(data.get('time'))
+        if visit_date is None or visit_start is None:
+            return jsonify({'success': False, 'error': 'Ngày hoặc giờ hẹn không hợp lệ'}), 400
+        property_id = data.get('propertyId')
         
-        if 'bookings' not in bookings_data:
-            bookings_data['bookings'] = []
-        bookings_data['bookings'].append(new_booking)
-        bookings_data['next_booking_id'] = booking_id + 1
+        # Price range of the listing (parsed when it was published); the submitted text is a fallback
+        listing = find_property(data.get('propertyId'))
+        if listing and listing.get('price_min') is not None:
+            price_min, price_max = listing['price_min'], listing['price_max']
+        else:
+            price_min, price_max = parse_price(data.get('propertyPrice', ''))
+        property_price = format_price_range(price_min, price_max)
         
-        save_json(BOOKINGS_FILE, bookings_data, subfolder='backend')
+        # Create new booking (the booking id is generated by the storage layer) and count it
+        # for the listing's partner. The slot is checked and taken under the bookings lock.
+        with json_lock(PARTNER_STATS_FILE), json_lock(BOOKINGS_FILE):
+            if visit_slots(property_id).conflicts(property_id, visit_date, visit_start):
+                return jsonify({
+                    'success': False,
+                    'error': 'Khung giờ này đã có lịch hẹn khác, vui lòng chọn giờ khác',
+                    'available_slots': available_visit_times(property_id, visit_date)
+                }), 409
+            
+            new_booking = insert_booking({
+                'property_id': property_id,
+                'property_title': data.get('propertyTitle'),
+                'property_price': property_price,  # Clean price (numbers only)
+                'price_min': price_min,
+                'price_max': price_max,
+                'customer_name': data.get('name'),
+                'customer_phone': data.get('phone'),
+                'customer_cccd': data.get('cccd'),
+                'customer_email': data.get('email', ''),
+                'visit_date': visit_date,
+                'visit_time': format_visit_time(visit_start),
+                'note': data.get('note', ''),
+                'status': 'pending',  # pending, confirmed, cancelled, completed
+                'created_at': datetime.now().isoformat(),
+                'confirmed_at': None,
+                'confirmed_by': None,
+                'cancelled_at': None,
+                'cancelled_by': None,
+                'cancel_reason': None
+            })
+            bump_partner_stats(booking_stats_change(None, new_booking))
         
         return jsonify({
             'success': True,
             'message': 'Yêu cầu đặt lịch đã được gửi thành công',
-            'booking_id': booking_id
+            'booking_id': new_booking['id']
         }), 201
         
     except Exception as e:
@@ -1641,34 +2436,41 @@ def get_bookings():
         property_id = request.args.get('property_id')
         partner_id = request.args.get('partner_id')  # Add partner_id filter
         
-        bookings_data = load_json(BOOKINGS_FILE, subfolder='backend')
-        bookings = bookings_data.get('bookings', [])
+        try:
+            limit, after, fields = parse_page_args(request.args, NEWEST_FIRST_CURSOR)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Tham số phân trang không hợp lệ'}), 400
+        
+        # One extra booking tells whether another page follows
+        page_limit = limit + 1 if limit else None
         
         # If partner_id is provided, only return confirmed bookings for that partner's properties
         if partner_id:
-            # Get all approved posts by this partner
-            posts_data = load_json(PENDING_POSTS_FILE, subfolder='backend')
-            partner_property_ids = [f"new_{p['id']}" for p in posts_data.get('posts', []) 
-                                   if p.get('partner_id') == partner_id and p.get('status') == 'approved']
+            # Listings of this partner's approved posts (indexed)
+            property_ids = partner_property_ids(partner_id)
             
             # Also check ntro1, ntro2, etc. format - map to partner
             # For now, only show confirmed bookings for new_ properties
-            bookings = [b for b in bookings 
-                       if b.get('property_id') in partner_property_ids 
-                       and b.get('status') == 'confirmed']
+            if status in ('all', 'confirmed'):
+                bookings = query_bookings(status='confirmed', property_id=property_id,
+                                          property_ids=property_ids, after=after, limit=page_limit)
+            else:
+                bookings = []
+        else:
+            bookings = query_bookings(status=None if status == 'all' else status, property_id=property_id,
+                                      after=after, limit=page_limit)
         
-        if status != 'all':
-            bookings = [b for b in bookings if b.get('status') == status]
+        bookings, next_cursor = page_newest_first(bookings, limit, None)
         
-        if property_id:
-            bookings = [b for b in bookings if b.get('property_id') == property_id]
-        
-        bookings.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # Ids of other pending / confirmed visits overlapping each active booking
+        bookings = [dict(b, conflicts=[other['id'] for other in visit_conflicts(b)])
+                    if b.get('status') in ('pending', 'confirmed') else b for b in bookings]
         
         return jsonify({
             'success': True,
-            'bookings': bookings,
-            'count': len(bookings)
+            'bookings': project(bookings, fields),
+            'count': len(bookings),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -1700,24 +2502,31 @@ def confirm_booking(booking_id):
         
         print(f"📝 Confirming booking #{booking_id}")
         
-        bookings_data = load_json(BOOKINGS_FILE, subfolder='backend')
-        bookings = bookings_data.get('bookings', [])
-        
-        booking = next((b for b in bookings if b.get('id') == booking_id), None)
-        if not booking:
-            print(f"❌ Booking #{booking_id} not found")
-            return jsonify({'success': False, 'error': 'Booking not found'}), 404
-        
-        # Update booking status
-        booking['status'] = 'confirmed'
-        booking['confirmed_at'] = datetime.now().isoformat()
-        booking['confirmed_by'] = partner_id
+        # Update booking status (and the partner's booking counts and revenue)
+        with json_lock(PARTNER_STATS_FILE), json_lock(BOOKINGS_FILE):
+            previous = find_booking(booking_id) or {}
+            
+            # Two confirmed visits of the same property may not overlap (force=true overrides)
+            conflicts = visit_conflicts(previous, statuses=('confirmed',)) if previous else []
+            if conflicts and not data.get('force'):
+                return jsonify({
+                    'success': False,
+                    'error': f"Trùng giờ với lịch hẹn đã xác nhận #{conflicts[0]['id']} lúc {conflicts[0].get('visit_time')}",
+                    'conflicts': [b['id'] for b in conflicts]
+                }), 409
+            
+            booking = update_booking_record(booking_id, {
+                'status': 'confirmed',
+                'confirmed_at': datetime.now().isoformat(),
+                'confirmed_by': partner_id
+            })
+            if not booking:
+                print(f"❌ Booking #{booking_id} not found")
+                return jsonify({'success': False, 'error': 'Booking not found'}), 404
+            bump_partner_stats(booking_stats_change(previous, booking))
         
         print(f"✅ Updated booking #{booking_id} to confirmed")
         
-        # Save back to file
-        save_json(BOOKINGS_FILE, bookings_data, subfolder='backend')
-        
         print(f"💾 Saved to {BOOKINGS_FILE}")
         
         return jsonify({
@@ -1740,25 +2549,22 @@ def cancel_booking(booking_id):
         
         print(f"📝 Cancelling booking #{booking_id} with reason: {reason}")
         
-        bookings_data = load_json(BOOKINGS_FILE, subfolder='backend')
-        bookings = bookings_data.get('bookings', [])
-        
-        booking = next((b for b in bookings if b.get('id') == booking_id), None)
-        if not booking:
-            print(f"❌ Booking #{booking_id} not found")
-            return jsonify({'success': False, 'error': 'Booking not found'}), 404
-        
-        # Update booking with cancellation info
-        booking['status'] = 'cancelled'
-        booking['cancelled_at'] = datetime.now().isoformat()
-        booking['cancelled_by'] = cancelled_by
-        booking['cancel_reason'] = reason
+        # Update booking with cancellation info (and the partner's booking counts and revenue)
+        with json_lock(PARTNER_STATS_FILE):
+            previous = find_booking(booking_id) or {}
+            booking = update_booking_record(booking_id, {
+                'status': 'cancelled',
+                'cancelled_at': datetime.now().isoformat(),
+                'cancelled_by': cancelled_by,
+                'cancel_reason': reason
+            })
+            if not booking:
+                print(f"❌ Booking #{booking_id} not found")
+                return jsonify({'success': False, 'error': 'Booking not found'}), 404
+            bump_partner_stats(booking_stats_change(previous, booking))
         
         print(f"✅ Updated booking #{booking_id} to cancelled")
         
-        # Save back to file
-        save_json(BOOKINGS_FILE, bookings_data, subfolder='backend')
-        
         print(f"💾 Saved to {BOOKINGS_FILE}")
         
         return jsonify({
@@ -1771,6 +2577,29 @@ def cancel_booking(booking_id):
         print(f"❌ Error cancelling booking: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/properties/<property_id>/available-slots', methods=['GET'])
+def get_available_slots(property_id):
+    """Free viewing times of a property on one day (?date=YYYY-MM-DD)"""
+    try:
+        visit_date = parse_visit_date(request.args.get('date'))
+        if visit_date is None:
+            return jsonify({'success': False, 'error': 'Ngày hẹn không hợp lệ'}), 400
+        
+        booked = visit_slots(property_id).booked(property_id, visit_date)
+        
+        return jsonify({
+            'success': True,
+            'property_id': property_id,
+            'date': visit_date,
+            'duration_minutes': VISIT_DURATION,
+            'available_slots': available_visit_times(property_id, visit_date),
+            'booked_slots': [{'start': format_visit_time(start), 'end': format_visit_time(end)}
+                             for start, end, _ in booked]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ============================================
 
 # Serve static files (for development)
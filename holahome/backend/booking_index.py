@@ -0,0 +1,173 @@
+"""
+In-memory indexes over bookings.json.
+
+Hash indexes (id -> booking, property_id -> ids, status -> ids) and a list of
+(created_at, id) sort keys kept in order let the booking lists fetch their
+slice newest first, one property, status or partner at a time, instead of
+filtering and re-sorting the whole booking history on every request. The
+position of each booking in the file lets confirm / cancel update it without
+scanning for its id, and the viewing slots of the active bookings are kept in
+a VisitSlotIndex (visit_slots.py) for conflict checks. partner_id -> property
+ids (the listings published from a partner's approved posts) is indexed from
+pending_posts.json.
+
+Like the account directory, each file is indexed against its own version:
+writes made through app.py update the index in place, and a file changed
+elsewhere (another worker, an edit by hand) is re-indexed on the next lookup.
+"""
+
+import bisect
+import heapq
+import threading
+
+from pagination import newest_first_key
+from visit_slots import VisitSlotIndex
+
+
+class BookingIndex:
+    """Booking lookups by id, property, status and partner, newest first"""
+
+    def __init__(self, slots=None):
+        self._lock = threading.RLock()
+        self.version = None
+        self.owners_version = None
+
+        self._records = {}  # id -> booking (shared, read-only)
+        self._positions = {}  # id -> position in the file's bookings list
+        self._keys = {}  # id -> (property_id, status, sort key) as indexed
+        self._by_property = {}  # property_id -> ids
+        self._by_status = {}  # status -> ids
+        self._order = []  # sort keys of every booking, ascending
+        self._partner_properties = {}  # partner_id -> property ids
+        self.slots = slots or VisitSlotIndex()  # viewing slots of pending / confirmed bookings
+
+        self.rebuilds = 0
+        self.updates = 0
+        self.lookups = 0
+
+    # ============================================
+    # MAINTENANCE
+    # ============================================
+
+    def sync(self, bookings, version):
+        """Re-index every booking from the file's bookings list at version"""
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            self._records, self._positions, self._keys = {}, {}, {}
+            self._by_property, self._by_status, self._order = {}, {}, []
+            self.slots.clear()
+            for position, booking in enumerate(bookings):
+                self._add(booking, position)
+            self._order.sort()
+            self.version = version
+            self.rebuilds += 1
+
+    def is_current(self, version):
+        with self._lock:
+            return self.version == version
+
+    def put(self, booking, position, version=None):
+        """Index a created or updated booking; version marks the file as synced"""
+        with self._lock:
+            self._remove(booking.get('id'))
+            self._add(booking, position, keep_order=True)
+            if version is not None:
+                self.version = version
+            self.updates += 1
+
+    def _add(self, booking, position, keep_order=False):
+        booking_id = booking.get('id')
+        key = newest_first_key(booking)
+        property_id, status = booking.get('property_id'), booking.get('status')
+        self._records[booking_id] = booking
+        self._positions[booking_id] = position
+        self._keys[booking_id] = (property_id, status, key)
+        self._by_property.setdefault(property_id, set()).add(booking_id)
+        self._by_status.setdefault(status, set()).add(booking_id)
+        self.slots.put(booking)
+        if keep_order:
+            bisect.insort(self._order, key)
+        else:
+            self._order.append(key)  # sync() sorts once at the end
+
+    def _remove(self, booking_id):
+        indexed = self._keys.pop(booking_id, None)
+        if indexed is None:
+            return
+        property_id, status, key = indexed
+        self._records.pop(booking_id, None)
+        self._positions.pop(booking_id, None)
+        self.slots.discard(booking_id)
+        for index, value in ((self._by_property, property_id), (self._by_status, status)):
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(booking_id)
+                if not ids:
+                    del index[value]
+        at = bisect.bisect_left(self._order, key)
+        if at < len(self._order) and self._order[at] == key:
+            del self._order[at]
+
+    def owners_current(self, version):
+        with self._lock:
+            return self.owners_version == version
+
+    def sync_owners(self, partner_properties, version):
+        """Replace partner_id -> property ids (from the posts file at version)"""
+        with self._lock:
+            self._partner_properties = {partner_id: frozenset(ids) for partner_id, ids in partner_properties.items()}
+            self.owners_version = version
+
+    # ============================================
+    # LOOKUPS
+    # ============================================
+
+    def get(self, booking_id):
+        with self._lock:
+            self.lookups += 1
+            return self._records.get(booking_id)
+
+    def position(self, booking_id):
+        """Position of the booking in the file's list when it was indexed, or None"""
+        with self._lock:
+            return self._positions.get(booking_id)
+
+    def partner_properties(self, partner_id):
+        with self._lock:
+            return self._partner_properties.get(partner_id, frozenset())
+
+    def query(self, status=None, property_id=None, property_ids=None, after=None, limit=None):
+        """Bookings matching every given filter, newest first; after/limit select a page (see pagination.py)"""
+        with self._lock:
+            self.lookups += 1
+            candidates = None
+            if property_ids is not None:
+                candidates = set().union(*(self._by_property.get(pid, ()) for pid in property_ids))
+            for index, value in ((self._by_property, property_id), (self._by_status, status)):
+                if value:
+                    ids = index.get(value, set())
+                    candidates = ids if candidates is None else candidates & ids
+
+            if candidates is None:
+                # No filter: walk the ordered keys back from the cursor
+                end = bisect.bisect_left(self._order, tuple(after)) if after is not None else len(self._order)
+                keys = self._order[max(0, end - limit) if limit else 0:end][::-1]
+            else:
+                keys = [self._keys[booking_id][2] for booking_id in candidates]
+                if after is not None:
+                    keys = [key for key in keys if key < tuple(after)]
+                keys = heapq.nlargest(limit, keys) if limit else sorted(keys, reverse=True)
+            return [self._records[key[1]] for key in keys]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'bookings': len(self._records),
+                'properties': len(self._by_property),
+                'statuses': {status: len(ids) for status, ids in self._by_status.items()},
+                'partners': len(self._partner_properties),
+                'rebuilds': self.rebuilds,
+                'updates': self.updates,
+                'lookups': self.lookups
+            }
@@ -0,0 +1,136 @@
+"""
+Buffered counters: increments accumulate in memory and are written out in
+batches, instead of rewriting a data file on every single hit.
+"""
+
+import atexit
+import threading
+
+
+class BufferedCounter:
+    """Per-key increments held in memory and flushed in one batch.
+
+    flush(batch) receives {key: delta} and must persist the whole batch in
+    one atomic write. A flush happens every `interval` seconds, as soon as
+    `max_pending` increments are waiting, and at interpreter exit.
+
+    The lock is only held to swap the pending deltas out: the batch is then
+    "in flight" while it is written, so increments and reads never wait on
+    disk I/O. pending() counts in-flight deltas until the write returns, so a
+    file read while the batch is being written may already hold it; readers
+    that need exact totals use read_consistent().
+    A batch whose write raises is merged back into the pending deltas for
+    the next attempt, so a failed write never drops increments.
+    """
+
+    def __init__(self, flush, interval=5.0, max_pending=100, name='counter'):
+        self._flush_fn = flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self.name = name
+
+        self._pending = {}
+        self._pending_total = 0
+        self._in_flight = {}  # batch being written
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # one batch in flight at a time
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.increments = 0
+        self.flushes = 0
+        self.flushed_increments = 0
+        self.failed_flushes = 0
+
+        atexit.register(self._flush_quietly)
+
+    def increment(self, key, amount=1):
+        """Record an increment; returns the delta for key not yet persisted"""
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+            self._pending_total += amount
+            self.increments += amount
+            pending = self._pending[key] + self._in_flight.get(key, 0)
+            if self._pending_total >= self.max_pending:
+                self._wakeup.set()
+        self._ensure_thread()
+        return pending
+
+    def pending(self, key=None):
+        """Delta not yet persisted (pending + in flight) for one key, or a dict of all of them"""
+        with self._lock:
+            if key is not None:
+                return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+            deltas = dict(self._in_flight)
+            for pending_key, delta in self._pending.items():
+                deltas[pending_key] = deltas.get(pending_key, 0) + delta
+            return deltas
+
+    def read_consistent(self, read):
+        """(read(), deltas) with deltas exactly the increments read() does not include.
+
+        read() loads the persisted values; it runs while no batch is being
+        written, so each batch is either wholly in its result or in the deltas.
+        """
+        with self._flush_lock:
+            return read(), self.pending()
+
+    def flush(self):
+        """Persist every pending delta in one batch; returns the number of increments written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._pending_total = 0
+                self._in_flight = batch
+
+            # Written without the lock: increments go to a fresh pending dict meanwhile
+            try:
+                self._flush_fn(batch)
+            except Exception:
+                with self._lock:
+                    for key, delta in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + delta
+                    self._pending_total += sum(batch.values())
+                    self._in_flight = {}
+                    self.failed_flushes += 1
+                raise
+
+            written = sum(batch.values())
+            with self._lock:
+                self._in_flight = {}
+                self.flushes += 1
+                self.flushed_increments += written
+            return written
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f'❌ Could not flush {self.name}: {e}')
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._flush_quietly()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_keys': len(self._pending),
+                'pending_increments': self._pending_total,
+                'in_flight_increments': sum(self._in_flight.values()),
+                'increments': self.increments,
+                'flushes': self.flushes,
+                'flushed_increments': self.flushed_increments,
+                'failed_flushes': self.failed_flushes
+            }
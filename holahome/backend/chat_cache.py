@@ -0,0 +1,105 @@
+"""
+Cache of chatbot answers.
+
+Most chat traffic is the same handful of questions (price, location,
+amenities), and each LLM call takes seconds and costs money. Answers are
+cached under a key built from:
+    - the question, lowercased, diacritics-folded, without punctuation and
+      with whitespace collapsed ("Giá phòng bao nhiêu?" == "gia phong  bao nhieu")
+    - a hash of the property context that was added to the prompt
+    - a fingerprint of the last few turns of the conversation
+so a repeated question only hits the LLM again once its entry expires (TTL)
+or is pushed out by newer ones (LRU).
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from property_search import fold
+
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+
+def normalize_message(message):
+    return ' '.join(PUNCTUATION_PATTERN.sub(' ', fold(message)).split())
+
+
+def history_fingerprint(history, turns=2):
+    """Digest of the last `turns` messages of a conversation ([] -> '')"""
+    recent = history[-turns:] if turns > 0 and history else []
+    if not recent:
+        return ''
+    text = '\n'.join(f"{msg.get('role')}:{normalize_message(msg.get('content', ''))}" for msg in recent)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def chat_cache_key(message, context='', history=(), turns=2):
+    context_hash = hashlib.sha256(context.encode('utf-8')).hexdigest()[:16] if context else ''
+    return (normalize_message(message), context_hash, history_fingerprint(list(history), turns))
+
+
+class ChatCache:
+    """TTL + LRU cache of key -> (response, model)"""
+
+    def __init__(self, max_entries=512, ttl=3600.0, history_turns=2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.history_turns = history_turns
+        self._entries = OrderedDict()  # key -> (response, model, stored_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def key(self, message, context='', history=()):
+        return chat_cache_key(message, context, history, self.history_turns)
+
+    def get(self, key):
+        """(response, model) cached under key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            response, model, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response, model
+
+    def put(self, key, response, model):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (response, model, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,220 @@
+"""
+Load test for the chat endpoint.
+
+Sends -n chat requests with -c running at once and reports latency p50/p95/p99,
+throughput and how each request ended (answered, cached, fallback, error).
+With --stream it drives /api/chat/stream and also reports time to first token.
+
+Against a running server:
+    python chat_loadtest.py --url http://localhost:5000 -n 200 -c 16
+In-process with the fake provider (no API keys, no server needed):
+    LLM_PROVIDER=fake FAKE_LLM_LATENCY=0.5 python chat_loadtest.py --in-process -n 200 -c 16
+
+Repeated questions are answered from the chat cache; pass --unique to make
+every question distinct and measure the provider path only.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from percentiles import percentile
+
+DEFAULT_MESSAGES = [
+    'Giá phòng bao nhiêu?',
+    'Phòng có điều hòa không?',
+    'Ở gần ĐH FPT có phòng nào không?',
+    'Tiền điện nước tính thế nào?',
+    'Có chỗ để xe máy không?',
+    'Đặt cọc mấy tháng?',
+    'Ký túc xá Đại học Quốc Gia giá thế nào?',
+    'Có được nấu ăn không?',
+    'Giờ giấc có tự do không?',
+    'Phòng rộng bao nhiêu m2?'
+]
+
+
+def outcome_of(status, result):
+    if status != 200 or result is None:
+        return 'error'
+    if result.get('needsFallback'):
+        return 'fallback'
+    if result.get('needsSuggestion'):
+        return 'suggestion'
+    if result.get('cached'):
+        return 'cached'
+    return 'answered' if result.get('success') else 'error'
+
+
+def last_done_event(lines):
+    """Data of the final `done` event in an SSE body (iterable of text lines)"""
+    event, result = None, None
+    for line in lines:
+        if line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:') and event == 'done':
+            result = json.loads(line[5:].strip())
+    return result
+
+
+# ============================================
+# TRANSPORTS
+# ============================================
+
+class HttpTransport:
+    """Requests over HTTP to a running server"""
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, path, payload, stream):
+        """(status, final JSON result, seconds to first token or None)"""
+        request = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if not stream:
+                    return response.status, json.loads(response.read()), None
+                first_token = None
+                lines = []
+                for raw in response:
+                    line = raw.decode('utf-8').rstrip('\n')
+                    if first_token is None and line.startswith('event: token'):
+                        first_token = time.perf_counter() - started
+                    lines.append(line)
+                return response.status, last_done_event(lines), first_token
+        except urllib.error.HTTPError as e:
+            return e.code, None, None
+
+
+class InProcessTransport:
+    """Requests through Flask's test client (set LLM_PROVIDER=fake to stay offline)"""
+
+    def __init__(self):
+        os.environ.setdefault('LLM_PROVIDER', 'fake')
+        import app as backend
+
+        self.app = backend.app
+        self._local = threading.local()
+
+    def send(self, path, payload, stream):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        started = time.perf_counter()
+        response = client.post(path, json=payload, buffered=False)
+        try:
+            if not stream:
+                return response.status_code, json.loads(b''.join(response.response)), None
+            first_token = None
+            body = []
+            for chunk in response.response:
+                text = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+                if first_token is None and 'event: token' in text:
+                    first_token = time.perf_counter() - started
+                body.append(text)
+            return response.status_code, last_done_event(''.join(body).split('\n')), first_token
+        finally:
+            response.close()
+
+
+# ============================================
+# RUN
+# ============================================
+
+def run(transport, requests, concurrency, stream=False, unique=False, messages=DEFAULT_MESSAGES):
+    path = '/api/chat/stream' if stream else '/api/chat'
+    results = []
+    lock = threading.Lock()
+
+    def one(index):
+        message = messages[index % len(messages)]
+        if unique:
+            message = f'{message} (lượt {index})'
+        started = time.perf_counter()
+        try:
+            status, result, first_token = transport.send(path, {'message': message, 'conversationHistory': []}, stream)
+        except Exception as e:
+            status, result, first_token = None, {'error': str(e)}, None
+        latency = time.perf_counter() - started
+        with lock:
+            results.append((latency, first_token, outcome_of(status, result)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return summarize(results, wall, concurrency, stream)
+
+
+def summarize(results, wall, concurrency, stream):
+    latencies = sorted(latency for latency, _, _ in results)
+    first_tokens = sorted(first for _, first, _ in results if first is not None)
+    outcomes = {}
+    for _, _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    ms = lambda seconds: round(seconds * 1000, 1)
+    summary = {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'wall_s': round(wall, 2),
+        'throughput_rps': round(len(results) / wall, 2) if wall else 0.0,
+        'latency_ms': {f'p{q}': ms(percentile(latencies, q)) for q in (50, 95, 99)},
+        'outcomes': outcomes
+    }
+    summary['latency_ms']['max'] = ms(latencies[-1]) if latencies else 0.0
+    if stream:
+        summary['first_token_ms'] = {f'p{q}': ms(percentile(first_tokens, q)) for q in (50, 95, 99)}
+    return summary
+
+
+def print_report(summary):
+    print(f"📊 {summary['requests']} requests, concurrency {summary['concurrency']}, "
+          f"{summary['wall_s']}s -> {summary['throughput_rps']} req/s")
+    latency = summary['latency_ms']
+    print(f"⏱️  latency      p50 {latency['p50']} ms | p95 {latency['p95']} ms | "
+          f"p99 {latency['p99']} ms | max {latency['max']} ms")
+    if 'first_token_ms' in summary:
+        first = summary['first_token_ms']
+        print(f"⚡ first token  p50 {first['p50']} ms | p95 {first['p95']} ms | p99 {first['p99']} ms")
+    print('📋 outcomes     ' + ', '.join(f'{name}: {count}' for name, count in sorted(summary['outcomes'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HolaHome chat load test')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://localhost:5000', help='server to test (default: http://localhost:5000)')
+    target.add_argument('--in-process', action='store_true',
+                        help='call the app through the Flask test client (LLM_PROVIDER defaults to fake)')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='total requests (default: 200)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='requests in flight (default: 16)')
+    parser.add_argument('--stream', action='store_true', help='use /api/chat/stream and measure time to first token')
+    parser.add_argument('--unique', action='store_true', help='make every question distinct (bypass the chat cache)')
+    parser.add_argument('--messages', help='file with one question per line (default: built-in questions)')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        with open(args.messages, 'r', encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()] or DEFAULT_MESSAGES
+
+    transport = InProcessTransport() if args.in_process else HttpTransport(args.url)
+    summary = run(transport, args.requests, args.concurrency, stream=args.stream,
+                  unique=args.unique, messages=messages)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == '__main__':
+    main()
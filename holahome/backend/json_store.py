@@ -0,0 +1,515 @@
+"""
+In-memory document store for the backend's JSON data files.
+
+Every file is parsed once and kept in memory. A cached copy is reused as long
+as the file's (mtime, size) signature does not change, so edits made by
+another process (or by hand) are picked up on the next read.
+
+In journaled mode a mutation does not rewrite the whole file: it is appended
+as one small record to "<file>.wal" and applied to the in-memory document. A
+background compactor periodically folds the journal back into a fresh
+snapshot of the JSON file and truncates it. Just before the new snapshot is
+renamed into place, a marker naming it (inode and size) is appended to the
+journal: if the process dies before the truncate, replay skips every record
+up to the marker instead of applying them a second time.
+
+Writers take an exclusive flock on "<file>.lock", so several worker processes
+can share the files without overwriting each other's changes. Snapshots are
+written to a temp file and renamed into place, which lets plain readers skip
+locking entirely: they always see either the old or the new file.
+"""
+
+import copy
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialized
+    fcntl = None
+
+
+# ============================================
+# MUTATION OPERATIONS
+# ============================================
+#
+# A mutation is a list of operations, each a (op, path, value) triple:
+#   ('set', path, value)     parent[key] = value
+#   ('incr', path, amount)   parent[key] = parent.get(key, 0) + amount
+#   ('append', path, value)  target list gets value appended (created if missing)
+#   ('remove', path, value)  value is removed from the target list if present
+#   ('delete', path, None)   key / list item is removed
+#
+# A path is a list of dict keys and list indexes. A dict segment such as
+# {'id': 3} selects the first list item whose fields match, which keeps
+# records stable when list positions shift between processes.
+
+def _step(container, segment):
+    if isinstance(segment, dict):
+        for item in container:
+            if isinstance(item, dict) and all(item.get(k) == v for k, v in segment.items()):
+                return item
+        raise KeyError(f'No item matching {segment}')
+    return container[segment]
+
+def _resolve_key(container, segment):
+    """Turn a path segment into a concrete key/index for container"""
+    if isinstance(segment, dict):
+        for index, item in enumerate(container):
+            if isinstance(item, dict) and all(item.get(k) == v for k, v in segment.items()):
+                return index
+        raise KeyError(f'No item matching {segment}')
+    return segment
+
+def apply_ops(data, ops):
+    """Apply mutation operations to data in place"""
+    for op, path, value in ops:
+        parent = data
+        for segment in path[:-1]:
+            parent = _step(parent, segment)
+        key = _resolve_key(parent, path[-1])
+
+        if op == 'set':
+            parent[key] = value
+        elif op == 'incr':
+            current = parent.get(key, 0) if isinstance(parent, dict) else parent[key]
+            parent[key] = current + value
+        elif op == 'append':
+            if isinstance(parent, dict) and key not in parent:
+                parent[key] = []
+            parent[key].append(value)
+        elif op == 'remove':
+            target = parent[key]
+            if value in target:
+                target.remove(value)
+        elif op == 'delete':
+            del parent[key]
+        else:
+            raise ValueError(f'Unknown operation: {op}')
+    return data
+
+def _copied(container, copied):
+    """Shallow copy of a dict/list, made once per copy-on-write pass (ids in copied)"""
+    if id(container) in copied or not isinstance(container, (dict, list)):
+        return container
+    container = dict(container) if isinstance(container, dict) else list(container)
+    copied.add(id(container))
+    return container
+
+def apply_ops_copy(data, ops, copied=None):
+    """Apply mutation operations to a copy of data and return it.
+
+    Only the containers on the changed paths are copied; everything else is
+    shared with data, which is left untouched. Pass the same copied set to
+    several calls to keep changing one copy.
+    """
+    copied = set() if copied is None else copied
+    root = _copied(data, copied)
+    for op, path, value in ops:
+        parent = root
+        for segment in path[:-1]:
+            key = _resolve_key(parent, segment)
+            parent[key] = _copied(parent[key], copied)
+            parent = parent[key]
+        if op in ('append', 'remove'):
+            # These change the target list itself
+            key = _resolve_key(parent, path[-1])
+            if not isinstance(parent, dict) or key in parent:
+                parent[key] = _copied(parent[key], copied)
+        apply_ops(parent, [(op, path[-1:], value)])
+    return root
+
+
+class DocumentStore:
+    """Process-level cache of parsed JSON documents, keyed by absolute path.
+
+    Documents returned by load() are shared between requests: treat them as
+    read-only. Changes go through update() (small mutations, journaled when
+    enabled) or transaction() (arbitrary in-place edits, full rewrite); both
+    hold the file's write lock across the read-modify-write, change a copy
+    and swap it into the cache only after it has been written.
+    """
+
+    def __init__(self, journal=False, compact_interval=30, compact_records=1000):
+        self.journal = journal
+        self.compact_interval = compact_interval
+        self.compact_records = compact_records
+
+        self._entries = {}  # path -> (signature, data)
+        self._wal_offsets = {}  # path -> bytes of the journal already applied
+        self._wal_records = {}  # path -> journal records not yet compacted
+        self._lock = threading.Lock()  # guards the dicts above and the counters
+        self._path_locks = {}  # path -> RLock serializing writers within this process
+        self._held = threading.local()  # file locks held by the current thread
+        self._compact_event = threading.Event()
+        self._compactor = None
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.journal_appends = 0
+        self.journal_replays = 0
+        self.compactions = 0
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        # The inode changes on every atomic rename, even within one mtime tick
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def wal_path(path):
+        return path + '.wal'
+
+    def _signature(self, path):
+        """Signature of the snapshot, plus its journal in journaled mode"""
+        snapshot = self._stat(path)
+        if snapshot is None:
+            raise FileNotFoundError(path)
+        if not self.journal:
+            return snapshot
+        return (snapshot, self._stat(self.wal_path(path)))
+
+    def version(self, path):
+        """Opaque value that changes whenever the document changes (None if missing)"""
+        try:
+            return self._signature(path)
+        except OSError:
+            return None
+
+    # ============================================
+    # LOCKING
+    # ============================================
+
+    def _path_lock(self, path):
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def _file_lock(self, path, exclusive):
+        """flock on "<path>.lock"; re-entrant for the thread that already holds it"""
+        held = getattr(self._held, 'paths', None)
+        if held is None:
+            held = self._held.paths = set()
+        if fcntl is None or path in held:
+            yield
+            return
+
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            held.add(path)
+            try:
+                yield
+            finally:
+                held.discard(path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def write_lock(self, path):
+        """Exclusive lock on one document, across threads and processes"""
+        with self._path_lock(path):
+            with self._file_lock(path, exclusive=True):
+                yield
+
+    # ============================================
+    # READS
+    # ============================================
+
+    def load(self, path):
+        """Return the parsed document at path, re-reading it only if it changed on disk"""
+        try:
+            signature = self._signature(path)
+        except OSError:
+            return {}
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if not self.journal:
+            # Snapshots are replaced atomically, so no lock is needed to read one
+            data = self._read_snapshot(path)
+            if data is None:
+                return {}
+            # The signature was taken before reading, so a concurrent write only
+            # costs one extra reload on the next call.
+            with self._lock:
+                self._entries[path] = (signature, data)
+            return data
+
+        # Snapshot and journal must be read as a pair: a compaction in between
+        # would apply the journal twice. Readers share the lock with each other.
+        with self._path_lock(path), self._file_lock(path, exclusive=False):
+            try:
+                signature = self._signature(path)
+            except OSError:
+                return {}
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                return entry[1]
+
+            # Only the journal grew (another process appended): replay the tail onto a
+            # copy, other threads may be reading the cached document
+            if entry and entry[0][0] == signature[0]:
+                data = self._replay(path, entry[1], self._wal_offsets.get(path, 0), copied=set())
+            else:
+                data = self._read_snapshot(path)
+                if data is None:
+                    return {}
+                self._wal_offsets[path] = 0
+                self._wal_records[path] = 0
+                data = self._replay(path, data, 0)
+
+            with self._lock:
+                self._entries[path] = (signature, data)
+            return data
+
+    @staticmethod
+    def _read_snapshot(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _replay(self, path, data, offset, copied=None):
+        """Apply journal records from offset onwards to data (to a copy if copied is a set); returns it"""
+        try:
+            with open(self.wal_path(path), 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except OSError:
+            return data
+
+        # A torn last line (crash mid-append) is left for the next replay
+        end = chunk.rfind(b'\n') + 1
+        records = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                print(f'⚠️ Skipping journal record for {path}: {e}')
+
+        # Records before the last marker naming the current snapshot are already in it
+        snapshot = self._stat(path)
+        marker = {'snapshot': [snapshot[0], snapshot[2]]} if snapshot else None
+        compacted = [index for index, record in enumerate(records) if record == marker]
+        if compacted:
+            records = records[compacted[-1] + 1:]
+            self._wal_records[path] = 0
+
+        for record in records:
+            if isinstance(record, dict):
+                continue  # marker of a compaction that did not finish
+            try:
+                if copied is None:
+                    apply_ops(data, record)
+                else:
+                    data = apply_ops_copy(data, record, copied)
+            except (ValueError, LookupError, TypeError) as e:
+                print(f'⚠️ Skipping journal record for {path}: {e}')
+            self._wal_records[path] = self._wal_records.get(path, 0) + 1
+            self.journal_replays += 1
+        self._wal_offsets[path] = offset + end
+        return data
+
+    def _append_journal(self, path, encoded):
+        """Append one record; returns the journal's size after it"""
+        with open(self.wal_path(path), 'ab+') as f:
+            # After a torn last line, start a new one so this record stays readable
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    encoded = b'\n' + encoded
+            f.write(encoded)
+            f.flush()
+            return f.tell()
+
+    # ============================================
+    # WRITES
+    # ============================================
+
+    def _write_snapshot(self, path, data, before_replace=None):
+        """Write to a temp file in the same folder and rename it over path"""
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                # mkstemp creates 0600 files; keep the permissions of the original
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            if before_replace:
+                before_replace(os.stat(tmp_path))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _mark_snapshot(self, path, st):
+        """Journal marker: every record before it is in the snapshot with st's inode and size"""
+        wal = self.wal_path(path)
+        if not os.path.exists(wal) or not os.path.getsize(wal):
+            return
+        self._append_journal(path, json.dumps({'snapshot': [st.st_ino, st.st_size]}).encode('utf-8') + b'\n')
+        with open(wal, 'rb') as f:
+            os.fsync(f.fileno())
+
+    def _store_snapshot(self, path, data):
+        before_replace = (lambda st: self._mark_snapshot(path, st)) if self.journal else None
+        self._write_snapshot(path, data, before_replace)
+        if self.journal:
+            # The snapshot already contains everything the journal held
+            self._truncate_journal(path)
+        with self._lock:
+            self._entries[path] = (self._signature(path), data)
+            self.writes += 1
+
+    def save(self, path, data):
+        """Replace the document at path with data and cache it"""
+        with self.write_lock(path):
+            try:
+                self._store_snapshot(path, data)
+            except BaseException:
+                self.invalidate(path)
+                raise
+
+    @contextmanager
+    def transaction(self, path):
+        """Read-modify-write of a whole document under its write lock.
+
+        Yields a private copy of the current document; edit it in place and it
+        is written back atomically (and cached) when the block exits without an
+        exception. Readers keep the previous document until then.
+        """
+        with self.write_lock(path):
+            data = copy.deepcopy(self.load(path))
+            yield data
+            try:
+                self._store_snapshot(path, data)
+            except BaseException:
+                # The file may or may not have been replaced: re-read it next time
+                self.invalidate(path)
+                raise
+
+    def update(self, path, ops):
+        """Apply mutation operations to a document and persist them.
+
+        ops is a list of operations, or a function taking the current document
+        and returning one; the function runs under the write lock, so ids and
+        existence checks it computes cannot be invalidated by another writer.
+        Journaled stores append the operations to the file's journal, plain
+        stores rewrite the snapshot. Returns the updated document.
+
+        The operations are applied to a copy (see apply_ops_copy), which
+        replaces the cached document only once it has been written.
+        """
+        with self.write_lock(path):
+            data = self.load(path)
+            if callable(ops):
+                ops = ops(data)
+            if not ops:
+                return data
+            data = apply_ops_copy(data, ops)
+
+            try:
+                if not self.journal:
+                    self._store_snapshot(path, data)
+                    return data
+
+                record = json.dumps(ops, ensure_ascii=False, separators=(',', ':')) + '\n'
+                # The cached document holds every complete record, so the journal is applied up to its end
+                self._wal_offsets[path] = self._append_journal(path, record.encode('utf-8'))
+            except BaseException:
+                # The file may or may not hold the change: re-read it next time
+                self.invalidate(path)
+                raise
+            self._wal_records[path] = self._wal_records.get(path, 0) + 1
+            with self._lock:
+                self._entries[path] = (self._signature(path), data)
+                self.journal_appends += 1
+
+            self._ensure_compactor()
+            if self._wal_records[path] >= self.compact_records:
+                self._compact_event.set()
+            return data
+
+    # ============================================
+    # COMPACTION
+    # ============================================
+
+    def _truncate_journal(self, path):
+        wal = self.wal_path(path)
+        if os.path.exists(wal):
+            with open(wal, 'wb'):
+                pass
+        self._wal_offsets[path] = 0
+        self._wal_records[path] = 0
+
+    def compact(self, path=None):
+        """Fold journals into fresh snapshots (one document, or every journaled one)"""
+        paths = [path] if path else [p for p, n in list(self._wal_records.items()) if n]
+        for p in paths:
+            with self.write_lock(p):
+                data = self.load(p)
+                if not self._wal_records.get(p):
+                    continue
+                self._store_snapshot(p, data)
+                with self._lock:
+                    self.compactions += 1
+
+    def _ensure_compactor(self):
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compact_loop, name='json-compactor', daemon=True)
+            self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait(self.compact_interval)
+            self._compact_event.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f'❌ Journal compaction failed: {e}')
+
+    def invalidate(self, path=None):
+        """Drop one cached document, or all of them"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'documents': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'journaled': self.journal,
+                'journal_appends': self.journal_appends,
+                'journal_replays': self.journal_replays,
+                'journal_pending_records': sum(self._wal_records.values()),
+                'compactions': self.compactions,
+                'file_locking': fcntl is not None
+            }
@@ -0,0 +1,235 @@
+"""
+Retrieval of the listings relevant to a chat question.
+
+Every listing (title, type, address, price, area and description) is encoded
+once into a vector; the vectors are kept as rows of one L2-normalized NumPy
+matrix, so a question costs one encoding plus a matrix-vector product and a
+top-k partition, whatever the size of the catalog. Only listings whose text
+changed are re-encoded when data.json changes (view counts don't count).
+
+Encoders:
+    - phobert: the PhoBERT encoder used by ai_model/AutoFeatureTags (mean
+      pooled last hidden state). Loads the fine-tuned FeatureExtractor encoder
+      when a checkpoint is given, the pretrained vinai/phobert-base otherwise.
+      Needs torch and transformers (ai_model/AutoFeatureTags/requirements.txt).
+    - hashing: hashed word unigrams + bigrams of the folded text, no extra
+      dependencies; used when PhoBERT is unavailable.
+"""
+
+import html
+import math
+import os
+import re
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from price_parser import TAG_PATTERN
+from property_search import fold
+
+AUTOFEATURETAGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'ai_model', 'AutoFeatureTags')
+
+HIDDEN_BLOCK_PATTERN = re.compile(r'<(style|script|head)\b.*?</\1>', re.S | re.I)
+WORD_PATTERN = re.compile(r'\w+')
+DESCRIPTION_FILE_PATTERN = re.compile(r'^[\w./-]+\.(html?|txt)$', re.I)
+
+MAX_DESCRIPTION_CHARS = 1000
+
+
+def plain_text(text):
+    text = HIDDEN_BLOCK_PATTERN.sub(' ', str(text or ''))
+    return ' '.join(html.unescape(TAG_PATTERN.sub(' ', text)).split())
+
+
+def listing_description(listing, data_dir):
+    """The listing's description; catalog entries often point to a des.html / des.txt file"""
+    description = str(listing.get('description') or '').strip()
+    if DESCRIPTION_FILE_PATTERN.match(description):
+        path = os.path.normpath(os.path.join(data_dir, description))
+        if not path.startswith(os.path.normpath(data_dir) + os.sep):
+            return ''
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                description = f.read()
+        except OSError:
+            return ''
+    return plain_text(description)[:MAX_DESCRIPTION_CHARS]
+
+
+def listing_document(listing, data_dir):
+    """Text encoded for a listing"""
+    parts = [listing.get('title'), listing.get('loai'), listing.get('address'), listing.get('price')]
+    if listing.get('area'):
+        parts.append(f"{listing.get('area')} m2")
+    parts.append(listing_description(listing, data_dir))
+    return ' . '.join(plain_text(part) for part in parts if part)
+
+
+def _source(listing):
+    """The fields listing_document() reads; a change means re-encoding the listing"""
+    return tuple(str(listing.get(field)) for field in ('title', 'loai', 'address', 'price', 'area', 'description'))
+
+
+# ============================================
+# ENCODERS
+# ============================================
+
+class HashingEncoder:
+    """Hashed unigram + bigram term frequencies of the folded text"""
+
+    name = 'hashing'
+
+    def __init__(self, dim=4096):
+        self.dim = dim
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(fold(text))
+            counts = {}
+            for term in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+                column = zlib.crc32(term.encode('utf-8')) % self.dim
+                counts[column] = counts.get(column, 0) + 1
+            for column, count in counts.items():
+                vectors[row, column] = 1 + math.log(count)
+        return _normalize(vectors)
+
+
+class PhoBERTEncoder:
+    """PhoBERT sentence vectors (mean of the last hidden states over real tokens)"""
+
+    name = 'phobert'
+
+    def __init__(self, checkpoint=None, batch_size=16):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if AUTOFEATURETAGS_DIR not in sys.path:
+            sys.path.append(AUTOFEATURETAGS_DIR)
+        from config import Config
+
+        self._torch = torch
+        self.batch_size = batch_size
+        self.max_length = Config.MAX_LENGTH
+        self.device = torch.device('cuda' if torch.cuda.is_available() and Config.DEVICE == 'cuda' else 'cpu')
+        self.tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_NAME)
+        if checkpoint:
+            # Encoder fine-tuned by AutoFeatureTags/train.py
+            from model import FeatureExtractor
+            self.model = FeatureExtractor(Config).load_model(checkpoint, self.device).encoder
+        else:
+            self.model = AutoModel.from_pretrained(Config.MODEL_NAME)
+        self.model.to(self.device).eval()
+
+    def encode(self, texts):
+        torch = self._torch
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(texts[start:start + self.batch_size], max_length=self.max_length,
+                                     padding=True, truncation=True, return_tensors='pt').to(self.device)
+            with torch.no_grad():
+                hidden = self.model(**encoded).last_hidden_state
+            mask = encoded['attention_mask'].unsqueeze(-1).type_as(hidden)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            batches.append(pooled.cpu().numpy().astype(np.float32))
+        return _normalize(np.vstack(batches) if batches else np.zeros((0, 768), dtype=np.float32))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def create_encoder(kind='auto', checkpoint=None):
+    """'phobert', 'hashing', or 'auto' (PhoBERT if it can be loaded)"""
+    if kind in ('auto', 'phobert'):
+        try:
+            return PhoBERTEncoder(checkpoint)
+        except Exception as e:
+            print(f'⚠️ PhoBERT encoder unavailable ({e}) - using hashed word vectors for chat retrieval')
+    return HashingEncoder()
+
+
+# ============================================
+# RETRIEVER
+# ============================================
+
+class ListingRetriever:
+    """Top-k cosine search over precomputed listing vectors"""
+
+    def __init__(self, data_dir, encoder='auto', checkpoint=None):
+        self.data_dir = data_dir
+        self.encoder_kind = encoder
+        self.checkpoint = checkpoint
+        self.encoder = None  # created on first sync (PhoBERT takes a while to load)
+        self.version = None
+
+        self._lock = threading.RLock()
+        self._entries = {}  # id -> (source, vector)
+        self._ids = []
+        self._listings = []
+        self._matrix = None
+
+        self.syncs = 0
+        self.encoded = 0
+        self.queries = 0
+
+    def sync(self, listings, version):
+        """Encode new or changed listings and rebuild the matrix if anything changed"""
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            if self.encoder is None:
+                self.encoder = create_encoder(self.encoder_kind, self.checkpoint)
+
+            current = {}
+            for listing in listings:
+                if listing.get('id') is not None and listing.get('id') not in current:
+                    current[listing.get('id')] = listing
+
+            stale = [pid for pid, listing in current.items()
+                     if pid not in self._entries or self._entries[pid][0] != _source(listing)]
+            if stale:
+                vectors = self.encoder.encode([listing_document(current[pid], self.data_dir) for pid in stale])
+                for pid, vector in zip(stale, vectors):
+                    self._entries[pid] = (_source(current[pid]), vector)
+                self.encoded += len(stale)
+            for pid in [pid for pid in self._entries if pid not in current]:
+                del self._entries[pid]
+
+            ids = list(current)
+            if stale or ids != self._ids:
+                self._matrix = np.vstack([self._entries[pid][1] for pid in ids]) if ids else None
+            self._ids = ids
+            self._listings = [current[pid] for pid in ids]
+            self.version = version
+            self.syncs += 1
+
+    def search(self, query, k=3, min_score=0.0):
+        """Up to k (listing, score) pairs, best first, with cosine similarity above min_score"""
+        with self._lock:
+            # sync() replaces the matrix instead of editing it, so encode the query unlocked
+            self.queries += 1
+            matrix, listings, encoder = self._matrix, self._listings, self.encoder
+        if matrix is None or k <= 0 or not query:
+            return []
+        scores = matrix @ encoder.encode([query])[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(listings[i], float(scores[i])) for i in top if scores[i] > min_score]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'encoder': self.encoder.name if self.encoder else None,
+                'listings': len(self._ids),
+                'dimensions': int(self._matrix.shape[1]) if self._matrix is not None else 0,
+                'syncs': self.syncs,
+                'encoded': self.encoded,
+                'queries': self.queries
+            }
@@ -0,0 +1,406 @@
+"""
+Chat providers: long-lived LLM clients behind one interface.
+
+Every provider answers a BudgetedPrompt (see prompt_budget.py) with
+    reply(prompt)         -> the full answer text
+    stream_reply(prompt)  -> iterator over pieces of the answer as generated
+and raises NeedsFallback when it produced no usable answer (blocked, empty),
+so chat() never looks at provider-specific response objects.
+
+Providers:
+    - GeminiClient: one GenerativeModel (and the SDK's gRPC channel)
+    - OpenAIClient: one openai.OpenAI client with its httpx connection pool
+    - FakeClient: local and deterministic, with configurable latency and
+      failure rates, for benchmarking the chat endpoint without API keys
+
+Each client is created once at startup and reused by every request. Calls
+get connect/read timeouts, so a slow upstream can't hold a worker forever,
+and at most max_in_flight calls per provider run at once; past that a call
+fails fast with LLMBusy and the chatbot falls back to its FAQ answers instead
+of queueing behind the provider. Per-call latency (and time to first token
+for streamed answers) is recorded for /api/metrics.
+"""
+
+import hashlib
+import inspect
+import random
+import threading
+import time
+from collections import deque
+
+from percentiles import latency_summary
+
+GEMINI_SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE",
+    },
+]
+
+
+class LLMBusy(Exception):
+    """The provider already has max_in_flight calls running"""
+
+    def __init__(self, provider):
+        super().__init__(f'{provider} has too many requests in flight')
+        self.provider = provider
+
+
+class NeedsFallback(Exception):
+    """The provider gave no usable answer; the frontend should use its FAQ chatbot"""
+
+
+class FakeProviderError(Exception):
+    """Simulated upstream failure of FakeClient"""
+
+
+def _is_timeout(error):
+    # openai.APITimeoutError, httpx.ReadTimeout, google.api_core DeadlineExceeded, ...
+    name = type(error).__name__.lower()
+    return 'timeout' in name or 'deadline' in name
+
+
+class LLMClient:
+    """Provider interface; subclasses implement _reply() and _stream_reply()"""
+
+    name = 'llm'
+
+    def __init__(self, model, max_in_flight=8, samples=1000):
+        self.model = model
+        self.max_in_flight = max_in_flight
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=samples)
+        self._first_tokens = deque(maxlen=samples)
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.rejected = 0
+
+    def reply(self, prompt):
+        """The whole answer to prompt"""
+        return self._call(self._reply, prompt)
+
+    def stream_reply(self, prompt):
+        """Iterator over the answer's text pieces as the provider generates them"""
+        return self._stream(self._stream_reply, prompt)
+
+    def _reply(self, prompt):
+        raise NotImplementedError
+
+    def _stream_reply(self, prompt):
+        """Start the request and return an iterator over text pieces"""
+        raise NotImplementedError
+
+    @staticmethod
+    def history_role(turn):
+        return 'user' if turn.get('role') == 'user' else 'assistant'
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise LLMBusy(self.name)
+        with self._stats_lock:
+            self.in_flight += 1
+
+    def _release(self, started, error=None, first_token=None):
+        self._slots.release()
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self._latencies.append(time.perf_counter() - started)
+            if first_token is not None:
+                self._first_tokens.append(first_token)
+            if isinstance(error, NeedsFallback):
+                self.fallbacks += 1
+            elif error is not None:
+                self.errors += 1
+                if _is_timeout(error):
+                    self.timeouts += 1
+
+    def _call(self, fn, *args, **kwargs):
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._release(started, error=e)
+            raise
+        self._release(started)
+        return result
+
+    def _stream(self, fn, *args, **kwargs):
+        """Start a streamed call now; the slot is held until the returned iterator ends"""
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            chunks = fn(*args, **kwargs)
+        except Exception as e:
+            self._release(started, error=e)
+            raise
+
+        def relay():
+            first_token = None
+            error = None
+            try:
+                for chunk in chunks:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    yield chunk
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._release(started, error=error, first_token=first_token)
+
+        return relay()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'model': self.model,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'fallbacks': self.fallbacks,
+                'rejected': self.rejected,
+                'latency': latency_summary(self._latencies),
+                'first_token': latency_summary(self._first_tokens)
+            }
+
+
+# ============================================
+# GOOGLE GEMINI
+# ============================================
+
+class GeminiClient(LLMClient):
+    """One GenerativeModel for the whole process"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model='gemini-2.5-flash', generation_config=None,
+                 safety_settings=GEMINI_SAFETY_SETTINGS, timeout=30.0, max_in_flight=8):
+        super().__init__(model, max_in_flight)
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model, generation_config=generation_config)
+        self.safety_settings = safety_settings
+        self.timeout = timeout
+        # request_options (per-call deadline) only exists in google-generativeai >= 0.4
+        self.supports_timeout = 'request_options' in inspect.signature(self._model.generate_content).parameters
+        if not self.supports_timeout:
+            print('⚠️ WARNING: google-generativeai is too old for request timeouts. Run: pip install -U google-generativeai')
+
+    @staticmethod
+    def prompt_text(prompt):
+        """Gemini gets one text prompt: system prompt, property context, history, question"""
+        parts = [prompt.system, prompt.context, '\n\n']
+
+        # Add conversation history (the turns that fit the budget)
+        if prompt.history or prompt.summary:
+            parts.append('LỊCH SỬ HỘI THOẠI:\n')
+            if prompt.summary:
+                parts.append(f'(Trước đó) {prompt.summary}\n')
+            for msg in prompt.history:
+                role = 'Khách' if msg.get('role') == 'user' else 'Bạn'
+                parts.append(f"{role}: {msg['content']}\n")
+            parts.append('\n')
+
+        parts.append(f'KHÁCH HỎI: {prompt.message}\n\nTRẢ LỜI:')
+        return ''.join(parts)
+
+    def _generate(self, prompt, stream=False):
+        options = {'request_options': {'timeout': self.timeout}} if self.supports_timeout else {}
+        return self._model.generate_content(self.prompt_text(prompt), safety_settings=self.safety_settings,
+                                            stream=stream, **options)
+
+    def _reply(self, prompt):
+        response = self._generate(prompt)
+
+        # Check if response has valid content
+        if not response.candidates:
+            raise NeedsFallback('Gemini returned no candidates')
+
+        candidate = response.candidates[0]
+
+        # Check finish reason
+        if candidate.finish_reason != 1:  # 1 = STOP (normal completion)
+            raise NeedsFallback(f'Gemini finish_reason: {candidate.finish_reason}')
+
+        # Extract text from response
+        try:
+            if hasattr(candidate.content, 'parts') and candidate.content.parts:
+                return candidate.content.parts[0].text
+            return response.text
+        except Exception as extract_error:
+            raise NeedsFallback(f'Error extracting text: {extract_error}')
+
+    def _stream_reply(self, prompt):
+        return self._stream_texts(self._generate(prompt, stream=True))
+
+    @staticmethod
+    def _stream_texts(chunks):
+        for chunk in chunks:
+            if not chunk.candidates:
+                raise NeedsFallback('Gemini returned no candidates')
+            candidate = chunk.candidates[0]
+            # 0 = not finished yet (intermediate chunk), 1 = STOP (normal completion)
+            if candidate.finish_reason not in (0, 1):
+                raise NeedsFallback(f'Gemini finish_reason: {candidate.finish_reason}')
+            for part in getattr(candidate.content, 'parts', None) or []:
+                if part.text:
+                    yield part.text
+
+
+# ============================================
+# OPENAI
+# ============================================
+
+class OpenAIClient(LLMClient):
+    """One openai.OpenAI client (and its connection pool) for the whole process"""
+
+    name = 'openai'
+
+    def __init__(self, api_key, model='gpt-3.5-turbo', temperature=0.7, max_tokens=500,
+                 connect_timeout=5.0, timeout=30.0, max_in_flight=8, max_retries=1):
+        super().__init__(model, max_in_flight)
+        import httpx
+        import openai
+
+        self.params = {'temperature': temperature, 'max_tokens': max_tokens}
+        self.timeout = timeout
+        self._client = openai.OpenAI(
+            api_key=api_key,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            max_retries=max_retries,
+            http_client=httpx.Client(limits=httpx.Limits(max_connections=max_in_flight,
+                                                         max_keepalive_connections=max_in_flight))
+        )
+        self._system_messages = {}  # system prompt -> message, built once
+
+    def messages(self, prompt):
+        """OpenAI messages: the static system message, context, history and question"""
+        system_message = self._system_messages.get(prompt.system)
+        if system_message is None:
+            system_message = self._system_messages[prompt.system] = {"role": "system", "content": prompt.system}
+        messages = [system_message]
+        if prompt.context or prompt.summary:
+            notes = prompt.context.strip()
+            if prompt.summary:
+                notes += f'\n\nTÓM TẮT HỘI THOẠI TRƯỚC: {prompt.summary}'
+            messages.append({"role": "system", "content": notes.strip()})
+
+        # Add conversation history (the turns that fit the budget)
+        for msg in prompt.history:
+            messages.append({"role": self.history_role(msg), "content": msg['content']})
+
+        # Add current message
+        messages.append({"role": "user", "content": prompt.message})
+        return messages
+
+    def _reply(self, prompt):
+        response = self._client.chat.completions.create(model=self.model, messages=self.messages(prompt),
+                                                        **self.params)
+        text = response.choices[0].message.content if response.choices else None
+        if not text:
+            raise NeedsFallback('OpenAI returned an empty answer')
+        return text
+
+    def _stream_reply(self, prompt):
+        chunks = self._client.chat.completions.create(model=self.model, messages=self.messages(prompt),
+                                                      stream=True, **self.params)
+        return (chunk.choices[0].delta.content for chunk in chunks
+                if chunk.choices and chunk.choices[0].delta.content)
+
+
+# ============================================
+# FAKE (offline benchmarking)
+# ============================================
+
+FAKE_WORDS = ('phòng', 'trọ', 'giá', 'triệu', 'tháng', 'gần', 'ĐH FPT', 'có', 'điều hòa', 'wifi',
+              'miễn phí', 'rộng', 'm²', 'bạn', 'nhé', 'liên hệ', 'chủ nhà', 'xem phòng', 'an ninh', '😊')
+
+
+class FakeClient(LLMClient):
+    """Local provider with deterministic answers, latency and failures.
+
+    Every call draws from a random generator seeded with (seed, question, history
+    length), so the same request always gets the same answer, latency and outcome.
+    latency +- jitter is the whole call; streamed answers spend first_token_share of
+    it before the first piece. failure_rate of calls raise FakeProviderError and
+    fallback_rate of calls answer NeedsFallback, like a blocked Gemini answer.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.8, jitter=0.3, first_token_share=0.3, failure_rate=0.0,
+                 fallback_rate=0.0, answer_words=40, seed=0, max_in_flight=64):
+        super().__init__('fake-llm', max_in_flight)
+        self.latency = latency
+        self.jitter = jitter
+        self.first_token_share = first_token_share
+        self.failure_rate = failure_rate
+        self.fallback_rate = fallback_rate
+        self.answer_words = answer_words
+        self.seed = seed
+
+    def _plan(self, prompt):
+        """(total latency, outcome, answer words) for prompt"""
+        key = f'{self.seed}:{prompt.message}:{len(prompt.history)}'
+        rng = random.Random(hashlib.sha256(key.encode('utf-8')).digest())
+        latency = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        draw = rng.random()
+        if draw < self.failure_rate:
+            outcome = 'error'
+        elif draw < self.failure_rate + self.fallback_rate:
+            outcome = 'fallback'
+        else:
+            outcome = 'ok'
+        words = [rng.choice(FAKE_WORDS) for _ in range(self.answer_words)]
+        return latency, outcome, words
+
+    @staticmethod
+    def _fail(outcome):
+        if outcome == 'error':
+            raise FakeProviderError('Simulated provider failure')
+        if outcome == 'fallback':
+            raise NeedsFallback('Simulated blocked answer')
+
+    def _reply(self, prompt):
+        latency, outcome, words = self._plan(prompt)
+        time.sleep(latency)
+        self._fail(outcome)
+        return ' '.join(words)
+
+    def _stream_reply(self, prompt):
+        latency, outcome, words = self._plan(prompt)
+
+        def pieces():
+            time.sleep(latency * self.first_token_share)
+            self._fail(outcome)
+            per_word = latency * (1 - self.first_token_share) / max(len(words), 1)
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(per_word)
+                yield word if index == 0 else ' ' + word
+
+        return pieces()
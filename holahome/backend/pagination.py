@@ -0,0 +1,97 @@
+"""
+Cursor pagination and field projection for the list endpoints.
+
+Query parameters:
+    limit   page size (1..MAX_LIMIT); without it the whole list is returned
+    after   opaque cursor returned with the previous page
+    fields  comma-separated fields to keep in each record (id is always kept)
+
+Cursors are base64 JSON of the sort key of the last record on the page, so a
+page boundary stays valid when records are inserted or removed elsewhere.
+"""
+
+import base64
+import json
+
+MAX_LIMIT = 100
+
+# Types of the cursor's elements, matching the sort key it resumes from
+NEWEST_FIRST_CURSOR = (str, int)  # newest_first_key: (created_at, id)
+ID_CURSOR = ((str, int),)  # page_in_order: (id,)
+
+
+def parse_page_args(args, cursor_types, max_limit=MAX_LIMIT):
+    """(limit, after, fields) from request args; raises ValueError on bad input"""
+    limit = args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, max_limit)
+
+    after = args.get('after') or None
+    if after is not None:
+        after = decode_cursor(after, cursor_types)
+
+    fields = args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    return limit, after, fields or None
+
+
+def encode_cursor(key):
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, types):
+    """Sort key from a cursor; raises ValueError unless its elements have the given types"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError('invalid cursor') from e
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError('invalid cursor')
+    for value, expected in zip(key, types):
+        # bool is an int subclass, but never part of a sort key
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError('invalid cursor')
+    return tuple(key)
+
+
+def newest_first_key(record):
+    """Sort key of posts and bookings (sorted descending): creation time, then id"""
+    return (record.get('created_at') or '', record.get('id') or 0)
+
+
+def page_newest_first(records, limit, after):
+    """Slice records sorted by newest_first_key (descending); returns (page, next_cursor)"""
+    if after is not None:
+        records = [r for r in records if newest_first_key(r) < after]
+    return _cut(records, limit, newest_first_key)
+
+
+def page_in_order(records, limit, after, id_field='id'):
+    """Slice records kept in their stored order, resuming after the record with the cursor's id"""
+    if after is not None:
+        position = next((i for i, r in enumerate(records) if r.get(id_field) == after[0]), None)
+        if position is None:
+            raise ValueError('invalid cursor')
+        records = records[position + 1:]
+    return _cut(records, limit, lambda r: (r.get(id_field),))
+
+
+def _cut(records, limit, key):
+    if limit is None or len(records) <= limit:
+        return records, None
+    page = records[:limit]
+    return page, encode_cursor(key(page[-1]))
+
+
+def project(records, fields, always=('id',)):
+    """Copies of records holding only the requested fields"""
+    if not fields:
+        return records
+    keep = list(always) + [field for field in fields if field not in always]
+    return [{field: record[field] for field in keep if field in record} for record in records]
@@ -0,0 +1,142 @@
+"""
+Password hashing off the request threads.
+
+pbkdf2 is deliberately slow (hundreds of ms of pure CPU), so hashing inline
+lets a burst of logins stall every other request on the worker. Hashes run
+in a small process pool instead. At most max_pending hashes may be queued or
+running; past that, callers get HasherBusy immediately (the API answers 503
+with Retry-After) rather than piling up behind the pool.
+
+The pool processes come from a fork server (spawn where there is none), never
+from a plain fork: by the time the first password is hashed this process runs
+several background threads, and a child forked while one of them holds a lock
+can deadlock on it.
+
+Timings of recent hashes (time in the pool and total time including the
+queue) are kept for /api/metrics, to size the pool.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from percentiles import latency_summary
+
+
+class HasherBusy(Exception):
+    """Every hashing slot is taken; retry after retry_after seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hasher is saturated')
+        self.retry_after = retry_after
+
+
+def _pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # The server only needs the hash functions, not the web app that started it
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+# Run inside the pool processes; they return the hash duration alongside the result
+def _timed_check(pwhash, password):
+    started = time.perf_counter()
+    try:
+        valid = check_password_hash(pwhash, password)
+    except Exception:
+        valid = False
+    return valid, time.perf_counter() - started
+
+
+def _timed_generate(password):
+    started = time.perf_counter()
+    pwhash = generate_password_hash(password)
+    return pwhash, time.perf_counter() - started
+
+
+class PasswordHasher:
+    """check/generate password hashes in a bounded process pool (workers=0 hashes inline)"""
+
+    def __init__(self, workers=2, max_pending=16, timeout=10.0, retry_after=1, samples=1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self._hash_times = deque(maxlen=samples)
+        self._total_times = deque(maxlen=samples)
+        self.completed = {'check': 0, 'generate': 0}
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _executor(self):
+        # A pool inherited through fork (e.g. gunicorn preload) belongs to the parent
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy(self.retry_after)
+
+        started = time.perf_counter()
+        release_slot = True
+        try:
+            if self.workers <= 0:
+                result, hash_time = fn(*args)
+            else:
+                future = self._executor().submit(fn, *args)
+                try:
+                    result, hash_time = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    # The hash keeps its slot until it really finishes
+                    release_slot = False
+                    future.add_done_callback(lambda _: self._slots.release())
+                    with self._stats_lock:
+                        self.timeouts += 1
+                    raise HasherBusy(self.retry_after)
+        finally:
+            if release_slot:
+                self._slots.release()
+
+        with self._stats_lock:
+            self.completed[op] += 1
+            self._hash_times.append(hash_time)
+            self._total_times.append(time.perf_counter() - started)
+        return result
+
+    def check(self, pwhash, password):
+        """True if password matches pwhash (False for malformed hashes)"""
+        return self._run('check', _timed_check, pwhash, password)
+
+    def generate(self, password):
+        return self._run('generate', _timed_generate, password)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'completed': dict(self.completed),
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'hash_time': latency_summary(self._hash_times),
+                'total_time': latency_summary(self._total_times)
+            }
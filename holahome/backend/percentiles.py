@@ -0,0 +1,25 @@
+"""
+Percentiles for the latency and size figures reported in /api/metrics and by
+chat_loadtest.py.
+"""
+
+import math
+
+
+def percentile(ordered, q):
+    """Nearest-rank q-th percentile (0-100) of an already sorted list, 0 when empty"""
+    if not ordered:
+        return 0
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(samples):
+    """p50 / p95 / max in milliseconds of durations in seconds"""
+    ordered = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000.0, 2)
+    return {
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'max_ms': ms(ordered[-1] if ordered else 0)
+    }
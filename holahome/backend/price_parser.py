@@ -0,0 +1,148 @@
+"""
+Price parsing for HolaHome listings.
+
+Listing prices are free-form strings such as "2,800,000 - 3,000,000 VND/tháng",
+"<strong>Giá:</strong> 1.500.000 VND/tháng", "1.5 - 2.5 triệu" or "3tr5".
+parse_price() turns them into integer (price_min, price_max) in VND once, when
+a listing is published, so readers filter and sort on numbers instead of
+re-parsing text. Only the first price (or range) counts: areas such as "25m2"
+are skipped, and numbers after it (deposit, utilities) are ignored.
+
+Backfill the listings already in data.json with:
+    python price_parser.py backfill [--data path/to/data.json]
+"""
+
+import argparse
+import os
+import re
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+# number, unit, digits after the unit ("3tr5" = 3.5 triệu), area suffix ("25m2")
+NUMBER_PATTERN = re.compile(
+    r'(\d[\d.,]*)'
+    r'(?:\s*(tỷ|ty|triệu|trieu|tr|nghìn|ngàn|ngan|k)(?![a-zà-ỹ])(\d{1,3}(?![\d.,]))?)?'
+    r'(\s*(?:m2|m²|mét vuông|met vuong)(?![a-zà-ỹ\d]))?'
+)
+RANGE_SEPARATOR = re.compile(r'^\s*(?:-|–|—|~|đến|den|tới|toi|to)\s*$')
+THOUSANDS_PATTERN = re.compile(r'^\d{1,3}([.,])\d{3}(\1\d{3})*$')
+
+UNIT_MULTIPLIERS = {
+    'tỷ': 1_000_000_000, 'ty': 1_000_000_000,
+    'triệu': 1_000_000, 'trieu': 1_000_000, 'tr': 1_000_000,
+    'nghìn': 1_000, 'ngàn': 1_000, 'ngan': 1_000, 'k': 1_000
+}
+
+# Bare numbers below this are written in millions ("1.5 - 2.5" means 1.5 - 2.5 triệu)
+MILLIONS_BELOW = 1000
+
+
+def _to_number(token):
+    """'2,800,000' / '1.500.000' -> thousands separators; '1.5' / '1,5' -> decimal"""
+    token = token.rstrip('.,')
+    if THOUSANDS_PATTERN.match(token):
+        return float(re.sub(r'[.,]', '', token))
+    if token.count('.') + token.count(',') == 1:
+        return float(token.replace(',', '.'))
+    return float(re.sub(r'[^\d]', '', token) or 0)
+
+
+def parse_price(value):
+    """Return (price_min, price_max) in VND, or (None, None) if value holds no price"""
+    if isinstance(value, bool) or value is None:
+        return None, None
+    if isinstance(value, (int, float)):
+        return int(value), int(value)
+
+    text = TAG_PATTERN.sub(' ', str(value)).lower()
+    matches = [match for match in NUMBER_PATTERN.finditer(text) if not match.group(4)]
+    if not matches:
+        return None, None
+
+    # The first price, and the second only when the two form a range ("2 - 3 triệu")
+    matches = matches[:2]
+    if len(matches) == 2 and not RANGE_SEPARATOR.match(text[matches[0].end():matches[1].start()]):
+        matches = matches[:1]
+
+    # A unit written once applies to the whole range ("1.5 - 2.5 triệu")
+    units = [match.group(2) for match in matches if match.group(2)]
+    prices = []
+    for match in matches:
+        token, unit, fraction = match.group(1, 2, 3)
+        number = _to_number(token)
+        if fraction and token.isdigit():
+            number = float(f'{token}.{fraction}')
+        unit = unit or (units[-1] if units else None)
+        if unit:
+            number *= UNIT_MULTIPLIERS[unit]
+        elif number < MILLIONS_BELOW:
+            number *= 1_000_000
+        prices.append(int(round(number)))
+
+    return min(prices), max(prices)
+
+
+def format_price_range(price_min, price_max):
+    """'2800000 - 3000000' or '2800000', the numbers-only format stored on bookings"""
+    if price_min is None:
+        return '0'
+    if price_max is not None and price_max != price_min:
+        return f'{price_min} - {price_max}'
+    return str(price_min)
+
+
+def with_price_range(listing):
+    """Copy of listing with price_min/price_max placed right after its price"""
+    price_min, price_max = parse_price(listing.get('price'))
+    result = {}
+    for key, value in listing.items():
+        if key in ('price_min', 'price_max'):
+            continue
+        result[key] = value
+        if key == 'price':
+            result['price_min'] = price_min
+            result['price_max'] = price_max
+    if 'price' not in listing:
+        result['price_min'] = price_min
+        result['price_max'] = price_max
+    return result
+
+
+def needs_backfill(listings):
+    return any('price_min' not in listing or 'price_max' not in listing for listing in listings)
+
+
+def backfill_prices(listings):
+    """Add price_min/price_max to every listing in place; returns how many were filled"""
+    filled = 0
+    for index, listing in enumerate(listings):
+        if 'price_min' in listing and 'price_max' in listing:
+            continue
+        listings[index] = with_price_range(listing)
+        filled += 1
+    return filled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HolaHome price normalization')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill = subparsers.add_parser('backfill', help='add price_min/price_max to the listings in data.json')
+    backfill.add_argument('--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data.json'),
+                          help='listings file (default: ../data.json)')
+
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        # Go through the document store so the write is locked and atomic
+        from json_store import DocumentStore
+
+        store = DocumentStore(journal=os.getenv('JSON_JOURNAL', 'false').lower() == 'true')
+        with store.transaction(os.path.abspath(args.data)) as listings:
+            if not isinstance(listings, list):
+                listings = listings.setdefault('properties', [])
+            filled = backfill_prices(listings)
+        print(f'✅ Added price ranges to {filled} listings in {args.data}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Token budget for chat prompts.
+
+A chat prompt is the static system prompt, the retrieved property context,
+the recent conversation and the new question. PromptBudget fits them into
+max_tokens, in order of priority:
+    1. the system prompt, estimated once when the budget is created
+    2. the question, clipped to message_tokens
+    3. the property context, dropping listings from the end past context_tokens
+    4. the conversation, newest turns first, each clipped to turn_tokens
+    5. a one-line extractive summary of the turns that no longer fit
+Tokens are estimated (no tokenizer is bundled for Gemini or OpenAI): one per
+punctuation mark or symbol and TOKENS_PER_WORD per word, which errs on the
+high side for Vietnamese text.
+"""
+
+import math
+import re
+import threading
+from collections import deque
+
+from percentiles import percentile
+
+PIECE_PATTERN = re.compile(r'\w+|[^\w\s]')
+WORD_PATTERN = re.compile(r'\w')
+
+TOKENS_PER_WORD = 1.5
+TOKENS_PER_TURN = 4  # role label and separators around each message
+ELLIPSIS = '…'
+
+
+def estimate_tokens(text):
+    words = symbols = 0
+    for piece in PIECE_PATTERN.findall(str(text or '')):
+        if WORD_PATTERN.match(piece):
+            words += 1
+        else:
+            symbols += 1
+    return math.ceil(words * TOKENS_PER_WORD) + symbols
+
+
+def clip_text(text, max_tokens):
+    """text cut (at a word boundary) to about max_tokens, with an ellipsis if anything was cut"""
+    text = str(text or '')
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = 0
+    end = 0
+    for match in PIECE_PATTERN.finditer(text):
+        cost = TOKENS_PER_WORD if WORD_PATTERN.match(match.group()) else 1
+        if used + cost > max_tokens - 1:  # keep a token for the ellipsis
+            break
+        used += cost
+        end = match.end()
+    return text[:end].rstrip() + ELLIPSIS
+
+
+class BudgetedPrompt:
+    """The parts of a prompt that fit the budget"""
+
+    def __init__(self, system, message, context, history, summary, tokens):
+        self.system = system  # the static system prompt, unchanged
+        self.message = message
+        self.context = context
+        self.history = history  # [{'role', 'content'}], oldest first
+        self.summary = summary  # '' when no turn was dropped
+        self.tokens = tokens  # estimated tokens per section
+
+
+class PromptBudget:
+    """Fits chat prompts into max_tokens around a fixed system prompt"""
+
+    def __init__(self, system_prompt, max_tokens=2500, message_tokens=300, context_tokens=400,
+                 history_turns=5, turn_tokens=150, summary_tokens=60, samples=1000):
+        self.system_prompt = system_prompt
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.max_tokens = max_tokens
+        self.message_tokens = message_tokens
+        self.context_tokens = context_tokens
+        self.history_turns = history_turns
+        self.turn_tokens = turn_tokens
+        self.summary_tokens = summary_tokens
+
+        self._lock = threading.Lock()
+        self._totals = deque(maxlen=samples)
+        self.prompts = 0
+        self.clipped_messages = 0
+        self.trimmed_contexts = 0
+        self.dropped_turns = 0
+        self.summaries = 0
+
+    def _fit_context(self, context, limit):
+        """Drop whole listing lines from the end until the context fits"""
+        if estimate_tokens(context) <= limit:
+            return context
+        lines = context.split('\n')
+        while lines and estimate_tokens('\n'.join(lines)) > limit:
+            lines.pop()
+        # Only the header left means no listing fits
+        return '\n'.join(lines) if any(line.startswith('•') for line in lines) else ''
+
+    @staticmethod
+    def _summarize(turns, max_tokens):
+        """Extractive summary of dropped turns: the customer's earlier questions"""
+        questions = [' '.join(str(turn.get('content', '')).split()[:15])
+                     for turn in turns if turn.get('role') == 'user' and turn.get('content')]
+        if not questions or max_tokens <= 0:
+            return ''
+        return clip_text('Khách đã hỏi: ' + '; '.join(questions), max_tokens)
+
+    def fit(self, message, history=(), context=''):
+        history = list(history or [])
+        if history and history[-1].get('role') == 'user' and str(history[-1].get('content', '')).strip() == message.strip():
+            # The frontend sends the question as the last history turn too
+            history = history[:-1]
+        available = self.max_tokens - self.system_tokens
+
+        fitted_message = clip_text(message, min(self.message_tokens, max(available, 1)))
+        message_cost = estimate_tokens(fitted_message) + TOKENS_PER_TURN
+        available -= message_cost
+
+        fitted_context = self._fit_context(context or '', max(0, min(self.context_tokens, available)))
+        context_cost = estimate_tokens(fitted_context)
+        available -= context_cost
+
+        # Newest turns first; keep going back while they fit, leaving room for a summary
+        recent = history[-self.history_turns:] if self.history_turns > 0 else []
+        older = history[:len(history) - len(recent)]
+        kept = []
+        history_cost = 0
+        for index in range(len(recent) - 1, -1, -1):
+            turn = recent[index]
+            content = clip_text(turn.get('content', ''), self.turn_tokens)
+            cost = estimate_tokens(content) + TOKENS_PER_TURN
+            if history_cost + cost > available - (self.summary_tokens if index > 0 or older else 0):
+                older = older + recent[:index + 1]
+                break
+            kept.append({'role': turn.get('role'), 'content': content})
+            history_cost += cost
+        kept.reverse()
+
+        summary = self._summarize(older, min(self.summary_tokens, available - history_cost))
+        summary_cost = estimate_tokens(summary)
+
+        tokens = {
+            'system': self.system_tokens,
+            'message': message_cost,
+            'context': context_cost,
+            'history': history_cost,
+            'summary': summary_cost
+        }
+        tokens['total'] = sum(tokens.values())
+
+        with self._lock:
+            self.prompts += 1
+            self._totals.append(tokens['total'])
+            self.clipped_messages += fitted_message != message
+            self.trimmed_contexts += fitted_context != (context or '')
+            self.dropped_turns += len(recent) - len(kept)
+            self.summaries += bool(summary)
+
+        return BudgetedPrompt(self.system_prompt, fitted_message, fitted_context, kept, summary, tokens)
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self._totals)
+            return {
+                'max_tokens': self.max_tokens,
+                'system_tokens': self.system_tokens,
+                'prompts': self.prompts,
+                'tokens_p50': percentile(ordered, 50),
+                'tokens_p95': percentile(ordered, 95),
+                'tokens_max': ordered[-1] if ordered else 0,
+                'clipped_messages': self.clipped_messages,
+                'trimmed_contexts': self.trimmed_contexts,
+                'dropped_turns': self.dropped_turns,
+                'summaries': self.summaries
+            }
@@ -0,0 +1,309 @@
+"""
+Faceted search over the listings in data.json.
+
+PropertyIndex keeps precomputed indexes so a query never scans the catalog:
+    - price: price_min and price_max sorted, each with the ids in the same
+      order; a range query is two bisects, and a listing matches when its
+      price range overlaps
+    - area: buckets of AREA_BUCKET m2, only the boundary buckets are re-checked
+    - loai and locality: hash maps from the folded value to listing ids
+Every facet yields a candidate set; the sets are intersected smallest first.
+
+Localities come from the comma-separated parts of the address (plus the
+district/city fields of listings published from posts), folded to lowercase
+ASCII without administrative prefixes, so "Xã Tiến Xuân", "Tiến Xuân" and
+"tien xuan" all match the same listings.
+"""
+
+import bisect
+import re
+import threading
+import unicodedata
+
+from price_parser import TAG_PATTERN
+
+AREA_BUCKET = 5
+
+PARENTHESES_PATTERN = re.compile(r'\([^)]*\)?')
+ADMIN_PREFIX_PATTERN = re.compile(r'^(xa|thon|phuong|quan|huyen|thi tran|thanh pho|tp\.?|tinh|dia chi:?)\s+')
+
+
+def fold(text):
+    """Lowercase ASCII form of Vietnamese text: 'Thạch Hoà' -> 'thach hoa'"""
+    text = unicodedata.normalize('NFD', str(text or '')).replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.lower().split())
+
+
+def normalize_locality(text):
+    text = fold(PARENTHESES_PATTERN.sub(' ', TAG_PATTERN.sub(' ', str(text or '')))).strip(' .-')
+    return ADMIN_PREFIX_PATTERN.sub('', text).strip()
+
+
+def listing_localities(listing):
+    places = [listing.get('district'), listing.get('city')]
+    places += TAG_PATTERN.sub(' ', str(listing.get('address') or '')).split(',')
+    localities = {normalize_locality(place) for place in places if place}
+    # "Thôn 3" only leaves a number, which is not a usable locality
+    return {locality for locality in localities if locality and not locality.isdigit()}
+
+
+def _area_value(listing):
+    try:
+        return float(listing.get('area'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _facets(listing):
+    """Everything the indexes store for one listing; a change means re-indexing it"""
+    return (
+        listing.get('loai'),
+        listing.get('price_min'),
+        listing.get('price_max'),
+        _area_value(listing),
+        frozenset(listing_localities(listing)),
+        fold(f"{TAG_PATTERN.sub(' ', str(listing.get('title') or ''))} {TAG_PATTERN.sub(' ', str(listing.get('address') or ''))}")
+    )
+
+
+class PropertyIndex:
+    """Facet indexes over the catalog, kept in step with data.json incrementally"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+
+        self._listings = {}  # id -> listing (shared, read-only)
+        self._facets = {}  # id -> _facets(listing)
+        self._seq = {}  # id -> position used for catalog order
+        # Sorted prices with the listing ids in the same order; bisects only ever compare
+        # prices, so ids may be of any type
+        self._price_min_keys, self._price_min_ids = [], []
+        self._price_max_keys, self._price_max_ids = [], []
+        self._area_buckets = {}  # bucket -> ids
+        self._area_keys = []  # sorted buckets that hold listings
+        self._loai = {}  # folded loai -> ids
+        self._locality = {}  # locality -> ids
+        self._unpriced = set()
+        self._unsized = set()
+
+        self.syncs = 0
+        self.added = 0
+        self.removed = 0
+        self.queries = 0
+
+    # ============================================
+    # MAINTENANCE
+    # ============================================
+
+    def sync(self, listings, version):
+        """Bring the indexes up to date with listings (the catalog at version).
+
+        Only listings that were added, removed or had a facet changed are
+        re-indexed; a view count update costs one comparison per listing.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            seen = set()
+            for position, listing in enumerate(listings):
+                property_id = listing.get('id')
+                if property_id is None or property_id in seen:
+                    continue
+                seen.add(property_id)
+                facets = _facets(listing)
+                if self._facets.get(property_id) != facets:
+                    self._remove(property_id)
+                    self._add(listing, facets)
+                self._listings[property_id] = listing
+                self._seq[property_id] = position
+            for property_id in [pid for pid in self._facets if pid not in seen]:
+                self._remove(property_id)
+            self.version = version
+            self.syncs += 1
+
+    def add(self, listing, first=True):
+        """Index a newly published listing (shown first in catalog order by default)"""
+        with self._lock:
+            property_id = listing.get('id')
+            self._remove(property_id)
+            self._add(listing, _facets(listing))
+            if first:
+                self._seq[property_id] = min(self._seq.values(), default=0) - 1
+            else:
+                self._seq[property_id] = max(self._seq.values(), default=0) + 1
+
+    def remove(self, property_id):
+        with self._lock:
+            self._remove(property_id)
+
+    def mark_synced(self, version):
+        """Record that add()/remove() brought the indexes to the catalog at version"""
+        with self._lock:
+            self.version = version
+
+    def _add(self, listing, facets):
+        property_id = listing.get('id')
+        loai, price_min, price_max, area, localities, _ = facets
+
+        self._listings[property_id] = listing
+        self._facets[property_id] = facets
+
+        if price_min is None or price_max is None:
+            self._unpriced.add(property_id)
+        else:
+            self._insert_keyed(self._price_min_keys, self._price_min_ids, price_min, property_id)
+            self._insert_keyed(self._price_max_keys, self._price_max_ids, price_max, property_id)
+
+        if area is None:
+            self._unsized.add(property_id)
+        else:
+            bucket = int(area // AREA_BUCKET)
+            if bucket not in self._area_buckets:
+                bisect.insort(self._area_keys, bucket)
+            self._area_buckets.setdefault(bucket, set()).add(property_id)
+
+        self._loai.setdefault(fold(loai), set()).add(property_id)
+        for locality in localities:
+            self._locality.setdefault(locality, set()).add(property_id)
+        self.added += 1
+
+    def _remove(self, property_id):
+        facets = self._facets.pop(property_id, None)
+        self._listings.pop(property_id, None)
+        self._seq.pop(property_id, None)
+        if facets is None:
+            return
+        loai, price_min, price_max, area, localities, _ = facets
+
+        if price_min is None or price_max is None:
+            self._unpriced.discard(property_id)
+        else:
+            self._delete_keyed(self._price_min_keys, self._price_min_ids, price_min, property_id)
+            self._delete_keyed(self._price_max_keys, self._price_max_ids, price_max, property_id)
+
+        if area is None:
+            self._unsized.discard(property_id)
+        else:
+            bucket = int(area // AREA_BUCKET)
+            self._discard(self._area_buckets, bucket, property_id)
+            if bucket not in self._area_buckets:
+                self._delete_sorted(self._area_keys, bucket)
+
+        self._discard(self._loai, fold(loai), property_id)
+        for locality in localities:
+            self._discard(self._locality, locality, property_id)
+        self.removed += 1
+
+    @staticmethod
+    def _delete_sorted(array, item):
+        index = bisect.bisect_left(array, item)
+        if index < len(array) and array[index] == item:
+            del array[index]
+
+    @staticmethod
+    def _insert_keyed(keys, ids, key, property_id):
+        index = bisect.bisect_right(keys, key)
+        keys.insert(index, key)
+        ids.insert(index, property_id)
+
+    @staticmethod
+    def _delete_keyed(keys, ids, key, property_id):
+        for index in range(bisect.bisect_left(keys, key), bisect.bisect_right(keys, key)):
+            if ids[index] == property_id:
+                del keys[index], ids[index]
+                return
+
+    @staticmethod
+    def _discard(mapping, key, property_id):
+        ids = mapping.get(key)
+        if ids is not None:
+            ids.discard(property_id)
+            if not ids:
+                del mapping[key]
+
+    # ============================================
+    # QUERIES
+    # ============================================
+
+    def _price_candidates(self, low, high):
+        """Listings whose [price_min, price_max] overlaps [low, high]"""
+        candidates = None
+        if high is not None:
+            end = bisect.bisect_right(self._price_min_keys, high)
+            candidates = set(self._price_min_ids[:end])
+        if low is not None:
+            start = bisect.bisect_left(self._price_max_keys, low)
+            above = set(self._price_max_ids[start:])
+            candidates = above if candidates is None else candidates & above
+        return candidates
+
+    def _area_candidates(self, low, high):
+        """Listings with low <= area <= high, visiting only the buckets that hold listings"""
+        first = low // AREA_BUCKET if low is not None else None
+        last = high // AREA_BUCKET if high is not None else None
+        start = bisect.bisect_left(self._area_keys, first) if first is not None else 0
+        end = bisect.bisect_right(self._area_keys, last) if last is not None else len(self._area_keys)
+        candidates = set()
+        for bucket in self._area_keys[start:end]:
+            ids = self._area_buckets[bucket]
+            if bucket in (first, last):
+                # Boundary buckets hold areas on both sides of the limit
+                ids = {pid for pid in ids
+                       if (low is None or self._facets[pid][3] >= low)
+                       and (high is None or self._facets[pid][3] <= high)}
+            candidates |= ids
+        return candidates
+
+    def search(self, loai=None, localities=(), price_min=None, price_max=None,
+               area_min=None, area_max=None, keyword=None, sort=None):
+        """Matching listings in catalog order (or by price with sort='price_asc'/'price_desc')"""
+        with self._lock:
+            self.queries += 1
+            candidate_sets = []
+            if loai:
+                candidate_sets.append(self._loai.get(fold(loai), set()))
+            for locality in localities:
+                candidate_sets.append(self._locality.get(normalize_locality(locality), set()))
+            if price_min is not None or price_max is not None:
+                candidate_sets.append(self._price_candidates(price_min, price_max))
+            if area_min is not None or area_max is not None:
+                candidate_sets.append(self._area_candidates(area_min, area_max))
+
+            if candidate_sets:
+                candidate_sets.sort(key=len)
+                matches = set(candidate_sets[0])
+                for ids in candidate_sets[1:]:
+                    matches &= ids
+                    if not matches:
+                        break
+            else:
+                matches = set(self._facets)
+
+            if keyword:
+                # Substring match only runs on the listings left after the indexed facets
+                keyword = fold(keyword)
+                matches = {pid for pid in matches if keyword in self._facets[pid][5]}
+
+            if sort in ('price_asc', 'price_desc'):
+                reverse = sort == 'price_desc'
+                priced = sorted((pid for pid in matches if pid not in self._unpriced),
+                                key=lambda pid: (self._facets[pid][1], self._seq[pid]), reverse=reverse)
+                unpriced = sorted((pid for pid in matches if pid in self._unpriced), key=self._seq.get)
+                ordered = priced + unpriced
+            else:
+                ordered = sorted(matches, key=self._seq.get)
+            return [self._listings[pid] for pid in ordered]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'listings': len(self._facets),
+                'localities': len(self._locality),
+                'area_buckets': len(self._area_buckets),
+                'syncs': self.syncs,
+                'indexed': self.added,
+                'unindexed': self.removed,
+                'queries': self.queries
+            }
@@ -0,0 +1,147 @@
+"""
+Cache of fully rendered API responses.
+
+A cached body is serialized and compressed once, then served as-is until the
+version of the data it was built from changes. Bodies carry a strong ETag
+(hash of the uncompressed bytes, plus "-gzip" / "-br" for a compressed
+variant, since each encoding is a different representation), so clients
+revalidate with If-None-Match and get an empty 304 when nothing changed. The
+hash is deterministic, which keeps ETags identical across worker processes.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: gzip is always available
+    brotli = None
+
+
+class CachedBody:
+    """Serialized response body with its ETag and precompressed variants"""
+
+    def __init__(self, body, mimetype='application/json', headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        # mtime=0 keeps the gzip bytes identical between builds and workers
+        self.encodings = {'gzip': gzip.compress(body, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=5)
+
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.encodings.values())
+
+
+class ResponseCache:
+    """One cached body per name, rebuilt when the caller's version changes.
+
+    At most max_entries names are kept; the least recently used is dropped.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # name -> (version, CachedBody), least recently used first
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.bytes_uncompressed = 0
+
+    def get(self, name, version, build):
+        """Cached body for name at version.
+
+        On a miss build() returns the uncompressed bytes, or (bytes, headers)
+        for extra response headers that belong to the body.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and entry[0] == version:
+                self.hits += 1
+                self._entries.move_to_end(name)
+                return entry[1]
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+
+        # Only one thread renders a given body; the others wait and reuse it
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry and entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+
+            result = build()
+            body, headers = result if isinstance(result, tuple) else (result, None)
+            cached = CachedBody(body, headers=headers)
+            with self._lock:
+                self._entries[name] = (version, cached)
+                self._entries.move_to_end(name)
+                self.builds += 1
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+            return cached
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def respond(self, cached, request):
+        """Response for cached: 304 on a matching If-None-Match, otherwise the best encoding"""
+        encoding = self._choose_encoding(cached, request)
+        etag = f'{cached.etag}-{encoding}' if encoding else cached.etag
+        if request.if_none_match.contains(etag):
+            with self._lock:
+                self.not_modified += 1
+            response = Response(status=304)
+        else:
+            data = cached.encodings[encoding] if encoding else cached.body
+            response = Response(data, mimetype=cached.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            with self._lock:
+                self.bytes_sent += len(data)
+                self.bytes_uncompressed += len(cached.body)
+
+        response.headers.update(cached.headers)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    @staticmethod
+    def _choose_encoding(cached, request):
+        accepted = request.accept_encodings
+        best = None
+        for encoding in ('br', 'gzip'):
+            quality = accepted[encoding]
+            if encoding in cached.encodings and quality > 0 and (best is None or quality > best[1]):
+                best = (encoding, quality)
+        return best[0] if best else None
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.builds
+            return {
+                'entries': len(self._entries),
+                'cached_bytes': sum(entry[1].size() for entry in self._entries.values()),
+                'hits': self.hits,
+                'builds': self.builds,
+                'hit_ratio': round(self.hits / requests, 4) if requests else 0.0,
+                'not_modified': self.not_modified,
+                'bytes_sent': self.bytes_sent,
+                'bytes_uncompressed': self.bytes_uncompressed,
+                'brotli': brotli is not None
+            }
@@ -0,0 +1,578 @@
+"""
+SQLite storage engine for HolaHome.
+
+Optional replacement for the JSON files behind accounts, ratings, comments,
+favorites, bookings and posts (enable with STORAGE_BACKEND=sqlite). Records
+keep their exact JSON shape in a `data` column; the fields the API filters on
+are copied into indexed columns so lookups no longer scan every record.
+
+Migrate the existing JSON files once with:
+    python sqlite_store.py migrate [--db path/to/holahome.db]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    account_type TEXT NOT NULL,
+    email TEXT,
+    username TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_email ON accounts(email);
+CREATE INDEX IF NOT EXISTS idx_accounts_username ON accounts(username);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    property_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (property_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    property_id TEXT NOT NULL,
+    user_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_property ON comments(property_id);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    user_id TEXT NOT NULL,
+    property_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, property_id)
+);
+CREATE INDEX IF NOT EXISTS idx_favorites_property ON favorites(property_id);
+
+CREATE TABLE IF NOT EXISTS property_stats (
+    property_id TEXT PRIMARY KEY,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    favorite_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    property_id TEXT,
+    status TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_property ON bookings(property_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings(created_at);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    partner_id TEXT,
+    status TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_partner ON posts(partner_id, status);
+CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status, created_at);
+"""
+
+# Counter name -> key holding the same counter in the JSON files
+COUNTER_KEYS = {
+    'user': 'next_user_id',
+    'partner': 'next_partner_id',
+    'post': 'next_post_id',
+    'booking': 'next_booking_id'
+}
+
+ACCOUNT_ID_PREFIX = {'user': 'user#', 'partner': 'partner#'}
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+class SQLiteStore:
+    """Storage operations used by app.py, backed by one SQLite database in WAL mode"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    # ============================================
+    # CONNECTIONS
+    # ============================================
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front so
+        read-modify-write sequences (id counters) are safe across processes"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _query(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def _next_id(self, conn, name, start=1):
+        row = conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        value = row['value'] if row else start
+        conn.execute('INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)', (name, value + 1))
+        return value
+
+    # ============================================
+    # ACCOUNTS
+    # ============================================
+
+    def get_account(self, user_id):
+        rows = self._query('SELECT data FROM accounts WHERE id = ?', (user_id,))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def find_account(self, identifier, account_type=None):
+        """Account matching an email, username or id, as (id, record) or (None, None)"""
+        sql = 'SELECT id, data FROM accounts WHERE (email = ? OR username = ? OR id = ?)'
+        params = [identifier, identifier, identifier]
+        if account_type:
+            sql += ' AND account_type = ?'
+            params.append(account_type)
+        # Regular users win over partners, like the JSON lookup order
+        sql += " ORDER BY account_type = 'partner' LIMIT 1"
+        rows = self._query(sql, params)
+        if not rows:
+            return None, None
+        return rows[0]['id'], json.loads(rows[0]['data'])
+
+    def account_field_taken(self, field, value, exclude_id=None, account_type=None):
+        """True if another account already uses this email/username"""
+        if field not in ('email', 'username'):
+            raise ValueError(f'Unsupported account field: {field}')
+        sql = f'SELECT 1 FROM accounts WHERE {field} = ? AND id != ?'
+        params = [value, exclude_id or '']
+        if account_type:
+            sql += ' AND account_type = ?'
+            params.append(account_type)
+        return bool(self._query(sql + ' LIMIT 1', params))
+
+    def create_account(self, account_type, fields):
+        """Insert a new account with the next id for its type; returns (id, record)"""
+        with self._transaction() as conn:
+            next_id = self._next_id(conn, account_type)
+            user_id = f"{ACCOUNT_ID_PREFIX.get(account_type, 'user#')}{str(next_id).zfill(5)}"
+            record = {'id': user_id, **fields}
+            self._put_account(conn, user_id, record)
+        return user_id, record
+
+    def save_account(self, user_id, record):
+        with self._transaction() as conn:
+            self._put_account(conn, user_id, record)
+
+    def _put_account(self, conn, user_id, record):
+        conn.execute(
+            'INSERT OR REPLACE INTO accounts (id, account_type, email, username, data) VALUES (?, ?, ?, ?, ?)',
+            (user_id, record.get('account_type', 'user'), record.get('email'), record.get('username'), _dumps(record))
+        )
+
+    # ============================================
+    # RATINGS
+    # ============================================
+
+    def get_ratings(self, property_id):
+        rows = self._query('SELECT data FROM ratings WHERE property_id = ? ORDER BY rowid', (property_id,))
+        return [json.loads(row['data']) for row in rows]
+
+    def upsert_rating(self, property_id, user_id, rating, now):
+        """Insert or update a user's rating; returns the previous rating value or None"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT rating, data FROM ratings WHERE property_id = ? AND user_id = ?', (property_id, user_id)
+            ).fetchone()
+            if row:
+                # The column, not the record: migrated records may lack a usable 'rating'
+                record = json.loads(row['data'])
+                previous = row['rating']
+                record['rating'] = rating
+                record['updated_at'] = now
+                conn.execute(
+                    'UPDATE ratings SET rating = ?, data = ? WHERE property_id = ? AND user_id = ?',
+                    (rating, _dumps(record), property_id, user_id)
+                )
+                self._bump_stats(conn, property_id, rating_sum=rating - previous)
+                return previous
+            record = {'user_id': user_id, 'rating': rating, 'created_at': now}
+            conn.execute(
+                'INSERT INTO ratings (property_id, user_id, rating, data) VALUES (?, ?, ?, ?)',
+                (property_id, user_id, rating, _dumps(record))
+            )
+            self._bump_stats(conn, property_id, rating_sum=rating, rating_count=1)
+            return None
+
+    # ============================================
+    # COMMENTS
+    # ============================================
+
+    def get_comments(self, property_id):
+        rows = self._query('SELECT data FROM comments WHERE property_id = ? ORDER BY id', (property_id,))
+        return [json.loads(row['data']) for row in rows]
+
+    def add_comment(self, property_id, comment):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO comments (property_id, user_id, data) VALUES (?, ?, ?)',
+                (property_id, comment.get('user_id'), _dumps(comment))
+            )
+
+    # ============================================
+    # FAVORITES
+    # ============================================
+
+    def get_favorites(self, user_id):
+        rows = self._query('SELECT property_id FROM favorites WHERE user_id = ? ORDER BY rowid', (user_id,))
+        return [row['property_id'] for row in rows]
+
+    def add_favorite(self, user_id, property_id):
+        """Returns False if the property was already a favorite"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO favorites (user_id, property_id) VALUES (?, ?)', (user_id, property_id)
+            )
+            if cursor.rowcount > 0:
+                self._bump_stats(conn, property_id, favorite_count=1)
+                return True
+            return False
+
+    def remove_favorite(self, user_id, property_id):
+        """Returns False if the property was not a favorite"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM favorites WHERE user_id = ? AND property_id = ?', (user_id, property_id)
+            )
+            if cursor.rowcount > 0:
+                self._bump_stats(conn, property_id, favorite_count=-1)
+                return True
+            return False
+
+    # ============================================
+    # PROPERTY STATS
+    # ============================================
+
+    def _bump_stats(self, conn, property_id, rating_sum=0, rating_count=0, favorite_count=0):
+        conn.execute(
+            'INSERT INTO property_stats (property_id, rating_sum, rating_count, favorite_count) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(property_id) DO UPDATE SET rating_sum = rating_sum + excluded.rating_sum, '
+            'rating_count = rating_count + excluded.rating_count, '
+            'favorite_count = favorite_count + excluded.favorite_count',
+            (property_id, rating_sum, rating_count, favorite_count)
+        )
+        self._touch_stats(conn)
+
+    def _touch_stats(self, conn):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('property_stats', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+
+    def property_stats_version(self):
+        """Changes whenever any property's aggregates change"""
+        rows = self._query("SELECT value FROM counters WHERE name = 'property_stats'")
+        return rows[0]['value'] if rows else 0
+
+    def property_stats(self):
+        """{property_id: {'rating_sum', 'rating_count', 'favorite_count'}}"""
+        rows = self._query('SELECT property_id, rating_sum, rating_count, favorite_count FROM property_stats')
+        return {row['property_id']: {
+            'rating_sum': row['rating_sum'],
+            'rating_count': row['rating_count'],
+            'favorite_count': row['favorite_count']
+        } for row in rows}
+
+    def rebuild_property_stats(self):
+        """Recompute the running aggregates from the ratings and favorites tables"""
+        with self._transaction() as conn:
+            self._rebuild_stats(conn)
+
+    def _rebuild_stats(self, conn):
+        conn.execute('DELETE FROM property_stats')
+        conn.execute(
+            'INSERT INTO property_stats (property_id, rating_sum, rating_count) '
+            'SELECT property_id, SUM(rating), COUNT(*) FROM ratings GROUP BY property_id'
+        )
+        for row in conn.execute('SELECT property_id, COUNT(*) AS n FROM favorites GROUP BY property_id').fetchall():
+            self._bump_stats(conn, row['property_id'], favorite_count=row['n'])
+        self._touch_stats(conn)
+
+    # ============================================
+    # JSON SNAPSHOTS
+    # ============================================
+
+    def export_json(self, name):
+        """The document ratings.json / comments.json / favorites.json / bookings.json would hold"""
+        if name == 'ratings':
+            rows = self._query('SELECT property_id, data FROM ratings ORDER BY rowid')
+        elif name == 'comments':
+            rows = self._query('SELECT property_id, data FROM comments ORDER BY id')
+        elif name == 'favorites':
+            document = {}
+            for row in self._query('SELECT user_id, property_id FROM favorites ORDER BY rowid'):
+                document.setdefault(row['user_id'], []).append(row['property_id'])
+            return document
+        elif name == 'bookings':
+            rows = self._query('SELECT data FROM bookings ORDER BY id')
+            counter = self._query("SELECT value FROM counters WHERE name = 'booking'")
+            return {
+                'bookings': [json.loads(row['data']) for row in rows],
+                COUNTER_KEYS['booking']: counter[0]['value'] if counter else 1
+            }
+        else:
+            raise ValueError(f'No JSON snapshot for {name}')
+
+        document = {}
+        for row in rows:
+            document.setdefault(row['property_id'], []).append(json.loads(row['data']))
+        return document
+
+    # ============================================
+    # BOOKINGS & POSTS
+    # ============================================
+
+    def _insert_record(self, table, counter, fields, columns, on_write=None):
+        with self._transaction() as conn:
+            record_id = self._next_id(conn, counter)
+            record = {'id': record_id, **fields}
+            self._put_record(conn, table, record, columns)
+            if on_write:
+                on_write(conn)
+        return record
+
+    def _put_record(self, conn, table, record, columns):
+        names = ['id'] + columns + ['data']
+        values = [record['id']] + [record.get(c) for c in columns] + [_dumps(record)]
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            values
+        )
+
+    def _get_record(self, table, record_id):
+        rows = self._query(f'SELECT data FROM {table} WHERE id = ?', (record_id,))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def _update_record(self, table, record_id, changes, columns, on_write=None):
+        """Merge changes into a record; returns the updated record or None"""
+        with self._transaction() as conn:
+            row = conn.execute(f'SELECT data FROM {table} WHERE id = ?', (record_id,)).fetchone()
+            if not row:
+                return None
+            record = json.loads(row['data'])
+            record.update(changes)
+            self._put_record(conn, table, record, columns)
+            if on_write:
+                on_write(conn)
+        return record
+
+    def _list_records(self, table, filters, after=None, limit=None):
+        """Records newest first; after is the (created_at, id) of the previous page's last record"""
+        clauses, params = [], []
+        for column, value in filters:
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                if not value:
+                    return []
+                clauses.append(f"{column} IN ({','.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if after is not None:
+            clauses.append('(created_at < ? OR (created_at = ? AND id < ?))')
+            params.extend([after[0], after[0], after[1]])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        sql = f'SELECT data FROM {table}{where} ORDER BY created_at DESC, id DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        rows = self._query(sql, params)
+        return [json.loads(row['data']) for row in rows]
+
+    BOOKING_COLUMNS = ['property_id', 'status', 'created_at']
+    POST_COLUMNS = ['partner_id', 'status', 'created_at']
+
+    def create_booking(self, fields):
+        return self._insert_record('bookings', 'booking', fields, self.BOOKING_COLUMNS, self._touch_bookings)
+
+    def get_booking(self, booking_id):
+        return self._get_record('bookings', booking_id)
+
+    def update_booking(self, booking_id, changes):
+        return self._update_record('bookings', booking_id, changes, self.BOOKING_COLUMNS, self._touch_bookings)
+
+    def _touch_bookings(self, conn):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('bookings_version', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+
+    def bookings_version(self):
+        """Changes whenever a booking is created or updated"""
+        rows = self._query("SELECT value FROM counters WHERE name = 'bookings_version'")
+        return rows[0]['value'] if rows else 0
+
+    def list_bookings(self, status=None, property_id=None, property_ids=None, after=None, limit=None):
+        """Bookings newest first; property_ids restricts to a set of properties"""
+        filters = []
+        if status:
+            filters.append(('status', status))
+        if property_id:
+            filters.append(('property_id', property_id))
+        if property_ids is not None:
+            filters.append(('property_id', property_ids))
+        return self._list_records('bookings', filters, after, limit)
+
+    def create_post(self, fields):
+        return self._insert_record('posts', 'post', fields, self.POST_COLUMNS)
+
+    def get_post(self, post_id):
+        return self._get_record('posts', post_id)
+
+    def update_post(self, post_id, changes):
+        return self._update_record('posts', post_id, changes, self.POST_COLUMNS)
+
+    def delete_post(self, post_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM posts WHERE id = ?', (post_id,))
+
+    def list_posts(self, status=None, partner_id=None, after=None, limit=None):
+        filters = []
+        if status:
+            filters.append(('status', status))
+        if partner_id:
+            filters.append(('partner_id', partner_id))
+        return self._list_records('posts', filters, after, limit)
+
+    # ============================================
+    # MIGRATION
+    # ============================================
+
+    def migrate_from_json(self, data_dir):
+        """Replace the database contents with the JSON files under data_dir (the holahome folder)"""
+        def read(*parts):
+            try:
+                with open(os.path.join(data_dir, *parts), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return {}
+
+        user_accounts = read('accounts', 'user', 'accounts.json')
+        partner_accounts = read('accounts', 'partner', 'partner_accounts.json')
+        ratings = read('backend', 'ratings.json')
+        comments = read('backend', 'comments.json')
+        favorites = read('backend', 'favorites.json')
+        posts = read('backend', 'pending_posts.json')
+        bookings = read('backend', 'bookings.json')
+
+        counts = {}
+        with self._transaction() as conn:
+            for table in ('accounts', 'ratings', 'comments', 'favorites', 'bookings', 'posts', 'counters',
+                          'property_stats'):
+                conn.execute(f'DELETE FROM {table}')
+
+            for account_type, accounts, key in (('user', user_accounts, 'users'),
+                                                ('partner', partner_accounts, 'partners')):
+                for user_id, record in accounts.get(key, {}).items():
+                    record = dict(record)
+                    record.setdefault('account_type', account_type)
+                    self._put_account(conn, user_id, record)
+            counts['accounts'] = len(user_accounts.get('users', {})) + len(partner_accounts.get('partners', {}))
+
+            counts['ratings'] = 0
+            for property_id, items in ratings.items():
+                for record in items:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO ratings (property_id, user_id, rating, data) VALUES (?, ?, ?, ?)',
+                        (property_id, record['user_id'], record.get('rating') or 0, _dumps(record))
+                    )
+                    counts['ratings'] += 1
+
+            counts['comments'] = 0
+            for property_id, items in comments.items():
+                for record in items:
+                    conn.execute(
+                        'INSERT INTO comments (property_id, user_id, data) VALUES (?, ?, ?)',
+                        (property_id, record.get('user_id'), _dumps(record))
+                    )
+                    counts['comments'] += 1
+
+            counts['favorites'] = 0
+            for user_id, property_ids in favorites.items():
+                for property_id in property_ids:
+                    conn.execute(
+                        'INSERT OR IGNORE INTO favorites (user_id, property_id) VALUES (?, ?)', (user_id, property_id)
+                    )
+                    counts['favorites'] += 1
+
+            for record in bookings.get('bookings', []):
+                self._put_record(conn, 'bookings', record, self.BOOKING_COLUMNS)
+            counts['bookings'] = len(bookings.get('bookings', []))
+            self._touch_bookings(conn)
+
+            for record in posts.get('posts', []):
+                self._put_record(conn, 'posts', record, self.POST_COLUMNS)
+            counts['posts'] = len(posts.get('posts', []))
+
+            self._rebuild_stats(conn)
+
+            # Keep handing out ids after the ones already used in the JSON files
+            sources = {'user': user_accounts, 'partner': partner_accounts, 'post': posts, 'booking': bookings}
+            for name, source in sources.items():
+                value = source.get(COUNTER_KEYS[name], 1)
+                conn.execute('INSERT INTO counters (name, value) VALUES (?, ?)', (name, value))
+
+        return counts
+
+
+def default_db_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holahome.db')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HolaHome SQLite storage')
+    parser.add_argument('command', choices=['migrate'], help='migrate: import the JSON files into SQLite')
+    parser.add_argument('--db', type=str, default=os.getenv('SQLITE_PATH') or default_db_path(),
+                        help='Path to the SQLite database')
+    parser.add_argument('--data-dir', type=str,
+                        default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='HolaHome folder containing accounts/ and backend/')
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+    counts = store.migrate_from_json(args.data_dir)
+    print(f'✅ Migrated JSON data into {args.db}')
+    for table, count in counts.items():
+        print(f'   {table}: {count}')
+
+
+if __name__ == "__main__":
+    main()
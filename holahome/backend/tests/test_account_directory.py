@@ -0,0 +1,59 @@
+from account_directory import AccountDirectory
+
+
+def make_directory():
+    directory = AccountDirectory()
+    directory.sync('user', {
+        'user#1': {'email': 'an@example.com', 'username': 'an'},
+        'user#2': {'email': 'binh@example.com', 'username': 'shared'},
+        'user#3': {'email': 'chi@example.com', 'username': 'shared'},
+    }, version=1)
+    directory.sync('partner', {
+        'partner#1': {'email': 'an@example.com', 'username': 'an_partner'},
+    }, version=1)
+    return directory
+
+
+def test_find_by_email_username_or_id():
+    directory = make_directory()
+    assert directory.find('binh@example.com')[0] == 'user#2'
+    assert directory.find('an_partner')[0] == 'partner#1'
+    assert directory.find('user#3')[0] == 'user#3'
+    assert directory.find('nobody') == (None, None)
+
+
+def test_users_win_over_partners_and_file_order_breaks_ties():
+    directory = make_directory()
+    assert directory.find('an@example.com')[0] == 'user#1'
+    assert directory.find('an@example.com', account_type='partner')[0] == 'partner#1'
+    assert directory.find('shared')[0] == 'user#2'
+
+
+def test_field_taken():
+    directory = make_directory()
+    assert directory.field_taken('email', 'binh@example.com')
+    assert not directory.field_taken('email', 'binh@example.com', exclude_id='user#2')
+    assert directory.field_taken('email', 'an@example.com', exclude_id='user#1')
+    assert not directory.field_taken('email', 'an@example.com', exclude_id='user#1', account_type='user')
+    assert not directory.field_taken('username', 'free')
+
+
+def test_put_reindexes_changed_fields():
+    directory = make_directory()
+    directory.put('user#2', {'email': 'binh.new@example.com', 'username': 'shared'}, 'user', version=2)
+
+    assert not directory.field_taken('email', 'binh@example.com')
+    assert directory.find('binh.new@example.com')[0] == 'user#2'
+    # An update keeps the account's place in file order
+    assert directory.find('shared')[0] == 'user#2'
+    assert directory.is_current('user', 2)
+    assert directory.is_current('partner', 1)
+
+
+def test_sync_of_one_file_keeps_the_other():
+    directory = make_directory()
+    directory.sync('user', {'user#9': {'email': 'new@example.com'}}, version=2)
+
+    assert directory.get('user#1') is None
+    assert directory.find('new@example.com')[0] == 'user#9'
+    assert directory.find('an@example.com')[0] == 'partner#1'
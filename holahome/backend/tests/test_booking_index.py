@@ -0,0 +1,87 @@
+import random
+
+from booking_index import BookingIndex
+from pagination import newest_first_key
+
+
+def make_bookings(count=40, seed=7):
+    rng = random.Random(seed)
+    return [{
+        'id': booking_id,
+        'property_id': rng.choice(['p1', 'p2', 'p3']),
+        'status': rng.choice(['pending', 'confirmed', 'cancelled']),
+        # Repeated timestamps: ties are ordered by id
+        'created_at': f'2026-10-{rng.randint(1, 9):02d}T10:00:00',
+    } for booking_id in range(1, count + 1)]
+
+
+def newest_first(bookings):
+    return sorted(bookings, key=newest_first_key, reverse=True)
+
+
+def test_query_matches_a_scan():
+    bookings = make_bookings()
+    index = BookingIndex()
+    index.sync(bookings, version=1)
+
+    assert index.query() == newest_first(bookings)
+    assert index.query(property_id='p1') == newest_first(b for b in bookings if b['property_id'] == 'p1')
+    assert index.query(status='pending', property_id='p2') == newest_first(
+        b for b in bookings if b['status'] == 'pending' and b['property_id'] == 'p2')
+    assert index.query(property_ids={'p1', 'p3'}) == newest_first(
+        b for b in bookings if b['property_id'] in ('p1', 'p3'))
+    assert index.query(property_ids=set()) == []
+
+
+def test_cursor_pages_cover_the_list_in_order():
+    bookings = make_bookings()
+    index = BookingIndex()
+    index.sync(bookings, version=1)
+
+    for filters in ({}, {'status': 'confirmed'}):
+        pages, after = [], None
+        while True:
+            page = index.query(after=after, limit=7, **filters)
+            if not page:
+                break
+            pages.extend(page)
+            after = newest_first_key(page[-1])
+        assert pages == index.query(**filters)
+
+
+def test_put_moves_a_booking_between_indexes():
+    bookings = make_bookings()
+    index = BookingIndex()
+    index.sync(bookings, version=1)
+    booking = dict(bookings[0], status='cancelled')
+    index.put(booking, 0, version=2)
+
+    assert index.get(booking['id']) is booking
+    assert index.position(booking['id']) == 0
+    assert booking in index.query(status='cancelled')
+    assert booking not in index.query(status='pending') + index.query(status='confirmed')
+    assert index.is_current(2)
+
+    created = {'id': 99, 'property_id': 'p9', 'status': 'pending', 'created_at': '2026-10-10T00:00:00'}
+    index.put(created, len(bookings))
+    assert index.query()[0] is created
+    assert index.query(property_id='p9') == [created]
+
+
+def test_sync_replaces_everything_unless_current():
+    index = BookingIndex()
+    index.sync(make_bookings(), version=1)
+    index.sync([], version=1)
+    assert len(index.query()) == 40
+
+    index.sync([], version=2)
+    assert index.query() == []
+    assert index.get(1) is None
+
+
+def test_partner_properties():
+    index = BookingIndex()
+    index.sync_owners({'partner#1': {'new_1', 'new_2'}}, version=3)
+    assert index.partner_properties('partner#1') == {'new_1', 'new_2'}
+    assert index.partner_properties('partner#2') == frozenset()
+    assert index.owners_current(3)
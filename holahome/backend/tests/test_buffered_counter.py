@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from buffered_counter import BufferedCounter
+
+
+def make_counter(flush):
+    # Long interval and a high threshold: only the test triggers flushes
+    return BufferedCounter(flush, interval=3600, max_pending=10**9, name='test')
+
+
+def test_flush_writes_one_batch():
+    batches = []
+    counter = make_counter(batches.append)
+    counter.increment('a')
+    counter.increment('a', 2)
+    counter.increment('b')
+
+    assert counter.pending() == {'a': 3, 'b': 1}
+    assert counter.flush() == 4
+    assert batches == [{'a': 3, 'b': 1}]
+    assert counter.pending() == {}
+    assert counter.flush() == 0
+    assert len(batches) == 1
+
+
+def test_failed_flush_is_merged_back():
+    batches = []
+    failing = [True]
+
+    def flush(batch):
+        if failing[0]:
+            raise OSError('disk full')
+        batches.append(batch)
+
+    counter = make_counter(flush)
+    counter.increment('a', 2)
+    with pytest.raises(OSError):
+        counter.flush()
+    counter.increment('a')
+    counter.increment('b')
+
+    assert counter.pending() == {'a': 3, 'b': 1}
+    assert counter.stats()['failed_flushes'] == 1
+
+    failing[0] = False
+    assert counter.flush() == 4
+    assert batches == [{'a': 3, 'b': 1}]
+
+
+def test_increments_during_a_flush_go_to_the_next_batch():
+    batches = []
+    writing = threading.Event()
+    release = threading.Event()
+
+    def flush(batch):
+        writing.set()
+        release.wait(5)
+        batches.append(batch)
+
+    counter = make_counter(flush)
+    counter.increment('a', 5)
+    flusher = threading.Thread(target=counter.flush)
+    flusher.start()
+    writing.wait(5)
+
+    # The batch being written still counts as not persisted
+    assert counter.increment('a') == 6
+    assert counter.stats()['in_flight_increments'] == 5
+
+    release.set()
+    flusher.join(5)
+    assert batches == [{'a': 5}]
+    assert counter.pending() == {'a': 1}
+
+
+def test_read_consistent_never_counts_a_batch_twice():
+    store = {}
+
+    def flush(batch):
+        for key, delta in batch.items():
+            store[key] = store.get(key, 0) + delta
+
+    counter = make_counter(flush)
+    stop = threading.Event()
+    increments = [0]
+
+    def hammer():
+        while not stop.is_set():
+            counter.increment('a')
+            increments[0] += 1
+
+    def flusher():
+        while not stop.is_set():
+            counter.flush()
+
+    threads = [threading.Thread(target=hammer), threading.Thread(target=flusher)]
+    for thread in threads:
+        thread.start()
+    last = 0
+    try:
+        for _ in range(500):
+            persisted, deltas = counter.read_consistent(lambda: dict(store))
+            total = persisted.get('a', 0) + deltas.get('a', 0)
+            assert total >= last
+            last = total
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+
+    persisted, deltas = counter.read_consistent(lambda: dict(store))
+    assert persisted.get('a', 0) + deltas.get('a', 0) == increments[0]
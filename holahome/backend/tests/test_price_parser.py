@@ -0,0 +1,61 @@
+import pytest
+
+from price_parser import format_price_range, parse_price, with_price_range
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2,800,000 - 3,000,000 VND/tháng', (2_800_000, 3_000_000)),
+    ('<strong>Giá:</strong> 1.500.000 VND/tháng', (1_500_000, 1_500_000)),
+    ('1.5 - 2.5 triệu', (1_500_000, 2_500_000)),
+    ('Từ 2 đến 3 triệu', (2_000_000, 3_000_000)),
+    ('4.5tr', (4_500_000, 4_500_000)),
+    ('2.5', (2_500_000, 2_500_000)),
+    ('3.000.000', (3_000_000, 3_000_000)),
+])
+def test_prices_and_ranges(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('3tr5', (3_500_000, 3_500_000)),
+    ('3tr500', (3_500_000, 3_500_000)),
+    ('3tr5 - 4tr', (3_500_000, 4_000_000)),
+    ('2tỷ3', (2_300_000_000, 2_300_000_000)),
+    ('5k5', (5_500, 5_500)),
+])
+def test_unit_shorthand(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Areas are not prices
+    ('Phòng 25m2, giá 2 triệu', (2_000_000, 2_000_000)),
+    ('25 m² - 2 triệu', (2_000_000, 2_000_000)),
+    ('1 - 2 tr, 30m2', (1_000_000, 2_000_000)),
+    # Only the first price or range counts; its unit does not leak into later numbers
+    ('Giá 3 triệu, cọc 1 tháng', (3_000_000, 3_000_000)),
+    ('3 triệu/tháng, điện 3.5k/số', (3_000_000, 3_000_000)),
+])
+def test_only_the_first_price_counts(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize('value', [None, True, '', 'Liên hệ'])
+def test_no_price(value):
+    assert parse_price(value) == (None, None)
+
+
+def test_numbers_are_taken_as_is():
+    assert parse_price(1_500_000) == (1_500_000, 1_500_000)
+
+
+def test_format_price_range():
+    assert format_price_range(2_800_000, 3_000_000) == '2800000 - 3000000'
+    assert format_price_range(2_800_000, 2_800_000) == '2800000'
+    assert format_price_range(None, None) == '0'
+
+
+def test_price_range_follows_the_price_field():
+    listing = with_price_range({'id': 'a', 'price': '1 - 2 triệu', 'area': 20})
+    assert list(listing) == ['id', 'price', 'price_min', 'price_max', 'area']
+    assert (listing['price_min'], listing['price_max']) == (1_000_000, 2_000_000)
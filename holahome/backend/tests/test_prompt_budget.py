@@ -0,0 +1,55 @@
+from prompt_budget import ELLIPSIS, PromptBudget, clip_text, estimate_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('giá phòng') == 3
+    assert estimate_tokens('giá?') == 3
+
+
+def test_clip_text():
+    text = ' '.join(['phòng'] * 100)
+    clipped = clip_text(text, 20)
+    assert clipped.endswith(ELLIPSIS)
+    assert estimate_tokens(clipped) <= 20
+    assert clip_text('ngắn', 20) == 'ngắn'
+
+
+def test_short_prompts_are_kept_whole():
+    budget = PromptBudget('Bạn là trợ lý HolaHome.', max_tokens=500)
+    history = [{'role': 'user', 'content': 'Chào'}, {'role': 'assistant', 'content': 'Xin chào!'}]
+    prompt = budget.fit('Giá bao nhiêu?', history, '• Phòng A: 2 triệu')
+
+    assert prompt.message == 'Giá bao nhiêu?'
+    assert prompt.context == '• Phòng A: 2 triệu'
+    assert prompt.history == history
+    assert prompt.summary == ''
+
+
+def test_the_question_is_not_repeated_from_history():
+    budget = PromptBudget('system', max_tokens=500)
+    prompt = budget.fit('Giá bao nhiêu?', [{'role': 'user', 'content': 'Giá bao nhiêu?'}])
+    assert prompt.history == []
+
+
+def test_long_conversations_fit_the_budget():
+    budget = PromptBudget('Bạn là trợ lý HolaHome.', max_tokens=300, context_tokens=80,
+                          history_turns=5, turn_tokens=40, summary_tokens=30)
+    history = []
+    for number in range(12):
+        history.append({'role': 'user', 'content': f'Câu hỏi số {number} ' + 'về phòng ' * 20})
+        history.append({'role': 'assistant', 'content': 'Trả lời ' * 30})
+    context = 'Thông tin phòng:\n' + '\n'.join(f'• Phòng {n}: ' + 'tiện nghi ' * 10 for n in range(10))
+
+    prompt = budget.fit('Phòng nào rẻ nhất?', history, context)
+
+    assert prompt.tokens['total'] <= 300
+    # Newest turns are kept, in order; older ones only survive in the summary
+    assert prompt.history == [{'role': t['role'], 'content': clip_text(t['content'], 40)}
+                              for t in history[-len(prompt.history):]]
+    assert len(prompt.history) < 5
+    assert prompt.summary.startswith('Khách đã hỏi')
+    # Whole listing lines are dropped from the end
+    assert prompt.context.split('\n')[:2] == context.split('\n')[:2]
+    assert estimate_tokens(prompt.context) <= 80
+    assert budget.stats()['prompts'] == 1
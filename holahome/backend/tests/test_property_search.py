@@ -0,0 +1,100 @@
+import random
+
+from property_search import PropertyIndex, fold, listing_localities, normalize_locality
+
+
+def make_listings(count=200, seed=3):
+    rng = random.Random(seed)
+    listings = []
+    for number in range(count):
+        price_min = rng.choice([None, rng.randint(1, 10) * 500_000])
+        listings.append({
+            # Ids in data.json are usually strings, but nothing guarantees it
+            'id': number if number % 4 == 0 else f'p{number}',
+            'loai': rng.choice(['Phòng trọ', 'Chung cư mini']),
+            'price_min': price_min,
+            'price_max': None if price_min is None else price_min + rng.randint(0, 4) * 500_000,
+            'area': rng.choice([None, rng.randint(10, 60), f'{rng.randint(10, 60)}.5']),
+            'address': rng.choice(['Thôn 3, Xã Tiến Xuân, Thạch Thất', 'Phường Dịch Vọng, Cầu Giấy']),
+        })
+    return listings
+
+
+def price_overlaps(listing, low, high):
+    if listing['price_min'] is None:
+        return False
+    return (high is None or listing['price_min'] <= high) and (low is None or listing['price_max'] >= low)
+
+
+def area_within(listing, low, high):
+    try:
+        area = float(listing['area'])
+    except TypeError:
+        return False
+    return (low is None or area >= low) and (high is None or area <= high)
+
+
+def test_fold_and_localities():
+    assert fold('Thạch Hoà  ĐÔNG') == 'thach hoa dong'
+    assert normalize_locality('Xã Tiến Xuân') == 'tien xuan'
+    assert normalize_locality('<b>TP. Hà Nội</b>') == 'ha noi'
+    assert listing_localities({'address': 'Thôn 3, Xã Tiến Xuân', 'city': 'Hà Nội'}) == {'tien xuan', 'ha noi'}
+
+
+def test_price_and_area_ranges_match_a_scan():
+    listings = make_listings()
+    index = PropertyIndex()
+    index.sync(listings, version=1)
+    rng = random.Random(5)
+    for _ in range(200):
+        low, high = sorted(rng.sample(range(0, 6_000_001, 250_000), 2))
+        low, high = rng.choice([(low, high), (None, high), (low, None)])
+        assert [l['id'] for l in index.search(price_min=low, price_max=high)] == \
+            [l['id'] for l in listings if price_overlaps(l, low, high)]
+
+        low, high = sorted(rng.sample(range(5, 70), 2))
+        low, high = rng.choice([(low, high), (None, high), (low, None)])
+        assert [l['id'] for l in index.search(area_min=low, area_max=high)] == \
+            [l['id'] for l in listings if area_within(l, low, high)]
+
+
+def test_facets_combine():
+    listings = make_listings()
+    index = PropertyIndex()
+    index.sync(listings, version=1)
+
+    found = index.search(loai='phong tro', localities=['Tiến Xuân'], price_max=2_000_000, keyword='thach that')
+    expected = [l for l in listings if l['loai'] == 'Phòng trọ' and 'Tiến Xuân' in l['address']
+                and price_overlaps(l, None, 2_000_000)]
+    assert found == expected
+
+
+def test_price_sort_keeps_unpriced_last():
+    listings = make_listings()
+    index = PropertyIndex()
+    index.sync(listings, version=1)
+
+    found = index.search(sort='price_desc')
+    prices = [l['price_min'] for l in found]
+    priced = [price for price in prices if price is not None]
+    assert priced == sorted(priced, reverse=True)
+    assert prices[len(priced):] == [None] * (len(prices) - len(priced))
+
+
+def test_sync_reindexes_only_changes():
+    listings = make_listings()
+    index = PropertyIndex()
+    index.sync(listings, version=1)
+
+    changed = [dict(l, views=l.get('views', 0) + 1) for l in listings[50:]]
+    changed[0] = dict(changed[0], price_min=100, price_max=100)
+    before = index.stats()['indexed']
+    index.sync(changed, version=2)
+
+    assert index.stats()['indexed'] == before + 1
+    assert index.stats()['listings'] == len(changed)
+    assert [l['id'] for l in index.search(price_max=100)] == [changed[0]['id']]
+    assert index.search(price_min=0) == [l for l in changed if l['price_min'] is not None]
+
+    index.remove(changed[0]['id'])
+    assert index.search(price_max=100) == []
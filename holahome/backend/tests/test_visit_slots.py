@@ -0,0 +1,72 @@
+import pytest
+
+from visit_slots import VisitSlotIndex, format_visit_time, parse_visit_hours, parse_visit_time
+
+
+def booking(booking_id, time, status='pending', property_id='p1', date='2026-11-01'):
+    return {'id': booking_id, 'property_id': property_id, 'visit_date': date, 'visit_time': time, 'status': status}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('10:00', 600), ('08:05:30', 485), (' 9:30 ', 570),
+    ('24:00', None), ('10:60', None), ('10', None), ('abc', None), (None, None),
+])
+def test_parse_visit_time(value, expected):
+    assert parse_visit_time(value) == expected
+
+
+def test_visit_hours_and_formatting():
+    assert parse_visit_hours('09:00-17:30') == (540, 1050)
+    assert parse_visit_hours('17:00-09:00') == (480, 1200)
+    assert parse_visit_hours('garbage') == (480, 1200)
+    assert format_visit_time(545) == '09:05'
+
+
+def test_overlaps_and_touching_edges():
+    slots = VisitSlotIndex(duration=30)
+    slots.put(booking(1, '10:00'))
+
+    assert slots.conflicts('p1', '2026-11-01', 600) == [1]
+    assert slots.conflicts('p1', '2026-11-01', 615) == [1]
+    assert slots.conflicts('p1', '2026-11-01', 585) == [1]
+    # Back to back visits don't overlap
+    assert slots.conflicts('p1', '2026-11-01', 630) == []
+    assert slots.conflicts('p1', '2026-11-01', 570) == []
+    # An explicit end: [09:00, 12:00) covers the visit
+    assert slots.conflicts('p1', '2026-11-01', 540, 720) == [1]
+
+
+def test_conflicts_are_per_property_and_day():
+    slots = VisitSlotIndex(duration=30)
+    slots.put(booking(1, '10:00'))
+
+    assert slots.conflicts('p2', '2026-11-01', 600) == []
+    assert slots.conflicts('p1', '2026-11-02', 600) == []
+    assert slots.conflicts('p1', '2026-11-01', 600, exclude=1) == []
+
+
+def test_only_active_bookings_hold_a_slot():
+    slots = VisitSlotIndex(duration=30)
+    slots.put(booking(1, '10:00'))
+    slots.put(booking(2, '11:00', status='cancelled'))
+    slots.put(booking(3, 'soon'))
+    assert [interval[2] for interval in slots.booked('p1', '2026-11-01')] == [1]
+
+    # Cancelling frees the slot, moving the visit re-indexes it
+    slots.put(booking(1, '10:00', status='cancelled'))
+    assert slots.conflicts('p1', '2026-11-01', 600) == []
+    slots.put(booking(1, '14:00', status='confirmed'))
+    assert slots.booked('p1', '2026-11-01') == [(840, 870, 1)]
+
+    slots.discard(1)
+    assert slots.booked('p1', '2026-11-01') == []
+    assert slots.stats()['visits'] == 0
+
+
+def test_available_start_times():
+    slots = VisitSlotIndex(duration=30)
+    slots.put(booking(1, '09:00'))
+    slots.put(booking(2, '09:45'))
+
+    # 08:00-11:00 in 15 minute steps; a visit must end by closing time
+    assert slots.available('p1', '2026-11-01', 480, 660, step=15) == [480, 495, 510, 615, 630]
@@ -0,0 +1,79 @@
+"""
+Cache of verified JWTs.
+
+Every authenticated request used to decode and HMAC-check its Bearer token
+again. Once a token has been verified, its user id is remembered here until
+the token's own exp, so later requests with the same token skip the decode.
+Entries are keyed by a sha256 digest of the token (the tokens themselves are
+never kept) and the cache is a bounded LRU.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class TokenCache:
+    """LRU of token digest -> (user_id, exp); expired entries are never returned"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, token):
+        """The cached user id for token, or None if it has to be verified"""
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, exp = entry
+            if exp is not None and exp <= time.time():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id
+
+    def put(self, token, user_id, exp=None):
+        """Remember a verified token until exp (a unix timestamp, None = no expiry)"""
+        if self.max_entries <= 0:
+            return
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = (user_id, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
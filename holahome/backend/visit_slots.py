@@ -0,0 +1,112 @@
+"""
+Viewing slots of bookings, per property and day.
+
+Each (property_id, visit_date) keeps the active visits (pending or confirmed
+bookings) as (start, end, booking_id) intervals in minutes, sorted by start.
+Every visit lasts `duration` minutes, so the visits overlapping [start, end)
+are the ones starting in (start - duration, end): two bisects and a scan of
+just those, instead of every booking of the property.
+"""
+
+import bisect
+import threading
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+
+def parse_visit_time(value):
+    """Minutes after midnight for 'HH:MM' (or 'HH:MM:SS'), or None if invalid"""
+    try:
+        parts = [int(part) for part in str(value).strip().split(':')]
+    except ValueError:
+        return None
+    if len(parts) not in (2, 3) or not 0 <= parts[0] < 24 or not 0 <= parts[1] < 60:
+        return None
+    return parts[0] * 60 + parts[1]
+
+
+def format_visit_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def parse_visit_hours(value, default=(8 * 60, 20 * 60)):
+    """(open, close) minutes from 'HH:MM-HH:MM'; default for a missing / invalid value"""
+    try:
+        start, end = (parse_visit_time(part) for part in str(value).split('-'))
+    except ValueError:
+        return default
+    if start is None or end is None or start >= end:
+        return default
+    return start, end
+
+
+class VisitSlotIndex:
+    """Interval index of active visits by (property_id, visit_date)"""
+
+    def __init__(self, duration=30):
+        self.duration = duration
+        self._lock = threading.RLock()
+        self._days = {}  # (property_id, visit_date) -> sorted [(start, end, booking_id)]
+        self._slots = {}  # booking_id -> ((property_id, visit_date), interval)
+
+        self.checks = 0
+
+    def clear(self):
+        with self._lock:
+            self._days, self._slots = {}, {}
+
+    def put(self, booking):
+        """Index a booking's visit (or drop it when the booking is no longer active)"""
+        with self._lock:
+            self.discard(booking.get('id'))
+            if booking.get('status') not in ACTIVE_STATUSES:
+                return
+            start = parse_visit_time(booking.get('visit_time'))
+            if start is None or not booking.get('visit_date'):
+                return
+            day = (booking.get('property_id'), booking.get('visit_date'))
+            interval = (start, start + self.duration, booking.get('id'))
+            bisect.insort(self._days.setdefault(day, []), interval)
+            self._slots[booking.get('id')] = (day, interval)
+
+    def discard(self, booking_id):
+        with self._lock:
+            indexed = self._slots.pop(booking_id, None)
+            if indexed is None:
+                return
+            day, interval = indexed
+            intervals = self._days[day]
+            del intervals[bisect.bisect_left(intervals, interval)]
+            if not intervals:
+                del self._days[day]
+
+    def conflicts(self, property_id, visit_date, start, end=None, exclude=None):
+        """Ids of active bookings whose visit overlaps [start, end) on that day"""
+        end = start + self.duration if end is None else end
+        with self._lock:
+            self.checks += 1
+            intervals = self._days.get((property_id, visit_date), [])
+            first = bisect.bisect_right(intervals, (start - self.duration, float('inf')))
+            last = bisect.bisect_left(intervals, (end,))
+            return [booking_id for other_start, other_end, booking_id in intervals[first:last]
+                    if other_end > start and booking_id != exclude]
+
+    def booked(self, property_id, visit_date):
+        """(start, end, booking_id) of the day's active visits, by start time"""
+        with self._lock:
+            return list(self._days.get((property_id, visit_date), []))
+
+    def available(self, property_id, visit_date, opens, closes, step=None):
+        """Start times (minutes) between opens and closes where a whole visit fits free"""
+        step = step or self.duration
+        return [start for start in range(opens, closes - self.duration + 1, step)
+                if not self.conflicts(property_id, visit_date, start)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'days': len(self._days),
+                'visits': len(self._slots),
+                'duration_minutes': self.duration,
+                'checks': self.checks
+            }
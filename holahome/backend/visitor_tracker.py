@@ -0,0 +1,378 @@
+"""
+Online visitor tracking.
+
+VisitorTracker keeps the online sessions in a dict (session -> expiry time)
+plus a min-heap of (expiry, session) with one entry per session. A ping only
+moves the session's expiry in the dict; when an entry reaches the top of the
+heap it is either expired (session dropped) or pushed back with the session's
+current expiry. A session is re-pushed at most once per timeout, so expiring
+sessions costs amortized O(log n) per ping instead of a sweep of every
+online session.
+
+SQLitePresence is the same tracker shared by every worker process: online
+sessions are rows of a SQLite table with an expiry time. A session a worker
+hasn't seen yet is looked up (and claimed) in one transaction so a visit is
+counted once across workers; heartbeats of known sessions are buffered and
+written in one batch every flush_interval seconds, which also deletes the
+expired rows.
+
+StatsBroadcast holds the latest visitor counts for the live stream: every
+subscriber blocks on one condition and is woken only when the counts change.
+
+HyperLogLog estimates how many distinct sessions have ever been seen in a
+fixed 2**precision bytes (4 KB, ~1.6% standard error by default), instead of
+a list of every session id.
+"""
+
+import atexit
+import base64
+import hashlib
+import heapq
+import math
+import sqlite3
+import threading
+import time
+
+
+class HyperLogLog:
+    """Distinct count estimate; mergeable, serializable to a base64 string"""
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self._registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self._registers) != self.size:
+            raise ValueError(f'Expected {self.size} registers, got {len(self._registers)}')
+        self._alpha = 0.7213 / (1 + 1.079 / self.size)
+        self._lock = threading.Lock()
+        self._recount()
+
+    def _recount(self):
+        # Running sum of 2^-register and number of empty registers, kept up to date by add()
+        self._inverse_sum = sum(2.0 ** -r for r in self._registers)
+        self._zeros = self._registers.count(0)
+
+    def add(self, item):
+        """Add an item; returns True if the estimate may have changed"""
+        value = int.from_bytes(hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        with self._lock:
+            current = self._registers[index]
+            if rank <= current:
+                return False
+            self._registers[index] = rank
+            self._inverse_sum += 2.0 ** -rank - 2.0 ** -current
+            if current == 0:
+                self._zeros -= 1
+            return True
+
+    def merge(self, other):
+        """Fold another sketch (same precision) into this one"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        with self._lock:
+            self._registers = bytearray(max(a, b) for a, b in zip(self._registers, other._registers))
+            self._recount()
+
+    def count(self):
+        with self._lock:
+            estimate = self._alpha * self.size * self.size / self._inverse_sum
+            if estimate <= 2.5 * self.size and self._zeros:
+                # Small range: linear counting is more accurate
+                estimate = self.size * math.log(self.size / self._zeros)
+            return int(round(estimate))
+
+    def to_string(self):
+        with self._lock:
+            return base64.b64encode(bytes(self._registers)).decode('ascii')
+
+    @classmethod
+    def from_string(cls, text, precision=12):
+        """Sketch saved by to_string(), or an empty one for a missing / unreadable value"""
+        if text:
+            try:
+                registers = base64.b64decode(text)
+                return cls(int(math.log2(len(registers))), registers)
+            except (ValueError, TypeError):
+                pass
+        return cls(precision)
+
+
+class VisitorTracker:
+    """Sessions seen within the last `timeout` seconds"""
+
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self._expires = {}  # session -> monotonic expiry time
+        self._heap = []  # (expiry, session); an entry's expiry may be older than the session's
+        self._queued = set()  # sessions with an entry in the heap (one each, even after a reconnect)
+        self._lock = threading.Lock()
+
+        self.pings = 0
+        self.sessions = 0
+        self.expired = 0
+
+    def _expire(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, session_id = heapq.heappop(heap)
+            expires = self._expires.get(session_id)
+            if expires is None or expires <= now:
+                self._queued.discard(session_id)
+                if expires is not None:
+                    del self._expires[session_id]
+                    self.expired += 1
+            else:
+                heapq.heappush(heap, (expires, session_id))
+
+    def ping(self, session_id):
+        """Mark a session online; returns True if it wasn't online already"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self.pings += 1
+            is_new = session_id not in self._expires
+            self._expires[session_id] = now + self.timeout
+            if is_new:
+                self.sessions += 1
+            if session_id not in self._queued:
+                heapq.heappush(self._heap, (now + self.timeout, session_id))
+                self._queued.add(session_id)
+            return is_new
+
+    def disconnect(self, session_id):
+        # The heap entry is dropped when it reaches the top (or reused if the session comes back)
+        with self._lock:
+            return self._expires.pop(session_id, None) is not None
+
+    def online(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._expires)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'online': len(self._expires),
+                'heap_entries': len(self._heap),
+                'timeout': self.timeout,
+                'pings': self.pings,
+                'sessions': self.sessions,
+                'expired': self.expired
+            }
+
+
+PRESENCE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS presence (
+    session_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_presence_expires ON presence(expires_at);
+"""
+
+
+class SQLitePresence:
+    """Online sessions shared between worker processes (a SQLite table with TTL rows)"""
+
+    def __init__(self, db_path, timeout=30.0, flush_interval=2.0, count_ttl=1.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.count_ttl = count_ttl
+
+        self._local = threading.local()
+        self._known = VisitorTracker(timeout)  # sessions this worker has already claimed
+        self._pending = {}  # session -> expiry, heartbeats not written yet
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._count = None  # (online count, time read)
+
+        self.pings = 0
+        self.lookups = 0
+        self.flushes = 0
+        self.flushed_heartbeats = 0
+        self.expired = 0
+
+        self._connect().executescript(PRESENCE_SCHEMA)
+        atexit.register(self._flush_quietly)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def ping(self, session_id):
+        """Mark a session online; returns True if no worker had it online"""
+        now = time.time()
+        expires = now + self.timeout
+        if not self._known.ping(session_id):
+            with self._lock:
+                self.pings += 1
+                self._pending[session_id] = expires
+            self._maybe_flush(now)
+            return False
+
+        def claim(conn):
+            row = conn.execute('SELECT expires_at FROM presence WHERE session_id = ?', (session_id,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO presence (session_id, expires_at) VALUES (?, ?)', (session_id, expires))
+            return row is None or row[0] <= now
+        is_new = self._write(claim)
+        with self._lock:
+            self.pings += 1
+            self.lookups += 1
+            self._pending.pop(session_id, None)
+            if is_new:
+                self._count = None
+        self._maybe_flush(now)
+        return is_new
+
+    def disconnect(self, session_id):
+        self._known.disconnect(session_id)
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._count = None
+        return self._write(lambda conn: conn.execute(
+            'DELETE FROM presence WHERE session_id = ?', (session_id,)).rowcount > 0)
+
+    def _maybe_flush(self, now):
+        with self._lock:
+            if now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+        self._flush_quietly()
+
+    def flush(self):
+        """Write buffered heartbeats and delete expired rows, in one transaction"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+
+        def write(conn):
+            conn.executemany(
+                'INSERT INTO presence (session_id, expires_at) VALUES (?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET expires_at = max(expires_at, excluded.expires_at)',
+                batch.items())
+            return conn.execute('DELETE FROM presence WHERE expires_at <= ?', (time.time(),)).rowcount
+        try:
+            expired = self._write(write)
+        except Exception:
+            with self._lock:
+                # Keep the heartbeats for the next attempt (newer ones win)
+                for session_id, expires in batch.items():
+                    self._pending[session_id] = max(expires, self._pending.get(session_id, 0))
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.flushed_heartbeats += len(batch)
+            self.expired += expired
+            if expired:
+                self._count = None
+        return len(batch)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f'❌ Could not write visitor heartbeats: {e}')
+
+    def online(self):
+        """Sessions online in every worker (re-read at most every count_ttl seconds)"""
+        now = time.time()
+        self._maybe_flush(now)
+        with self._lock:
+            if self._count is not None and now - self._count[1] < self.count_ttl:
+                return self._count[0]
+        count = self._connect().execute('SELECT COUNT(*) FROM presence WHERE expires_at > ?', (now,)).fetchone()[0]
+        with self._lock:
+            self._count = (count, now)
+        return count
+
+    def stats(self):
+        online = self.online()
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'online': online,
+                'timeout': self.timeout,
+                'pings': self.pings,
+                'lookups': self.lookups,
+                'pending_heartbeats': len(self._pending),
+                'flushes': self.flushes,
+                'flushed_heartbeats': self.flushed_heartbeats,
+                'expired': self.expired
+            }
+
+
+class StatsBroadcast:
+    """Latest value with a version number; subscribers block until the version changes.
+
+    At most max_subscribers may be subscribed at once (None: no limit).
+    """
+
+    def __init__(self, max_subscribers=None):
+        self.max_subscribers = max_subscribers
+        self._condition = threading.Condition()
+        self._value = None
+        self.version = 0
+
+        self.subscribers = 0
+        self.rejected = 0
+        self.published = 0
+        self.changes = 0
+
+    def publish(self, value):
+        """Store value and wake subscribers, unless it equals the current value"""
+        with self._condition:
+            self.published += 1
+            if value == self._value:
+                return False
+            self._value = value
+            self.version += 1
+            self.changes += 1
+            self._condition.notify_all()
+            return True
+
+    def wait(self, version, timeout):
+        """(version, value) as soon as the version differs from `version`, or after timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version, self._value
+
+    def subscribe(self):
+        """False (and no subscription) when max_subscribers are already subscribed"""
+        with self._condition:
+            if self.max_subscribers is not None and self.subscribers >= self.max_subscribers:
+                self.rejected += 1
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'subscribers': self.subscribers,
+                'rejected': self.rejected,
+                'published': self.published,
+                'changes': self.changes
+            }
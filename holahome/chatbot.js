@@ -4,7 +4,7 @@
  */
 
 // Configuration
-const BACKEND_API_URL = 'http://localhost:5000/api/chat';  // Flask backend port 5000
+const BACKEND_STREAM_URL = 'http://localhost:5000/api/chat/stream';  // Flask backend port 5000 (streaming /api/chat)
 const USE_AI_CHATBOT = true; // Set false để dùng FAQ matching cũ
 const ENABLE_ROOM_SUGGESTIONS = true; // Bật gợi ý trọ thông minh
 
@@ -396,12 +396,22 @@ async function sendMessage(message) {
     // Show typing indicator
     const typingId = addTypingIndicator();
     
+    // Bot message filled in while the AI answer streams
+    let streamingMessage = null;
+    
     try {
         let response;
         
         if (USE_AI_CHATBOT) {
-            // Use AI chatbot (Google Gemini)
-            response = await getAIResponse(message);
+            // Use AI chatbot (Google Gemini), showing the answer as it is generated
+            response = await getAIResponse(message, (text) => {
+                if (!streamingMessage) {
+                    removeTypingIndicator(typingId);
+                    streamingMessage = addMessageToChat('', 'bot');
+                }
+                streamingMessage.textContent += text;
+                streamingMessage.parentElement.scrollTop = streamingMessage.parentElement.scrollHeight;
+            });
         } else {
             // Use old FAQ matching
             response = getBotResponse(message);
@@ -412,9 +422,15 @@ async function sendMessage(message) {
         
         // Check if user is asking for room suggestions
         if (response === null && ENABLE_ROOM_SUGGESTIONS) {
+            if (streamingMessage) {
+                streamingMessage.remove();
+            }
             // Display room suggestions
             addMessageToChat('Dưới đây là những trọ/ktx phù hợp với yêu cầu của bạn:', 'bot');
             displayRoomSuggestions(message);
+        } else if (streamingMessage) {
+            // Final text (also replaces a partial answer that fell back to the old chatbot)
+            streamingMessage.textContent = response;
         } else {
             // Display bot response
             addMessageToChat(response, 'bot');
@@ -431,16 +447,22 @@ async function sendMessage(message) {
     } catch (error) {
         console.error('Error getting response:', error);
         removeTypingIndicator(typingId);
+        if (streamingMessage) {
+            streamingMessage.remove();
+        }
         addMessageToChat('Xin lỗi, tôi đang gặp sự cố. Vui lòng thử lại! 🙏', 'bot');
     }
 }
 
 /**
- * Get AI response from backend
+ * Get AI response from backend.
+ * The answer is streamed (Server-Sent Events): onToken receives each piece of text
+ * as it is generated, and the final "done" event carries the full answer or the
+ * needsFallback / needsSuggestion signal.
  */
-async function getAIResponse(message) {
+async function getAIResponse(message, onToken) {
     try {
-        const response = await fetch(BACKEND_API_URL, {
+        const response = await fetch(BACKEND_STREAM_URL, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -455,7 +477,7 @@ async function getAIResponse(message) {
             throw new Error(`API error: ${response.status}`);
         }
         
-        const data = await response.json();
+        const data = await readChatStream(response, onToken);
         
         // Check if Gemini needs fallback to old chatbot
         if (data.needsFallback || data.needsSuggestion) {
@@ -480,6 +502,46 @@ async function getAIResponse(message) {
     }
 }
 
+/**
+ * Read the SSE stream of /api/chat/stream; returns the data of its final "done" event
+ */
+async function readChatStream(response, onToken) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let payload = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) payload += line.slice(5).trim();
+            });
+            
+            const data = payload ? JSON.parse(payload) : {};
+            if (event === 'token' && onToken) {
+                onToken(data.text || '');
+            } else if (event === 'done') {
+                reader.cancel();
+                return data;
+            }
+        }
+        
+        if (done) {
+            throw new Error('Chat stream ended without a result');
+        }
+    }
+}
+
 /**
  * Add typing indicator
  */
@@ -698,6 +760,7 @@ function addMessageToChat(message, type) {
     
     // Scroll to bottom
     chatBody.scrollTop = chatBody.scrollHeight;
+    return messageDiv;
 }
 
 /**
@@ -763,8 +763,28 @@ function getPriceNumber(card) {
 // --- Property Data Loading ---
 let propertyData = [];
 
+// The property list is cached until the catalog changes; view counts come live from their own endpoint
+async function withLiveViews(properties) {
+  try {
+    const response = await fetch(`${API_BASE_URL}/properties/views`);
+    if (response.ok) {
+      const views = await response.json();
+      properties.forEach(item => {
+        if (item.id in views) {
+          item.views = views[item.id];
+          item.view_count = views[item.id];
+        }
+      });
+    }
+  } catch (error) {
+    console.error('Error loading view counts:', error);
+  }
+  return properties;
+}
+
 fetch(`${API_BASE_URL}/properties`)
   .then(res => res.json())
+  .then(withLiveViews)
   .then(data => {
     propertyData = data;
     const container = document.querySelector(".ct");
@@ -1764,6 +1784,10 @@ if (bookingForm) {
         closeBookingModal();
         
         showNotification('✅ Đã gửi yêu cầu đặt lịch hẹn! Chúng tôi sẽ liên hệ với bạn qua email/số điện thoại đã đăng ký.');
+      } else if (result.available_slots) {
+        // Slot already taken: suggest the free times of that day
+        const freeTimes = result.available_slots.length ? result.available_slots.join(', ') : 'không còn giờ trống trong ngày';
+        throw new Error(`${result.error}. Giờ còn trống: ${freeTimes}`);
       } else {
         throw new Error(result.error || 'Có lỗi xảy ra');
       }
@@ -2239,7 +2263,19 @@ function getSessionId() {
   return visitorSessionId;
 }
 
-// Update visitor stats
+// Show visitor stats from the backend
+function renderVisitorStats(data) {
+  const onlineCount = document.getElementById('online-count');
+  const totalVisits = document.getElementById('total-visits');
+  
+  // Add 360,000 to both stats
+  const BONUS_COUNT = 360000;
+  
+  if (onlineCount) onlineCount.textContent = ((data.online || 0) + BONUS_COUNT).toLocaleString('vi-VN');
+  if (totalVisits) totalVisits.textContent = ((data.total || 0) + BONUS_COUNT).toLocaleString('vi-VN');
+}
+
+// Update visitor stats (polling, used when the live stream is unavailable)
 async function updateVisitorStats() {
   const onlineCount = document.getElementById('online-count');
   const totalVisits = document.getElementById('total-visits');
@@ -2253,13 +2289,7 @@ async function updateVisitorStats() {
     });
     
     if (response.ok) {
-      const data = await response.json();
-      
-      // Add 360,000 to both stats
-      const BONUS_COUNT = 360000;
-      
-      if (onlineCount) onlineCount.textContent = ((data.online || 0) + BONUS_COUNT).toLocaleString('vi-VN');
-      if (totalVisits) totalVisits.textContent = ((data.total || 0) + BONUS_COUNT).toLocaleString('vi-VN');
+      renderVisitorStats(await response.json());
     } else {
       // Fallback: Use simulated stats if API fails
       useSimulatedStats(onlineCount, totalVisits);
@@ -2271,6 +2301,40 @@ async function updateVisitorStats() {
   }
 }
 
+let visitorPollTimer = null;
+
+function startVisitorPolling() {
+  if (visitorPollTimer) return;
+  updateVisitorStats();
+  visitorPollTimer = setInterval(updateVisitorStats, 10000);
+}
+
+// Live visitor stats: the server pushes the counts only when they change, and the open
+// stream keeps this tab counted as online (no per-tab polling)
+function connectVisitorStream() {
+  if (!window.EventSource) {
+    startVisitorPolling();
+    return;
+  }
+  
+  const source = new EventSource(`${API_BASE_URL}/visitor/stream?sessionId=${encodeURIComponent(getSessionId())}`);
+  let receivedStats = false;
+  
+  source.addEventListener('stats', (event) => {
+    receivedStats = true;
+    renderVisitorStats(JSON.parse(event.data));
+  });
+  
+  source.onerror = () => {
+    // EventSource reconnects by itself after a stream ends; fall back to polling if the
+    // stream never worked or the server refused it (503 when too many streams are open)
+    if (!receivedStats || source.readyState === EventSource.CLOSED) {
+      source.close();
+      startVisitorPolling();
+    }
+  };
+}
+
 // Simulated stats for demo (when backend is not available)
 function useSimulatedStats(onlineCount, totalVisits) {
   // Base numbers
@@ -2298,11 +2362,8 @@ function useSimulatedStats(onlineCount, totalVisits) {
   if (totalVisits) totalVisits.textContent = currentTotal.toLocaleString('vi-VN');
 }
 
-// Load visitor stats on page load
-updateVisitorStats();
-
-// Update every 10 seconds
-setInterval(updateVisitorStats, 10000);
+// Load visitor stats on page load and keep them live
+connectVisitorStream();
 
 // Send disconnect signal when page unloads
 window.addEventListener('beforeunload', () => {